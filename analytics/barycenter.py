@@ -0,0 +1,134 @@
+import numpy as np
+from hashlib import sha1
+from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics.features import FeatureExtractor
+
+
+class BarycenterService:
+    def __init__(self, max_points=300, band_fraction=0.1, max_iter=10, max_workers=2, max_cached=64):
+        """
+        Computes DTW barycenters of cluster price series off the request thread.
+
+        Full-length DBA is quadratic in T for every series and iteration, so each
+        series is first averaged down to at most max_points segments (the plot
+        can't show more anyway) and the warping path is limited to a Sakoe-Chiba
+        band of band_fraction of that length. Results are kept in an LRU keyed by
+        the caller, e.g. (cluster, average method, date range).
+
+        Parameters
+        ----------
+        max_points : int
+            Length the series are downsampled to.
+        band_fraction : float
+            Sakoe-Chiba radius as a fraction of the downsampled length.
+        max_iter : int
+            DBA iterations, started from the mean curve.
+        max_workers : int
+            Background threads.
+        max_cached : int
+            Number of barycenters kept.
+        """
+        self.max_points = max_points
+        self.band_fraction = band_fraction
+        self.max_iter = max_iter
+        self.max_cached = max_cached
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="barycenter")
+        self._results = OrderedDict()
+        self._pending = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Key from e.g. (cluster, average method, start date, end date, tickers). The
+        tickers are included so a changed cluster never picks up a stale curve.
+        """
+        return sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the (x, y) barycenter for key, or None if it isn't ready.
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        return None
+
+    def is_ready(self, key):
+        return self.get(key) is not None
+
+    def submit(self, key, series):
+        """
+        Schedules the barycenter of series (N x T) unless it is cached or already running.
+        """
+        with self._lock:
+            if key in self._results or key in self._pending:
+                return
+            self._pending[key] = self._executor.submit(self._run, key, np.array(series, dtype=float))
+
+    def get_or_submit(self, key, series):
+        """
+        Returns the barycenter if ready, otherwise schedules it and returns the mean
+        curve at the same resolution as a placeholder.
+
+        Returns
+        -------
+        tuple
+            (x, y, ready), x being positions in the original series.
+        """
+        result = self.get(key)
+        if result is not None:
+            return result[0], result[1], True
+        self.submit(key, series)
+        x, downsampled = self.downsample(np.asarray(series, dtype=float))
+        return x, downsampled.mean(axis=0), False
+
+    def compute(self, series):
+        from tslearn.barycenters import dtw_barycenter_averaging
+        x, downsampled = self.downsample(series)
+        radius = max(int(np.ceil(self.band_fraction * downsampled.shape[1])), 1)
+        barycenter = dtw_barycenter_averaging(
+            downsampled[:, :, None],
+            init_barycenter=downsampled.mean(axis=0)[:, None],
+            max_iter=self.max_iter,
+            metric_params={"global_constraint": "sakoe_chiba", "sakoe_chiba_radius": radius},
+        )
+        return x, np.asarray(barycenter).ravel()
+
+    def downsample(self, series):
+        """
+        Segment means of every series, with the centre of each segment as x.
+        """
+        n_points = series.shape[1]
+        if n_points <= self.max_points:
+            return np.arange(n_points), series
+        edges = np.linspace(0, n_points, self.max_points + 1).round().astype(int)
+        return (edges[:-1] + edges[1:] - 1) / 2, FeatureExtractor.paa(series, self.max_points)
+
+    def _run(self, key, series):
+        try:
+            result = self.compute(series)
+        except Exception as e:
+            # Settle on the mean curve so pollers stop waiting
+            print(f"Barycenter computation failed: {e}")
+            x, downsampled = self.downsample(series)
+            result = (x, downsampled.mean(axis=0))
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_cached:
+                self._results.popitem(last=False)
+            self._pending.pop(key, None)
+
+
+_barycenter_service = None
+
+def get_barycenter_service():
+    global _barycenter_service
+    if _barycenter_service is None:
+        _barycenter_service = BarycenterService()
+    return _barycenter_service
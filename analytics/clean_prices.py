@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+
+
+class PriceCleaner:
+    def __init__(self, nan_threshold=0.2, drop_window=5, fill_method="spline", dtype=np.float64):
+        """
+        Cleans a (dates x tickers) closing price panel before clustering. All steps work
+        on the whole ndarray at once rather than column by column:
+
+        1. Drop tickers with more than nan_threshold of their prices missing.
+        2. Drop dates on which any remaining ticker has been missing for more than
+           drop_window consecutive days.
+        3. Fill the remaining interior gaps, linearly or with a cubic Hermite spline,
+           and carry the first/last price out over leading/trailing gaps.
+        4. Drop duplicated dates.
+
+        Parameters
+        ----------
+        nan_threshold : float
+            Maximum fraction of missing prices for a ticker to be kept.
+        drop_window : int
+            Longest run of missing prices tolerated before the dates are dropped.
+        fill_method : str
+            "linear" or "spline".
+        dtype : numpy dtype
+            np.float32 halves the memory of large panels, np.float64 by default.
+        """
+        if fill_method not in ["linear", "spline"]:
+            raise Exception("Fill method must be linear or spline.")
+        self.nan_threshold = nan_threshold
+        self.drop_window = drop_window
+        self.fill_method = fill_method
+        self.dtype = dtype
+
+    def get_params(self):
+        """
+        Parameters that determine the output, used to key cached panels.
+        """
+        return {
+            "nan_threshold": self.nan_threshold,
+            "drop_window": self.drop_window,
+            "fill_method": self.fill_method,
+            "dtype": np.dtype(self.dtype).name,
+        }
+
+    def clean(self, df):
+        """
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Closing prices indexed by date with one column per ticker.
+
+        Returns
+        -------
+        pd.DataFrame
+            Cleaned prices.
+        pd.DataFrame
+            Per-ticker diagnostics: missing fraction, number of gaps, longest gap,
+            values filled and whether the ticker was dropped.
+        """
+        values, rows, cols, diagnostics = self.clean_array(df.values)
+        cleaned = pd.DataFrame(values, index=df.index[rows], columns=df.columns[cols])
+        diagnostics = pd.DataFrame(diagnostics, index=df.columns)
+        return cleaned, diagnostics
+
+    def clean_array(self, values):
+        """
+        Cleans a (T x N) price array.
+
+        Returns
+        -------
+        np.ndarray
+            Cleaned (T' x N') array.
+        np.ndarray
+            Indices of the kept rows.
+        np.ndarray
+            Indices of the kept columns.
+        dict
+            Diagnostics arrays of length N.
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        missing = np.isnan(values)
+        diagnostics = self._diagnose(missing)
+
+        # Step 1: Remove tickers with too many missing prices
+        cols = self._kept_columns(missing)
+        values, missing = values[:, cols], missing[:, cols]
+
+        # Step 2: Remove dates that sit too deep inside a gap of any ticker
+        rows = np.flatnonzero(self._kept_rows(missing))
+        values, missing = values[rows], missing[rows]
+
+        # Step 3: Fill what's left
+        values = self._fill_gaps(values, missing)
+        diagnostics["filled"][cols] = missing.sum(axis=0)
+        diagnostics["dropped"][cols] = False
+
+        # Step 4: Remove duplicated dates, keeping the first occurrence
+        keep = unique_rows(values)
+        return values[keep], rows[keep], cols, diagnostics
+
+    def clean_appended(self, previous, df):
+        """
+        Cleans a window that starts inside the window previous was cleaned from
+        and ends at or after it, e.g. the same window moved forward by a few days.
+        Only the dates after previous are cleaned, with their gaps filled from
+        the last cleaned prices of previous. The dates previous already holds
+        are reused as they are.
+
+        The result matches clean(df) except around gaps open at either end of
+        previous, which clean fills from the prices on both sides.
+
+        Parameters
+        ----------
+        previous : pd.DataFrame
+            Cleaned prices of the earlier window, as returned by clean.
+        df : pd.DataFrame
+            Raw closing prices of the new window, indexed by date with one column
+            per ticker, the same columns previous was cleaned from.
+
+        Returns
+        -------
+        tuple or None
+            (cleaned, diagnostics) as returned by clean, or None if df has to be
+            cleaned in full: it starts before or ends before previous, or keeps
+            other tickers.
+        """
+        if len(previous) == 0 or len(df) == 0:
+            return None
+        if df.index[0] < previous.index[0] or df.index[-1] < previous.index[-1] or df.index[0] > previous.index[-1]:
+            return None
+        values = np.asarray(df.values, dtype=self.dtype)
+        missing = np.isnan(values)
+        cols = self._kept_columns(missing)
+        if not df.columns[cols].equals(previous.columns):
+            return None
+        held = previous.loc[df.index[0]:]
+        held_rows = df.index.get_indexer(held.index)
+        if (held_rows < 0).any():
+            return None
+        diagnostics = self._diagnose(missing)
+
+        # Steps 2 and 3 on the new dates, behind the last two cleaned rows as seeds
+        seed = np.asarray(previous.values[-2:], dtype=self.dtype)
+        new_rows = np.flatnonzero(df.index > previous.index[-1])
+        block = np.vstack([seed, values[np.ix_(new_rows, cols)]])
+        block_missing = np.isnan(block)
+        kept = self._kept_rows(block_missing)
+        block = self._fill_gaps(block[kept], block_missing[kept])[len(seed):]
+        new_rows = new_rows[kept[len(seed):]]
+
+        # Step 4 over the whole window, the held rows are distinct already
+        values = np.vstack([np.asarray(held.values, dtype=self.dtype), block])
+        rows = np.concatenate([held_rows, new_rows])
+        keep = unique_rows(values)
+        values, rows = values[keep], rows[keep]
+        diagnostics["filled"][cols] = missing[np.ix_(rows, cols)].sum(axis=0)
+        diagnostics["dropped"][cols] = False
+        cleaned = pd.DataFrame(values, index=df.index[rows], columns=df.columns[cols])
+        return cleaned, pd.DataFrame(diagnostics, index=df.columns)
+
+    def _diagnose(self, missing):
+        n_rows, n_cols = missing.shape
+        gap_starts, _, gap_lengths = gap_runs(missing)
+        return {
+            "missing_fraction": missing.sum(axis=0) / max(n_rows, 1),
+            "n_gaps": gap_starts.sum(axis=0),
+            "longest_gap": np.where(missing, gap_lengths, 0).max(axis=0) if n_rows else np.zeros(n_cols, dtype=int),
+            "filled": np.zeros(n_cols, dtype=int),
+            "dropped": np.ones(n_cols, dtype=bool),
+        }
+
+    def _kept_columns(self, missing):
+        n_rows = missing.shape[0]
+        return np.flatnonzero(n_rows - missing.sum(axis=0) >= n_rows * (1 - self.nan_threshold))
+
+    def _kept_rows(self, missing):
+        _, gap_position, _ = gap_runs(missing)
+        return ~(missing & (gap_position >= self.drop_window)).any(axis=1)
+
+    def _fill_gaps(self, values, missing):
+        if self.fill_method == "linear":
+            return fill_linear(values, missing)
+        return fill_spline(values, missing)
+
+
+def gap_runs(missing):
+    """
+    Run-length encoding of the missing values of every column at once.
+
+    Returns
+    -------
+    np.ndarray
+        True where a gap starts.
+    np.ndarray
+        Position of each missing value inside its gap, 0 for the first.
+    np.ndarray
+        Length of the gap each missing value belongs to.
+    """
+    prev_idx, next_idx = _neighbour_indices(missing)
+    rows = np.arange(missing.shape[0])[:, None]
+    starts = missing.copy()
+    starts[1:] &= ~missing[:-1]
+    return starts, rows - prev_idx - 1, next_idx - prev_idx - 1
+
+
+def fill_linear(values, missing=None):
+    """
+    Linear interpolation over interior gaps, with the first and last prices
+    carried out over leading and trailing gaps.
+    """
+    if missing is None:
+        missing = np.isnan(values)
+    prev_idx, next_idx = _neighbour_indices(missing)
+    y0, y1 = _take(values, prev_idx), _take(values, next_idx)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = (np.arange(values.shape[0])[:, None] - prev_idx) / (next_idx - prev_idx)
+        filled = y0 + w * (y1 - y0)
+    return _fill(values, missing, prev_idx, next_idx, filled, y0, y1)
+
+
+def fill_spline(values, missing=None):
+    """
+    Cubic Hermite interpolation over interior gaps. The slope at each end of a gap
+    is the finite difference across that end, so a gap follows the curvature of
+    the prices around it, not just a straight line. Gaps at the edges are
+    handled as in fill_linear.
+    """
+    if missing is None:
+        missing = np.isnan(values)
+    n_rows = values.shape[0]
+    prev_idx, next_idx = _neighbour_indices(missing)
+
+    # Second neighbours: the last valid point before prev, the first valid point after next
+    prev_before = np.vstack([np.full((1, values.shape[1]), -1), prev_idx[:-1]])
+    next_after = np.vstack([next_idx[1:], np.full((1, values.shape[1]), n_rows)])
+    prev2_idx = _take(prev_before, prev_idx, fill=-1).astype(int)
+    next2_idx = _take(next_after, next_idx, fill=n_rows).astype(int)
+    prev2_idx = np.where(prev_idx < 0, -1, prev2_idx)
+    next2_idx = np.where(next_idx >= n_rows, n_rows, next2_idx)
+
+    y0, y1 = _take(values, prev_idx), _take(values, next_idx)
+    y_before, y_after = _take(values, prev2_idx), _take(values, next2_idx)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        h = (next_idx - prev_idx).astype(values.dtype)
+        secant = (y1 - y0) / h
+        m0 = np.where(prev2_idx >= 0, (y1 - y_before) / (next_idx - prev2_idx), secant)
+        m1 = np.where(next2_idx < n_rows, (y_after - y0) / (next2_idx - prev_idx), secant)
+
+        t = (np.arange(n_rows)[:, None] - prev_idx) / h
+        t2, t3 = t * t, t * t * t
+        filled = ((2 * t3 - 3 * t2 + 1) * y0 + (t3 - 2 * t2 + t) * h * m0
+                  + (-2 * t3 + 3 * t2) * y1 + (t3 - t2) * h * m1)
+    return _fill(values, missing, prev_idx, next_idx, filled, y0, y1)
+
+
+def unique_rows(values):
+    """
+    Indices of the first occurrence of every distinct row, in order. Rows are
+    compared as raw bytes so this is a single sort rather than a column-wise
+    comparison.
+    """
+    if values.shape[0] == 0:
+        return np.arange(0)
+    rows = np.ascontiguousarray(values).view(np.dtype((np.void, values.dtype.itemsize * values.shape[1])))
+    _, first = np.unique(rows.ravel(), return_index=True)
+    return np.sort(first)
+
+
+def _neighbour_indices(missing):
+    """
+    For every cell, the row of the last valid value at or before it (-1 if none)
+    and of the first valid value at or after it (T if none).
+    """
+    n_rows = missing.shape[0]
+    rows = np.arange(n_rows)[:, None]
+    prev_idx = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    next_idx = np.minimum.accumulate(np.where(missing, n_rows, rows)[::-1], axis=0)[::-1]
+    return prev_idx, next_idx
+
+
+def _take(values, idx, fill=np.nan):
+    """
+    values[idx[t, j], j], with fill where idx is out of range.
+    """
+    n_rows = values.shape[0]
+    inside = (idx >= 0) & (idx < n_rows)
+    taken = np.take_along_axis(values, np.clip(idx, 0, max(n_rows - 1, 0)), axis=0)
+    return np.where(inside, taken, fill)
+
+
+def _fill(values, missing, prev_idx, next_idx, interior, y0, y1):
+    n_rows = values.shape[0]
+    values = values.copy()
+    interior_gap = missing & (prev_idx >= 0) & (next_idx < n_rows)
+    values[interior_gap] = interior[interior_gap]
+    leading = missing & (prev_idx < 0)
+    values[leading] = y1[leading]
+    trailing = missing & (next_idx >= n_rows)
+    values[trailing] = y0[trailing]
+    return values
@@ -0,0 +1,158 @@
+import numpy as np
+
+
+class ClusterIndex:
+    def __init__(self, tickers, labels, names=None):
+        """
+        Clusters stored as one integer label per ticker rather than lists of names.
+        Members, sizes and pairs come from a single stable argsort of the labels,
+        and pairs are produced per cluster from np.triu_indices only when iterated,
+        so a 500-ticker cluster never holds its 125k tuples in memory.
+
+        Parameters
+        ----------
+        tickers : sequence
+            Ticker names, a ticker's position is its id.
+        labels : array-like
+            Cluster label of every ticker, -1 for tickers in no cluster.
+        names : list, optional
+            Name of every cluster label, "Cluster {label + 1}" by default.
+        """
+        self.tickers = np.asarray(tickers, dtype=object)
+        self.labels = np.asarray(labels, dtype=int)
+        n_clusters = int(self.labels.max()) + 1 if len(self.labels) else 0
+        self.names = list(names) if names is not None else [f"Cluster {label + 1}" for label in range(n_clusters)]
+        self.ids = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        clustered = np.flatnonzero(self.labels >= 0)
+        self._order = clustered[np.argsort(self.labels[clustered], kind="stable")]
+        self._sizes = np.bincount(self.labels[clustered], minlength=len(self.names))
+        self._starts = np.concatenate([[0], np.cumsum(self._sizes)])
+
+    @classmethod
+    def from_dict(cls, store_dict, tickers=None):
+        """
+        From the {cluster name: [tickers]} dictionaries used in ClusterTickers.clusters.
+        A ticker listed under several clusters keeps the last one.
+        """
+        names = list(store_dict.keys())
+        if tickers is None:
+            tickers = list(dict.fromkeys(ticker for members in store_dict.values() for ticker in members))
+        ids = {ticker: i for i, ticker in enumerate(tickers)}
+        labels = np.full(len(tickers), -1)
+        for label, name in enumerate(names):
+            members = [ids[ticker] for ticker in store_dict[name] if ticker in ids]
+            labels[members] = label
+        return cls(tickers, labels, names)
+
+    def to_dict(self):
+        return {name: list(self.tickers[self.members(label)]) for label, name in enumerate(self.names)}
+
+    def sizes(self):
+        return self._sizes
+
+    def members(self, label):
+        """
+        Ticker ids in cluster label, in ticker order.
+        """
+        return self._order[self._starts[label]:self._starts[label + 1]]
+
+    def n_pairs(self):
+        return int((self._sizes * (self._sizes - 1) // 2).sum())
+
+    def filter(self, min_size=2):
+        """
+        Drops clusters with fewer than min_size members, relabelling the rest.
+        """
+        keep = self._sizes >= min_size
+        # The trailing -1 maps unclustered tickers (label -1) to themselves
+        relabel = np.append(np.where(keep, np.cumsum(keep) - 1, -1), -1)
+        labels = relabel[self.labels]
+        return ClusterIndex(self.tickers, labels, [name for name, k in zip(self.names, keep) if k])
+
+    def pair_indices(self, label):
+        """
+        Ticker ids (i, j) of every pair in cluster label, as two arrays.
+        """
+        members = self.members(label)
+        i, j = np.triu_indices(len(members), k=1)
+        return members[i], members[j]
+
+    def iter_pair_indices(self):
+        for label in range(len(self.names)):
+            if self._sizes[label] > 1:
+                yield label, *self.pair_indices(label)
+
+    def pairs(self):
+        return ClusterPairs(self)
+
+    def crosstab(self, other):
+        """
+        Counts of the tickers of every cluster of self (rows) that fall in every
+        cluster of other (columns), over the tickers both indexes cluster.
+
+        Returns
+        -------
+        np.ndarray
+            (n_clusters x other n_clusters) counts.
+        """
+        other_labels = other.labels_of(self.tickers)
+        both = (self.labels >= 0) & (other_labels >= 0)
+        n_a, n_b = len(self.names), len(other.names)
+        flat = np.bincount(self.labels[both] * n_b + other_labels[both], minlength=n_a * n_b)
+        return flat.reshape(n_a, n_b)
+
+    def labels_of(self, tickers):
+        """
+        Label of each of tickers in this index, -1 for tickers it doesn't cluster.
+        """
+        labels = np.full(len(tickers), -1)
+        common = [(i, self.ids[ticker]) for i, ticker in enumerate(tickers) if ticker in self.ids]
+        if common:
+            theirs, mine = np.array(common).T
+            labels[theirs] = self.labels[mine]
+        return labels
+
+    def diff(self, other):
+        """
+        How the clusters changed from self (before) to other (after), comparing
+        cluster names, e.g. between two date windows.
+
+        Returns
+        -------
+        dict
+            "moved": {ticker: (old cluster, new cluster)}, "added": tickers clustered
+            only in other, "removed": tickers clustered only in self.
+        """
+        before = self.labels_of(other.tickers)
+        after = other.labels
+        old_names = np.array(self.names + [None], dtype=object)[before]
+        new_names = np.array(other.names + [None], dtype=object)[after]
+        moved = np.flatnonzero((before >= 0) & (after >= 0) & (old_names != new_names))
+        dropped = (self.labels >= 0) & (other.labels_of(self.tickers) < 0)
+        return {
+            "moved": {other.tickers[i]: (old_names[i], new_names[i]) for i in moved},
+            "added": list(other.tickers[(before < 0) & (after >= 0)]),
+            "removed": list(self.tickers[dropped]),
+        }
+
+
+class ClusterPairs:
+    """
+    The (ticker_1, ticker_2) pairs within every cluster of a ClusterIndex, generated
+    cluster by cluster when iterated. Supports len() so it can stand in for the
+    list of pairs, e.g. in IdentifyCandidates.
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.n_pairs()
+
+    def __iter__(self):
+        tickers = self.index.tickers
+        for _, i, j in self.index.iter_pair_indices():
+            yield from zip(tickers[i], tickers[j])
+
+    def tolist(self):
+        return list(self)
@@ -1,19 +1,31 @@
 import numpy as np
-from minisom import MiniSom
 
-from data_loader.singleton import get_data_fetcher 
+from data_loader.singleton import get_data_fetcher, get_misc_connect, LazyConnector
+from analytics.clean_prices import PriceCleaner
+from analytics.panel_cache import get_panel_cache
+from analytics.som import BatchSOM
+from analytics.features import FeatureExtractor
+from analytics.clustering import hierarchical_correlation_labels, MiniBatchKMeans, dbscan_labels
+from analytics.barycenter import get_barycenter_service
+from analytics.cluster_index import ClusterIndex
+from utils.plotting import add_background_series
 import plotly.graph_objects as go
 
 from collections import defaultdict
-from tslearn.barycenters import dtw_barycenter_averaging
 
-data_fetcher = get_data_fetcher()
+data_fetcher = LazyConnector(get_data_fetcher)
+misc_connect = LazyConnector(get_misc_connect)
 
 class ClusterTickers:
-    def __init__(self, tickers, method, start_date, end_date, serialise=False):
+    # Points the full z-scored series are resampled to for the SOM, so windows of
+    # different lengths map to the same feature space and the map can be fine-tuned
+    FULL_SERIES_LENGTH = 256
+
+    def __init__(self, tickers, method, start_date, end_date, serialise=False, cleaner=None, feature_extractor=None, previous=None):
         """
         Class that automatically identifies candidates for pair trading based on a pool
-        of ticks and a given method in ["Sector", "Industry", "SOM", "Market Cap"].
+        of ticks and a given method in ["Sector", "Industry", "SOM", "Market Cap",
+        "Correlation", "K-Means", "DBSCAN"].
 
         Parameters
         ----------
@@ -21,44 +33,106 @@ class ClusterTickers:
             List of tickers to consider.
         method : str
             Method to use for candidate identification.
+        cleaner : PriceCleaner, optional
+            Cleaning applied to the price panel, defaults to PriceCleaner().
+        feature_extractor : FeatureExtractor, optional
+            Reduces each price series to a short feature vector before clustering,
+            otherwise the full z-scored series are clustered, resampled to
+            FULL_SERIES_LENGTH points for the SOM.
+        previous : ClusterTickers, optional
+            Earlier run with the same method and features, e.g. on the previous date
+            window. self.cluster_changes records how the clusters moved, and the SOM
+            is fine-tuned from its weights instead of trained from scratch when the
+            two windows' features can be aligned, see align_features.
         """
         self.tickers = tickers
+        self.cleaner = cleaner if cleaner is not None else PriceCleaner()
+        self.diagnostics = None
+        self.feature_extractor = feature_extractor
         self.method = method
 
         self.som_x = None
         self.som_y = None
+        self.som_winners = None
         self.win_map = None
 
         self.clusters = None
+        self.cluster_index = None
+        self.som_weights = None
+        self.som_features = None
+        self.cluster_changes = None
+
+        # Keep only what the incremental run needs, not the whole previous object
+        self.previous_som_weights, self.previous_som_features, self.previous_index = None, None, None
+        if previous is not None and previous.method == method and self._feature_params(previous.feature_extractor) == self._feature_params(feature_extractor):
+            self.previous_som_weights, self.previous_index = previous.som_weights, previous.cluster_index
+            self.previous_som_features = previous.som_features
         self.start_date, self.end_date = start_date, end_date
+        self.panel = None
         if not serialise:
             print("Collating data...")
-            
-            df = data_fetcher.collate_dataset(self.tickers, self.start_date, self.end_date).pivot(columns='ticker', values='close')
-            threshold = 0.2
-            df = df.dropna(thresh=len(df) * (1 - threshold), axis=1)
-            # Step 2: Remove rows with more than 5 consecutive NaNs
-            drop_window = 5
-            consecutive_nans = df.isna().rolling(window=drop_window+1, min_periods=drop_window+1).sum().max(axis=1)
-            rows_to_remove = consecutive_nans[consecutive_nans >= drop_window+1].index
-            df = df.drop(rows_to_remove)
-            # Step 3: Interpolate missing values with implicit variance
-            # Using 'polynomial' interpolation as an example; you can choose other methods
-            df = df.interpolate(method='polynomial', order=2)
-            df = df.fillna(method='ffill')
-            df = df.fillna(method='bfill')
-            self.df = df.drop_duplicates()
-            self.df_plot = (self.df - self.df.mean())/self.df.std()
-
+            # Cleaned panels are shared across methods, sessions and workers, see PanelCache
+            self._serialise(self._load_panel())
             print("Data collated.")
 
-    def _serialise(self, df):
+    def __getstate__(self):
+        """
+        Pickled as a clustering job's result, so only the fitted state is kept,
+        with the PanelCache key and the columns of the panel it was fitted on.
+        The panel, the frames derived from it and the win map are read back by
+        that key when unpickled.
+        """
+        state = self.__dict__.copy()
+        for name in ["panel", "df", "df_plot", "diagnostics", "win_map", "previous_som_weights", "previous_som_features", "previous_index"]:
+            state[name] = None
+        state["panel_key"] = self.panel.key if self.panel is not None else None
+        state["panel_columns"] = list(self.panel.columns) if self.panel is not None else None
+        return state
+
+    def __setstate__(self, state):
+        """
+        Raises if the panel the clusters were fitted on is no longer cached, rather
+        than loading and cleaning the prices again, which may have been
+        re-ingested since and would not line up with the fitted clusters.
+        """
+        panel_key, panel_columns = state.pop("panel_key"), state.pop("panel_columns")
+        self.__dict__.update(state)
+        panel = get_panel_cache().get(panel_key) if panel_key is not None else None
+        if panel is None:
+            raise Exception(f"The prices this {self.method} clustering was fitted on are no longer cached.")
+        if list(panel.columns) != panel_columns:
+            raise Exception(f"The cached prices of this {self.method} clustering don't match the tickers it was fitted on.")
+        self._serialise(panel)
+        if self.som_winners is not None:
+            self.win_map = defaultdict(list)
+            for sample, (x, y) in zip(self.df_plot.values.T, self.som_winners):
+                self.win_map[(int(x), int(y))].append(sample)
+
+    def _load_panel(self):
+        # Keyed on the prices version, so re-ingested prices are never served from an older panel
+        version = misc_connect.get_versions("prices")[0]
+        return get_panel_cache().get_or_load(self.tickers, self.start_date, self.end_date, self.cleaner, self._load_prices, version)
+
+    def _load_prices(self, start_date, end_date):
+        return data_fetcher.collate_dataset(self.tickers, start_date, end_date).pivot(columns='ticker', values='close')
+
+    def _serialise(self, panel):
         """
         Avoid repeating data loading when class copying for group by
         on bar plot.
         """
-        self.df = df
-        self.df_plot = (self.df - self.df.mean())/self.df.std()
+        self.panel = panel
+        self.diagnostics = panel.diagnostics
+        self.df = panel.frame()
+        self.df_plot = panel.zscore_frame()
+
+    def get_features(self):
+        """
+        Matrix the SOM runs on, one row per ticker in self.df_plot.columns.
+        """
+        if self.feature_extractor is None:
+            return FeatureExtractor.resample(np.asarray(self.df_plot.values.T, dtype=float), self.FULL_SERIES_LENGTH)
+        return np.asarray(get_panel_cache().get_or_compute_features(self.panel, self.feature_extractor), dtype=float)
 
     def set_dates(self, start_date, end_date):
         self.start_date = start_date
@@ -67,7 +141,7 @@ class ClusterTickers:
     def set_method(self, method):
         self.method = method
 
-    def get_candidates(self):
+    def get_candidates(self, progress=None):
         """
         Get a list of candidate pairs.
      
@@ -77,19 +151,27 @@ class ClusterTickers:
             Start date, only if using SOM method.
         self.end_date : str 
             End date, only if using SOM method.
+        progress : callable, optional
+            Called as progress(done, total) while the SOM trains.
         Returns
         -------
-        list
-            List of candidate pairs.
+        ClusterPairs
+            Candidate pairs, generated lazily from self.cluster_index.
         """
         if self.method == "Sector":
             return self.get_sector_pairs()
         elif self.method == "Industry":
             return self.get_industry_pairs()
         elif self.method == "SOM":
-            return self.get_som_pairs()
+            return self.get_som_pairs(progress)
         elif self.method == "Market Cap":
             return self.get_market_cap_pairs()
+        elif self.method == "Correlation":
+            return self.get_correlation_pairs()
+        elif self.method == "K-Means":
+            return self.get_kmeans_pairs()
+        elif self.method == "DBSCAN":
+            return self.get_dbscan_pairs()
         else:
             raise Exception("Invalid method.")
         
@@ -110,11 +192,7 @@ class ClusterTickers:
         sorted_items = sorted(market_caps.items(), key=lambda x: x[1])
         buckets = [sorted_items[i::10] for i in range(10)]
         store_dict = {f'Size {i + 1}': [item[0] for item in bucket] for i, bucket in enumerate(buckets)}
-        store_dict = self.filter_dict(store_dict)
-
-        self.clusters = store_dict
-
-        return [(store_dict[market_cap][i], store_dict[market_cap][j]) for market_cap in store_dict for i in range(len(store_dict[market_cap])) for j in range(i+1, len(store_dict[market_cap]))]
+        return self.set_clusters(store_dict)
     
     def get_sector_pairs(self):
         """
@@ -122,18 +200,14 @@ class ClusterTickers:
 
         Returns
         -------
-        list
-            List of candidate pairs.
+        ClusterPairs
+            Candidate pairs.
         """
         store_dict = defaultdict(list)
         for ticker in self.tickers:
             sector = data_fetcher.get_ticker_field_info(ticker, "sector")
             store_dict[sector].append(ticker)
-        store_dict = self.filter_dict(store_dict)
-
-        self.clusters = store_dict
-
-        return [(store_dict[sector][i], store_dict[sector][j]) for sector in store_dict for i in range(len(store_dict[sector])) for j in range(i+1, len(store_dict[sector]))]
+        return self.set_clusters(store_dict)
     
     def get_industry_pairs(self):
         """
@@ -141,61 +215,215 @@ class ClusterTickers:
 
         Returns
         -------
-        list
-            List of candidate pairs.
+        ClusterPairs
+            Candidate pairs.
         """
         store_dict = defaultdict(list)
         for ticker in self.tickers:
             industry = data_fetcher.get_ticker_field_info(ticker, "industry")
             store_dict[industry].append(ticker)
-        store_dict = self.filter_dict(store_dict)
-
-        self.clusters = store_dict
-
-        return [(store_dict[industry][i], store_dict[industry][j]) for industry in store_dict for i in range(len(store_dict[industry])) for j in range(i+1, len(store_dict[industry]))]
+        return self.set_clusters(store_dict)
     
-    def get_som_pairs(self):
+    def get_som_pairs(self, progress=None):
         """
         Get pairs from the same self-organising map cluster. We set the number of clusters as the log of the number of data points (around 7).
 
         Returns
         -------
-        list
-            List of candidate pairs.
+        ClusterPairs
+            Candidate pairs.
         """
         
-        df = self.df.copy()
-        normalized_df = (df - df.mean()) / df.std()
+        # Z-scored prices come precomputed with the cached panel
+        normalized_df = self.df_plot
 
-        X_ = normalized_df.values.T
+        X_ = self.get_features()
         som_x, som_y = max(int(np.sqrt(np.sqrt(len(X_))))-1, 3), max(int(np.sqrt(np.sqrt(len(X_))))-1, 3)
-        som = MiniSom(som_x, som_y, X_.shape[1], sigma=.3, learning_rate=0.1, 
-                      neighborhood_function='gaussian', random_seed=10)
-        som.pca_weights_init(X_)
-        print("Training...")
-        som.train_batch(X_, 50000, verbose=True)  # random training
+        rotation = None
+        if self.previous_som_weights is not None and self.previous_som_weights.shape == (som_x, som_y, X_.shape[1]):
+            # Resampled full series line up by date already, extracted features, e.g. PCA, only up to a rotation
+            rotation = self.align_features(X_, normalized_df.columns, self.previous_som_features,
+                                           rotate=self.feature_extractor is not None)
+        if rotation is not None:
+            # Window moved: fine-tune the previous map, in its coordinates, with its final, narrow neighbourhood
+            X_ = X_ @ rotation
+            som = BatchSOM(som_x, som_y, X_.shape[1], sigma=.3, sigma_end=.3, max_epochs=10, random_seed=10)
+            som.set_weights(self.previous_som_weights)
+            print("Fine-tuning previous map...")
+        else:
+            som = BatchSOM(som_x, som_y, X_.shape[1], sigma_end=.3, random_seed=10)
+            som.pca_weights_init(X_)
+            print("Training...")
+        som.train(X_, verbose=True, progress=progress)  # batch training with early stopping
         print("\n...ready!")
+        self.som_weights = som.get_weights()
+        self.som_features = (list(normalized_df.columns), X_.astype(np.float32))
 
+        # Best-matching units of every ticker from a single distance-matrix call
+        winners = som.winners(X_)
         store_dict = defaultdict(list)
-        for idx, column in enumerate(normalized_df.columns):
-            winner_node = som.winner(X_[idx])
-            store_dict["Cluster " + str(winner_node[0]*som_y+winner_node[1]+1)].append(column)
-        store_dict = self.filter_dict(store_dict)
+        for column, (x, y) in zip(normalized_df.columns, winners):
+            store_dict["Cluster " + str(x*som_y+y+1)].append(column)
         self.som_x = som_x
         self.som_y = som_y
-        self.win_map = som.win_map(X_)
-        self.clusters = store_dict
+        self.som_winners = winners
+        # Plots show the z-scored prices, whatever the SOM was trained on
+        self.win_map = som.win_map(normalized_df.values.T, winners)
         print("Clusters identified.")
-        return [(store_dict[cluster][i], store_dict[cluster][j]) for cluster in store_dict for i in range(len(store_dict[cluster])) for j in range(i+1, len(store_dict[cluster]))]
+        return self.set_clusters(store_dict)
         
+    def get_correlation_pairs(self, min_correlation=0.5):
+        """
+        Get pairs from the same cluster of a hierarchical clustering on the correlation
+        of daily log returns, cut where the average correlation drops below min_correlation.
+
+        Returns
+        -------
+        ClusterPairs
+            Candidate pairs.
+        """
+        returns = np.diff(np.log(np.maximum(np.asarray(self.df.values, dtype=float), 1e-12)), axis=0)
+        labels = hierarchical_correlation_labels(returns, min_correlation=min_correlation)
+        return self.get_label_pairs(labels)
+
+    def get_kmeans_pairs(self, n_clusters=None):
+        """
+        Get pairs from the same mini-batch k-means cluster of the reduced features.
+        The number of clusters defaults to sqrt(N / 2).
+
+        Returns
+        -------
+        ClusterPairs
+            Candidate pairs.
+        """
+        X_ = self.get_reduced_features()
+        if n_clusters is None:
+            n_clusters = max(int(np.sqrt(len(X_) / 2)), 2)
+        labels = MiniBatchKMeans(n_clusters, random_seed=10).fit_predict(X_)
+        return self.get_label_pairs(labels)
+
+    def get_dbscan_pairs(self, min_samples=5):
+        """
+        Get pairs from the same density-based (DBSCAN) cluster of the reduced features.
+        Tickers in sparse regions are left out as noise.
+
+        Returns
+        -------
+        ClusterPairs
+            Candidate pairs.
+        """
+        X_ = self.get_reduced_features()
+        std = X_.std(axis=0)
+        labels = dbscan_labels((X_ - X_.mean(axis=0)) / np.where(std > 0, std, 1.0), min_samples=min_samples)
+        return self.get_label_pairs(labels)
+
+    def get_reduced_features(self):
+        """
+        Features for the k-means and density methods, PCA features if no extractor was given.
+        """
+        extractor = self.feature_extractor if self.feature_extractor is not None else FeatureExtractor("pca")
+        return np.asarray(get_panel_cache().get_or_compute_features(self.panel, extractor), dtype=float)
+
+    def get_label_pairs(self, labels):
+        """
+        Sets the clusters from a cluster label per ticker in self.df.columns (-1 for
+        unclustered) and returns the pairs within each cluster.
+        """
+        self.cluster_index = ClusterIndex(self.df.columns, labels).filter(min_size=2)
+        self.clusters = self.cluster_index.to_dict()
+        print("Clusters identified.")
+        self.diff_previous()
+        return self.cluster_index.pairs()
+
+    def set_clusters(self, store_dict):
+        """
+        Sets self.clusters and self.cluster_index from a {cluster: [tickers]} dictionary,
+        dropping clusters with fewer than two tickers.
+
+        Returns
+        -------
+        ClusterPairs
+            Lazily generated candidate pairs within each cluster.
+        """
+        self.clusters = self.filter_dict(store_dict)
+        self.cluster_index = ClusterIndex.from_dict(self.clusters)
+        self.diff_previous()
+        return self.cluster_index.pairs()
+
+    def diff_previous(self):
+        """
+        Sets self.cluster_changes against the previous run, if one was given.
+        """
+        if self.previous_index is None:
+            return None
+        self.cluster_changes = self.previous_index.diff(self.cluster_index)
+        print(f"{len(self.cluster_changes['moved'])} tickers changed cluster, "
+              f"{len(self.cluster_changes['added'])} added, {len(self.cluster_changes['removed'])} removed.")
+        return self.cluster_changes
+
+    @staticmethod
+    def align_features(features, tickers, previous, max_error=0.25, rotate=True):
+        """
+        Orthogonal map of features onto the previous run's features of the same
+        tickers (orthogonal Procrustes). Each window fits its own PCA basis, whose
+        components can flip sign or swap order between windows; an orthogonal
+        map undoes that without changing the distances between tickers, so the
+        clusters are unaffected. Features whose coordinates already mean the same
+        in both windows, e.g. resampled series, are only checked, not rotated.
+
+        Parameters
+        ----------
+        features : np.ndarray
+            (N x d) features of this run, one row per ticker.
+        tickers : list
+            Ticker of every row.
+        previous : tuple or None
+            (tickers, features) of the previous run.
+        max_error : float
+            Largest relative residual ||features @ R - previous|| / ||previous||
+            over the common tickers for the feature spaces to count as aligned.
+        rotate : bool
+            Fit R, otherwise R is the identity.
+
+        Returns
+        -------
+        np.ndarray or None
+            (d x d) rotation, None if the previous map can't be reused.
+        """
+        if previous is None:
+            return None
+        previous_tickers, previous_features = previous
+        if previous_features.shape[1] != features.shape[1]:
+            return None
+        rows = {ticker: i for i, ticker in enumerate(previous_tickers)}
+        common = [(i, rows[ticker]) for i, ticker in enumerate(tickers) if ticker in rows]
+        # Too few common tickers and any two feature sets can be rotated onto each other
+        if len(common) < (2 * features.shape[1] if rotate else 2):
+            return None
+        current, target = np.asarray(common).T
+        a, b = np.asarray(features[current], dtype=float), np.asarray(previous_features[target], dtype=float)
+        if rotate:
+            u, _, vt = np.linalg.svd(a.T @ b)
+            rotation = u @ vt
+        else:
+            rotation = np.eye(features.shape[1])
+        error = np.linalg.norm(a @ rotation - b) / max(np.linalg.norm(b), 1e-12)
+        if error > max_error:
+            print(f"Features moved too much to fine-tune the previous map (residual {error:.2f}), training from scratch.")
+            return None
+        return rotation
+
+    @staticmethod
+    def _feature_params(feature_extractor):
+        return feature_extractor.get_params() if feature_extractor is not None else None
+
     def plot_som_clusters(self, method):
         fig = go.Figure()
         for x in range(self.som_x):
             for y in range(self.som_y):
                 cluster = (x, y)
                 if cluster in self.win_map.keys():
-                    for series in self.win_map[cluster]:
-                        fig.add_trace(go.Scatter(y=series, line=dict(color='gray', width=0.5)))
+                    add_background_series(fig, np.vstack(self.win_map[cluster]))
                     fig.add_trace(go.Scatter(y=method(np.vstack(self.win_map[cluster]), axis=0), line=dict(color='red'), showlegend=False))
         fig.update_layout(title='Clusters')
         return fig
@@ -203,14 +431,33 @@ class ClusterTickers:
     
     def plot_clusters(self, method, cluster):
         fig = go.Figure()
-        df = self.df_plot.copy()
+        df = self.df_plot
         columns = [series for series in self.clusters[cluster] if series in df.columns]
-        showlegend = False
-        for series in columns:
-            fig.add_trace(go.Scatter(y=df[series].values, name=series, line=dict(color='gray', width=0.5), showlegend=showlegend))
+        add_background_series(fig, df[columns].values.T, names=columns)
         fig.add_trace(go.Scatter(y=method(df[columns].values.T).squeeze(), line=dict(color='red'), name="Average"))
         return fig
 
+    def plot_barycenter_cluster(self, cluster):
+        """
+        Plots the cluster with its DTW barycenter. The barycenter is computed in the
+        background; until it is ready the mean curve is drawn in its place and
+        barycenter_ready(cluster) is False.
+        """
+        fig = go.Figure()
+        df = self.df_plot
+        columns = [series for series in self.clusters[cluster] if series in df.columns]
+        add_background_series(fig, df[columns].values.T, names=columns)
+        x, y, ready = get_barycenter_service().get_or_submit(self.barycenter_key(cluster), df[columns].values.T)
+        fig.add_trace(go.Scatter(x=x, y=y, line=dict(color='red'), name="Barycenter" if ready else "Average (barycenter pending)"))
+        return fig
+
+    def barycenter_key(self, cluster):
+        columns = tuple(series for series in self.clusters[cluster] if series in self.df_plot.columns)
+        return get_barycenter_service().make_key(cluster, "Barycenters", self.start_date, self.end_date, columns)
+
+    def barycenter_ready(self, cluster):
+        return get_barycenter_service().is_ready(self.barycenter_key(cluster))
+
     
     
     def plot_som_bar(self):
@@ -238,7 +485,7 @@ class ClusterTickers:
             raise Exception("We require a cluster to plot")
 
         if avg_method == "Barycenters":
-            return self.plot_clusters(dtw_barycenter_averaging, cluster)
+            return self.plot_barycenter_cluster(cluster)
         elif avg_method == "Mean":
             return self.plot_clusters(self.average_axis_0, cluster)
         
@@ -248,35 +495,18 @@ class ClusterTickers:
             raise Exception("Please run get_candidates first.")
         if cluster_2 is not None:
             fig = go.Figure()
-            a = self.clusters
-            b = cluster_2
-            # Calculate the counts for each segment in the bars
-            a_keys = list(a.keys())
-            b_values = []
-            
-            total_values = [sum(len(b[key]) for key in b.keys() if ticker in b[key]) for tickers in a.values() for ticker in tickers]
+            a = self.cluster_index if self.cluster_index is not None else ClusterIndex.from_dict(self.clusters)
+            b = ClusterIndex.from_dict(cluster_2)
+            # Tickers of every cluster of a (rows) falling in every cluster of b (columns)
+            counts = a.crosstab(b)
 
-            # Sort keys and values by total_values in descending order
-            sorted_keys = [key for _, key in sorted(zip(total_values, a.keys()))]
-            
-            # Create a mapping of tickers to their corresponding keys in b
-            ticker_to_b_key = {ticker: key for key, tickers in b.items() for ticker in tickers}
-            
-            # Calculate the counts for each segment in the bars
-            a_keys = list(a.keys())
-            b_values = {key: [0] * len(a_keys) for key in b.keys()}
-            for i, cluster_key in enumerate(a_keys):
-                for ticker in a[cluster_key]:
-                    b_cluster_key = ticker_to_b_key[ticker]
-                    b_values[b_cluster_key][i] += 1
-            
             # Sort clusters by total size
-            sorted_clusters = sorted(a_keys, key=lambda cluster: -sum(b_values[key][i] for key in b.keys()))
-            
+            order = np.argsort(-counts.sum(axis=1), kind="stable")
+            sorted_clusters = [a.names[i] for i in order]
+
             # Add the traces for each segment
-            for b_cluster_key, values in b_values.items():
-                sorted_values = [values[a_keys.index(cluster)] for cluster in sorted_clusters]
-                fig.add_trace(go.Bar(x=sorted_clusters, y=sorted_values, name=f'{b_cluster_key}',
+            for k, b_cluster_key in enumerate(b.names):
+                fig.add_trace(go.Bar(x=sorted_clusters, y=counts[order, k], name=f'{b_cluster_key}',
                                      hovertemplate=f'<b>Cluster:</b> %{{x}}<br><b>Value:</b> %{{y}}'))
             
             # Update layout
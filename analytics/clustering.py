@@ -0,0 +1,203 @@
+import numpy as np
+
+
+def chunked_sq_distances(data, centres=None, chunk_size=1024):
+    """
+    Squared euclidean distances between the rows of data and the rows of centres
+    (data itself by default), from ||a||^2 - 2 a.b + ||b||^2, one block of
+    chunk_size rows at a time so memory stays at O(chunk_size x M).
+
+    Yields
+    ------
+    int, np.ndarray
+        Start row of the block and its (chunk x M) distances.
+    """
+    centres = data if centres is None else centres
+    c_sq = (centres ** 2).sum(axis=1)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        sq_dists = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ centres.T + c_sq[None, :]
+        yield start, np.maximum(sq_dists, 0)
+
+
+def nearest_centres(data, centres, chunk_size=1024):
+    """
+    Index of the closest centre for every row of data and its squared distance.
+    """
+    labels = np.empty(len(data), dtype=int)
+    best = np.empty(len(data))
+    for start, sq_dists in chunked_sq_distances(data, centres, chunk_size):
+        labels[start:start + len(sq_dists)] = sq_dists.argmin(axis=1)
+        best[start:start + len(sq_dists)] = sq_dists.min(axis=1)
+    return labels, best
+
+
+def correlation_distances(returns, chunk_size=1024):
+    """
+    Condensed correlation distance sqrt(2 (1 - rho)) between the columns of a
+    (T x N) returns matrix, in the layout scipy's linkage expects. The correlation
+    matrix is built in blocks of rows, so the full N x N matrix is never held.
+    """
+    returns = np.asarray(returns, dtype=float)
+    std = returns.std(axis=0, ddof=1)
+    z = (returns - returns.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    z /= np.sqrt(max(len(z) - 1, 1))
+    n = z.shape[1]
+    condensed = np.empty(n * (n - 1) // 2)
+    offset = 0
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        corr = z[:, start:stop].T @ z
+        # Entries above the diagonal of consecutive rows are contiguous in condensed form
+        upper = np.arange(n)[None, :] > np.arange(start, stop)[:, None]
+        block = np.sqrt(np.clip(2 * (1 - corr[upper]), 0, 4))
+        condensed[offset:offset + len(block)] = block
+        offset += len(block)
+    return condensed
+
+
+def hierarchical_correlation_labels(returns, min_correlation=0.5, method="average", chunk_size=1024):
+    """
+    Agglomerative clustering of the columns of a (T x N) returns matrix on
+    correlation distance. The dendrogram is cut where the linkage distance
+    corresponds to min_correlation, so every cluster is a group of tickers that
+    moved together over the period.
+
+    Returns
+    -------
+    np.ndarray
+        Cluster label of every column, starting at 0.
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+    if returns.shape[1] < 2:
+        return np.zeros(returns.shape[1], dtype=int)
+    tree = linkage(correlation_distances(returns, chunk_size), method=method)
+    max_distance = np.sqrt(2 * (1 - min_correlation))
+    return fcluster(tree, t=max_distance, criterion="distance") - 1
+
+
+class MiniBatchKMeans:
+    def __init__(self, n_clusters, batch_size=256, max_iter=100, tol=1e-4, random_seed=10, chunk_size=1024):
+        """
+        K-means fitted on random mini-batches (Sculley, 2010). Each step assigns a
+        batch to its nearest centres and moves every centre towards the mean of its
+        batch points with a learning rate of 1 / (points seen so far), so a step
+        costs O(batch_size x n_clusters) regardless of the number of tickers.
+
+        Parameters
+        ----------
+        n_clusters : int
+            Number of clusters.
+        batch_size : int
+            Samples per step.
+        max_iter : int
+            Maximum number of steps.
+        tol : float
+            Largest centre movement, relative to the mean centre norm, counted as converged.
+        random_seed : int
+            Seed for the initialisation and the batches.
+        chunk_size : int
+            Rows per block when assigning the full dataset.
+        """
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.chunk_size = chunk_size
+        self.centres = None
+        self.n_iter = 0
+        self._rng = np.random.default_rng(random_seed)
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=float)
+        n_clusters = min(self.n_clusters, len(data))
+        self.centres = self._init_centres(data, n_clusters)
+        counts = np.zeros(n_clusters)
+        for step in range(self.max_iter):
+            batch = data[self._rng.choice(len(data), size=min(self.batch_size, len(data)), replace=False)]
+            labels, _ = nearest_centres(batch, self.centres, self.chunk_size)
+            batch_counts = np.bincount(labels, minlength=n_clusters)
+            batch_sums = np.zeros_like(self.centres)
+            np.add.at(batch_sums, labels, batch)
+
+            counts += batch_counts
+            hit = batch_counts > 0
+            new_centres = self.centres.copy()
+            new_centres[hit] += (batch_sums[hit] - batch_counts[hit, None] * self.centres[hit]) / counts[hit, None]
+
+            shift = np.abs(new_centres - self.centres).max() / max(np.linalg.norm(self.centres, axis=1).mean(), 1e-12)
+            self.centres = new_centres
+            self.n_iter = step + 1
+            if shift < self.tol:
+                break
+        return self
+
+    def predict(self, data):
+        labels, _ = nearest_centres(np.asarray(data, dtype=float), self.centres, self.chunk_size)
+        return labels
+
+    def fit_predict(self, data):
+        return self.fit(data).predict(data)
+
+    def _init_centres(self, data, n_clusters, sample_size=10000):
+        """
+        k-means++ seeding on a random sample of at most sample_size rows.
+        """
+        sample = data[self._rng.choice(len(data), size=min(sample_size, len(data)), replace=False)]
+        centres = [sample[self._rng.integers(len(sample))]]
+        closest = ((sample - centres[0]) ** 2).sum(axis=1)
+        for _ in range(1, n_clusters):
+            total = closest.sum()
+            idx = self._rng.choice(len(sample), p=closest / total) if total > 0 else self._rng.integers(len(sample))
+            centres.append(sample[idx])
+            closest = np.minimum(closest, ((sample - sample[idx]) ** 2).sum(axis=1))
+        return np.array(centres)
+
+
+def dbscan_labels(data, eps=None, min_samples=5, eps_quantile=0.5, chunk_size=1024):
+    """
+    Density-based clustering (DBSCAN). Points with at least min_samples neighbours
+    within eps are core points, core points within eps of each other share a
+    cluster and the remaining points join a neighbouring cluster or are left as
+    noise. The neighbourhoods are found block by block and the clusters are the
+    connected components of the sparse core-point graph.
+
+    When eps is not given it is set OPTICS-style from the data: the eps_quantile
+    quantile of every point's distance to its min_samples-th nearest neighbour.
+
+    Returns
+    -------
+    np.ndarray
+        Cluster label of every row, -1 for noise.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    data = np.asarray(data, dtype=float)
+    n = len(data)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    k = min(min_samples, n) - 1
+    if eps is None:
+        k_dists = np.concatenate([np.partition(sq_dists, k, axis=1)[:, k] for _, sq_dists in chunked_sq_distances(data, chunk_size=chunk_size)])
+        eps = np.sqrt(np.quantile(k_dists, eps_quantile))
+
+    rows, cols = [], []
+    for start, sq_dists in chunked_sq_distances(data, chunk_size=chunk_size):
+        r, c = np.nonzero(sq_dists <= eps ** 2)
+        rows.append(r + start)
+        cols.append(c)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+    # Neighbour counts include the point itself, as in the usual definition
+    core = np.bincount(rows, minlength=n) >= min_samples
+    labels = np.full(n, -1)
+    core_edges = core[rows] & core[cols]
+    graph = coo_matrix((np.ones(core_edges.sum()), (rows[core_edges], cols[core_edges])), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+    _, core_labels = np.unique(components[core], return_inverse=True)
+    labels[core] = core_labels
+
+    # Border points take the cluster of a core neighbour
+    border_edges = ~core[rows] & core[cols]
+    labels[rows[border_edges]] = labels[cols[border_edges]]
+    return labels
@@ -0,0 +1,138 @@
+import numpy as np
+from statistics import NormalDist
+
+
+class FeatureExtractor:
+    def __init__(self, method="pca", n_components=20, random_seed=10):
+        """
+        Reduces each ticker's price history of length T to a short feature vector
+        before clustering, so distance computations cost O(n_components) rather
+        than O(T).
+
+        Methods
+        -------
+        "pca": Truncated PCA of the standardised daily log returns, computed with a
+            randomized SVD. Tickers driven by the same factors land close together.
+        "paa": Piecewise aggregate approximation, the mean z-scored price over
+            n_components equal segments of the period.
+        "sax": PAA discretised into 8 equiprobable Gaussian levels.
+        "returns": Log return over each of n_components equal segments, standardised
+            per ticker.
+
+        Parameters
+        ----------
+        method : str
+            One of "pca", "paa", "sax" or "returns".
+        n_components : int
+            Length of the feature vectors.
+        random_seed : int
+            Seed for the randomized SVD.
+        """
+        if method not in ["pca", "paa", "sax", "returns"]:
+            raise Exception("Invalid feature extraction method.")
+        self.method = method
+        self.n_components = n_components
+        self.random_seed = random_seed
+
+    def get_params(self):
+        """
+        Parameters that determine the output, used to key cached features.
+        """
+        return {"method": self.method, "n_components": self.n_components, "random_seed": self.random_seed}
+
+    def transform(self, prices):
+        """
+        Parameters
+        ----------
+        prices : np.ndarray
+            (T x N) cleaned prices, one column per ticker.
+
+        Returns
+        -------
+        np.ndarray
+            (N x n_components) features, one row per ticker.
+        """
+        prices = np.asarray(prices, dtype=float)
+        if self.method == "pca":
+            return self.pca_features(prices)
+        elif self.method == "paa":
+            return self.paa(zscore(prices, axis=0).T, self.n_components)
+        elif self.method == "sax":
+            return self.sax(zscore(prices, axis=0).T, self.n_components)
+        elif self.method == "returns":
+            return self.segment_returns(prices)
+
+    def pca_features(self, prices):
+        log_prices = np.log(np.maximum(prices, 1e-12))
+        returns = zscore(np.diff(log_prices, axis=0), axis=0).T
+        u, s, _ = randomized_svd(returns, self.n_components, random_seed=self.random_seed)
+        return u * s
+
+    def segment_returns(self, prices):
+        log_prices = np.log(np.maximum(prices, 1e-12))
+        edges = np.linspace(0, len(prices) - 1, min(self.n_components, len(prices) - 1) + 1).round().astype(int)
+        return zscore((log_prices[edges[1:]] - log_prices[edges[:-1]]).T, axis=1)
+
+    @staticmethod
+    def paa(series, n_segments):
+        """
+        Mean of each of n_segments equal segments of every row of series (N x T).
+        """
+        n_segments = min(n_segments, series.shape[1])
+        edges = np.linspace(0, series.shape[1], n_segments + 1).round().astype(int)
+        sums = np.add.reduceat(series, edges[:-1], axis=1)
+        return sums / np.diff(edges)[None, :]
+
+    @classmethod
+    def resample(cls, series, length):
+        """
+        Every row of series (N x T) at exactly length points, the PAA of each row if
+        T >= length, otherwise linearly interpolated.
+        """
+        n_points = series.shape[1]
+        if n_points >= length:
+            return cls.paa(series, length)
+        positions = np.linspace(0, n_points - 1, length)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, n_points - 1)
+        weight = positions - lower
+        return series[:, lower] * (1 - weight) + series[:, upper] * weight
+
+    @classmethod
+    def sax(cls, series, n_segments, alphabet_size=8):
+        breakpoints = [NormalDist().inv_cdf(q) for q in np.linspace(0, 1, alphabet_size + 1)[1:-1]]
+        return np.digitize(cls.paa(series, n_segments), breakpoints).astype(float)
+
+
+def zscore(values, axis=0):
+    std = values.std(axis=axis, ddof=1, keepdims=True)
+    return (values - values.mean(axis=axis, keepdims=True)) / np.where(std > 0, std, 1.0)
+
+
+def randomized_svd(matrix, n_components, n_oversamples=10, n_iter=4, random_seed=10):
+    """
+    Truncated SVD by random projection (Halko, Martinsson & Tropp, 2011). Costs a few
+    products with an (N x n_components + n_oversamples) matrix instead of a full SVD.
+
+    Returns
+    -------
+    u, s, vt
+        The leading n_components singular vectors and values.
+    """
+    rng = np.random.default_rng(random_seed)
+    n_components = min(n_components, *matrix.shape)
+    n_random = min(n_components + n_oversamples, *matrix.shape)
+    q = matrix @ rng.normal(size=(matrix.shape[1], n_random))
+    for _ in range(n_iter):
+        # Power iterations, re-orthonormalised to keep the small singular values accurate
+        q, _ = np.linalg.qr(q)
+        q, _ = np.linalg.qr(matrix.T @ q)
+        q = matrix @ q
+    q, _ = np.linalg.qr(q)
+    u_small, s, vt = np.linalg.svd(q.T @ matrix, full_matrices=False)
+    u, s, vt = (q @ u_small)[:, :n_components], s[:n_components], vt[:n_components]
+    # Fix the sign of each component (largest entry positive) so that features of
+    # overlapping windows line up, e.g. when a SOM is fine-tuned on a moved window
+    signs = np.sign(u[np.abs(u).argmax(axis=0), np.arange(u.shape[1])])
+    signs[signs == 0] = 1
+    return u * signs, s, vt * signs[:, None]
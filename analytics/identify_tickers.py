@@ -1,3 +1,5 @@
+import numpy as np
+
 from analytics.time_series import TimeSeries
 from analytics.regression import CointegrationTest
 from tqdm import tqdm
@@ -20,8 +22,15 @@ class IdentifyCandidates:
         self.coint_cutoff = coint_cutoff
 
 
-    def iterate_tickers(self):
-        for ticker_1, ticker_2 in tqdm(self.ticker_pairs):
+    def iterate_tickers(self, progress=None):
+        """
+        Scores every pair. progress, if given, is called as progress(done, total)
+        after each pair.
+        """
+        total = len(self.ticker_pairs)
+        for done, (ticker_1, ticker_2) in enumerate(tqdm(self.ticker_pairs), 1):
+            if progress is not None:
+                progress(done, total)
             comb = ticker_1 + ':' + ticker_2
 
             mask = self.df[ticker_2].notna() & self.df[ticker_1].notna()
@@ -45,6 +54,8 @@ class IdentifyCandidates:
 class ScoreCandidates:
     def __init__(self, hurst, adf, coint, score_dict=[]):
         s = hurst+adf+coint
+        if not s > 0:
+            hurst, adf, coint, s = 1, 1, 1, 3
         self.weight_hurst = hurst/s
         self.weight_adf = adf/s
         self.weight_coint = coint/s
@@ -52,9 +63,112 @@ class ScoreCandidates:
         self.score_dict = score_dict
 
     def get_top_candidates(self):
-        scorings = {}
-        for comb in self.score_dict.keys():
-            c, s, mr = self.score_dict[comb]["coint"], self.score_dict[comb]["stationary"], self.score_dict[comb]["mean_reversion"]
-            score_dict = self.weight_coint*c + self.weight_hurst*s + self.weight_adf*mr
-            scorings[comb] = score_dict
-        return sorted(scorings, key=lambda x: scorings[x])
\ No newline at end of file
+        table = PairScoreTable.from_dict(self.score_dict)
+        scores = table.weighted(self.weight_hurst, self.weight_adf, self.weight_coint)
+        return [table.key(i) for i in np.argsort(scores, kind="stable")]
+
+
+class PairScoreTable:
+    """
+    The scores of a pair screening as arrays, one row per pair. Tickers are stored
+    once and pairs refer to them by position, so per-ticker values are gathered
+    with np.take instead of looked up pair by pair.
+    """
+    SCORES = ["coint", "stationary", "mean_reversion"]
+
+    def __init__(self, tickers, ticker_1, ticker_2, scores):
+        """
+        Parameters
+        ----------
+        tickers : np.ndarray
+            (M,) ticker symbols.
+        ticker_1, ticker_2 : np.ndarray
+            (N,) positions in tickers of each pair's tickers.
+        scores : np.ndarray
+            (N, 3) coint, stationary and mean_reversion p-values, NaN if missing.
+        """
+        self.tickers = tickers
+        self.ticker_1 = ticker_1
+        self.ticker_2 = ticker_2
+        self.scores = scores
+
+    @classmethod
+    def from_dict(cls, score_dict):
+        """
+        From IdentifyCandidates.score, {"T1:T2": {"coint": ..., "stationary": ..., "mean_reversion": ...}}.
+        """
+        pairs = [key.split(':') for key in score_dict.keys()]
+        scores = [[value.get(name) for name in cls.SCORES] for value in score_dict.values()]
+        return cls._from_lists(pairs, scores)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        From rows with ticker_1, ticker_2 and the scores, as returned by
+        MongoConnect.query_pair_scores.
+        """
+        pairs, scores = [], []
+        for row in rows:
+            pairs.append((row["ticker_1"], row["ticker_2"]))
+            scores.append([row.get(name) for name in cls.SCORES])
+        return cls._from_lists(pairs, scores)
+
+    @classmethod
+    def _from_lists(cls, pairs, scores):
+        tickers, positions = np.unique(np.array(pairs, dtype=object).reshape(-1, 2), return_inverse=True)
+        positions = positions.reshape(-1, 2)
+        scores = np.array(scores, dtype=float).reshape(-1, 3)
+        return cls(tickers, positions[:, 0], positions[:, 1], scores)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def key(self, i):
+        return f"{self.tickers[self.ticker_1[i]]}:{self.tickers[self.ticker_2[i]]}"
+
+    def weighted(self, hurst, mr, coint):
+        """
+        Weighted score of every pair, lower is better. The weights are normalised
+        to sum to one, hurst weighs the stationary and mr the mean_reversion column.
+        All-zero weights, e.g. every slider at 0, count the columns equally.
+        """
+        weights = np.array([coint, hurst, mr], dtype=float)
+        if not weights.sum() > 0:
+            weights = np.ones(3)
+        return self.scores @ (weights / weights.sum())
+
+    @staticmethod
+    def rank(keys, start, stop, descending=False):
+        """
+        Rows ranked start to stop by keys, NaN last and ties in row order, as a
+        stable sort would rank them. Only the first stop rows are selected, with
+        np.partition, and sorted, not the whole table.
+        """
+        keys = np.asarray(keys, dtype=float)
+        if descending:
+            keys = -keys
+        stop = min(stop, len(keys))
+        if start >= stop:
+            return np.array([], dtype=int)
+        if stop < len(keys):
+            # Rows below the stop-th key, then the rows tied with it in row order
+            kth = np.partition(keys, stop - 1)[stop - 1]
+            if np.isnan(kth):
+                below, tied = ~np.isnan(keys), np.isnan(keys)
+            else:
+                below, tied = keys < kth, keys == kth
+            rows = np.flatnonzero(below)
+            rows = np.concatenate([rows, np.flatnonzero(tied)[:stop - len(rows)]])
+        else:
+            rows = np.arange(len(keys))
+        rows = rows[np.argsort(keys[rows], kind="stable")]
+        return rows[start:stop]
+
+    def symbol_keys(self, positions):
+        """
+        Sort keys of ticker positions that follow the alphabetical order of the symbols.
+        """
+        order = np.argsort(self.tickers.astype(str), kind="stable")
+        ranks = np.empty(len(order), dtype=float)
+        ranks[order] = np.arange(len(order))
+        return ranks[positions]
@@ -0,0 +1,364 @@
+import os
+import json
+import shutil
+from hashlib import sha1
+from threading import Lock
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.environ.get("EQUITY_PAIR_CACHE_DIR", os.path.join(".", ".cache", "panels"))
+
+
+class PricePanel:
+    """
+    A cleaned (dates x tickers) price matrix and its z-scored version. When loaded
+    from disk the arrays are read-only memory maps, so several Dash workers can
+    share one copy through the page cache.
+    """
+    def __init__(self, values, zscored, index, columns, diagnostics=None):
+        self.values = values
+        self.zscored = zscored
+        self.index = pd.DatetimeIndex(index)
+        self.columns = pd.Index(columns)
+        self.diagnostics = diagnostics
+        self.key = None
+        self.features = {}
+
+    @classmethod
+    def from_frame(cls, df, diagnostics=None):
+        values = np.ascontiguousarray(df.values)
+        zscored = (values - values.mean(axis=0)) / values.std(axis=0, ddof=1)
+        return cls(values, zscored, df.index, df.columns, diagnostics)
+
+    def frame(self):
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def zscore_frame(self):
+        return pd.DataFrame(self.zscored, index=self.index, columns=self.columns, copy=False)
+
+    def save(self, path):
+        os.makedirs(path)
+        np.save(os.path.join(path, "values.npy"), self.values)
+        np.save(os.path.join(path, "zscored.npy"), self.zscored)
+        meta = {
+            "index": [date.strftime("%Y-%m-%d") for date in self.index],
+            "columns": list(self.columns),
+            "diagnostics": self.diagnostics.to_dict(orient="split") if self.diagnostics is not None else None,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        zscored = np.load(os.path.join(path, "zscored.npy"), mmap_mode="r")
+        diagnostics = meta["diagnostics"]
+        if diagnostics is not None:
+            diagnostics = pd.DataFrame(diagnostics["data"], index=diagnostics["index"], columns=diagnostics["columns"])
+        return cls(values, zscored, pd.to_datetime(meta["index"]), meta["columns"], diagnostics)
+
+
+class RawPrices:
+    """
+    Uncleaned (dates x tickers) prices of a ticker universe covering start_date to
+    end_date, the union of every window loaded so far.
+    """
+    def __init__(self, frame, start_date, end_date):
+        self.frame = frame
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def missing_ranges(self, start_date, end_date):
+        """
+        Date ranges of [start_date, end_date] not covered yet, or None if the window
+        doesn't overlap or touch the stored one and has to be loaded in full.
+        """
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        have_start, have_end = pd.Timestamp(self.start_date), pd.Timestamp(self.end_date)
+        day = pd.Timedelta(days=1)
+        if start > have_end + day or end < have_start - day:
+            return None
+        ranges = []
+        if start < have_start:
+            ranges.append((start_date, (have_start - day).strftime("%Y-%m-%d")))
+        if end > have_end:
+            ranges.append(((have_end + day).strftime("%Y-%m-%d"), end_date))
+        return ranges
+
+    def extend(self, frames, start_date, end_date):
+        frame = pd.concat([self.frame] + frames) if frames else self.frame
+        frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+        return RawPrices(frame, min(self.start_date, start_date), max(self.end_date, end_date))
+
+    def window(self, start_date, end_date):
+        return self.frame.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+
+    def save(self, path):
+        os.makedirs(path)
+        np.save(os.path.join(path, "values.npy"), np.ascontiguousarray(self.frame.values))
+        meta = {
+            "index": [date.strftime("%Y-%m-%d") for date in self.frame.index],
+            "columns": list(self.frame.columns),
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        frame = pd.DataFrame(np.load(os.path.join(path, "values.npy")), index=pd.to_datetime(meta["index"]), columns=meta["columns"])
+        return cls(frame, meta["start_date"], meta["end_date"])
+
+
+class PanelCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_in_memory=4, max_disk_bytes=2 * 1024 ** 3):
+        """
+        Cache of cleaned price panels keyed by (ticker universe, start date, end date,
+        cleaning parameters, prices version). The clustering method is not part of
+        the key, so the same panel serves every method. Re-ingesting prices bumps
+        the version, so older panels and raw prices are never reused.
+
+        A window that moves forward from the last one cleaned for the same
+        universe only has its new dates cleaned, see PriceCleaner.clean_appended.
+
+        Panels are held in a small in-process LRU and spilled to cache_dir as .npy
+        files. Every worker process, and the app after a restart, reads those back
+        as memory maps instead of reloading and recleaning the data. The least
+        recently used entries on disk are deleted once they take more than
+        max_disk_bytes.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory for the on-disk panels, EQUITY_PAIR_CACHE_DIR if set.
+        max_in_memory : int
+            Number of panels kept in this process.
+        max_disk_bytes : int
+            Size of cache_dir above which the least recently used entries are deleted.
+        """
+        self.cache_dir = cache_dir
+        self.max_in_memory = max_in_memory
+        self.max_disk_bytes = max_disk_bytes
+        self._panels = OrderedDict()
+        self._raw = OrderedDict()
+        # (universe, cleaning parameters, version) -> key of the last panel used
+        self._latest = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_universe_key(tickers):
+        return sha1("\n".join(sorted(set(tickers))).encode()).hexdigest()
+
+    @classmethod
+    def make_key(cls, tickers, start_date, end_date, cleaner_params, version=0):
+        universe = cls.make_universe_key(tickers)
+        params = json.dumps(cleaner_params, sort_keys=True)
+        return sha1(f"{universe}|{start_date}|{end_date}|{params}|{version}".encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._panels:
+                self._panels.move_to_end(key)
+                return self._panels[key]
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        try:
+            panel = PricePanel.load(path)
+            self._touch(path)
+        except (OSError, ValueError) as e:
+            print(f"Could not read cached panel {key}: {e}")
+            return None
+        self._remember(key, panel)
+        return panel
+
+    def put(self, key, panel):
+        """
+        Stores a panel in memory and on disk. The files are written to a temporary
+        directory and renamed into place, so other workers never see a partial panel.
+        """
+        self._remember(key, panel)
+        path = os.path.join(self.cache_dir, key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            panel.save(tmp_path)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another worker got there first, or the disk isn't writable; memory still has it
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def get_or_load(self, tickers, start_date, end_date, cleaner, load_prices, version=0):
+        """
+        Returns the cleaned panel, building it only on a miss. On a miss only the
+        dates not already held for this ticker universe are loaded, so sliding the
+        window by a few days loads a few days of prices. If the window starts
+        inside the last panel of the universe and ends after it, only the dates
+        after that panel are cleaned.
+
+        Parameters
+        ----------
+        load_prices : callable
+            load_prices(start_date, end_date) returns the raw (dates x tickers) price
+            DataFrame for that range.
+        version : int
+            Version of the stored prices, MongoConnect.get_versions("prices").
+        """
+        key = self.make_key(tickers, start_date, end_date, cleaner.get_params(), version)
+        series = (self.make_universe_key(tickers), json.dumps(cleaner.get_params(), sort_keys=True), version)
+        panel = self.get(key)
+        if panel is None:
+            raw = self.get_or_extend_raw(tickers, start_date, end_date, load_prices, version)
+            window = raw.window(start_date, end_date)
+            with self._lock:
+                latest = self._latest.get(series)
+            previous = self.get(latest) if latest is not None else None
+            cleaned = cleaner.clean_appended(previous.frame(), window) if previous is not None else None
+            if cleaned is not None:
+                print("Cleaning the new dates only.")
+            else:
+                cleaned = cleaner.clean(window)
+            panel = PricePanel.from_frame(*cleaned)
+            self.put(key, panel)
+        with self._lock:
+            self._latest[series] = key
+        return panel
+
+    def get_or_extend_raw(self, tickers, start_date, end_date, load_prices, version=0):
+        """
+        Raw prices of the universe covering [start_date, end_date], loading only the
+        missing ranges and keeping the union for the next window. The union is only
+        extended while the prices version is unchanged.
+        """
+        key = f"raw-{self.make_universe_key(tickers)}-{version}"
+        with self._lock:
+            raw = self._raw.get(key)
+        path = os.path.join(self.cache_dir, key)
+        if raw is None and os.path.exists(os.path.join(path, "meta.json")):
+            try:
+                raw = RawPrices.load(path)
+                self._touch(path)
+            except (OSError, ValueError) as e:
+                print(f"Could not read cached prices {key}: {e}")
+
+        ranges = raw.missing_ranges(start_date, end_date) if raw is not None else None
+        if ranges is None:
+            raw = RawPrices(load_prices(start_date, end_date), start_date, end_date)
+        elif ranges:
+            print(f"Loading {len(ranges)} missing date range(s) only.")
+            raw = raw.extend([load_prices(start, end) for start, end in ranges], start_date, end_date)
+        else:
+            return self._remember_raw(key, raw)
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raw.save(tmp_path)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp_path, path)
+            self.evict(keep=key)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return self._remember_raw(key, raw)
+
+    def get_or_compute_features(self, panel, extractor):
+        """
+        Features of a panel from a FeatureExtractor, computed once per panel and
+        extractor settings and stored next to the panel on disk.
+        """
+        feature_key = sha1(json.dumps(extractor.get_params(), sort_keys=True).encode()).hexdigest()[:16]
+        if feature_key in panel.features:
+            return panel.features[feature_key]
+        path = os.path.join(self.cache_dir, panel.key, f"features-{feature_key}.npy") if panel.key is not None else None
+        if path is not None and os.path.exists(path):
+            features = np.load(path, mmap_mode="r")
+        else:
+            features = extractor.transform(panel.values)
+            if path is not None and os.path.isdir(os.path.dirname(path)):
+                tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+                try:
+                    np.save(tmp_path, features)
+                    os.replace(tmp_path, path)
+                except OSError:
+                    pass
+        panel.features[feature_key] = features
+        return features
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used panels and raw prices on disk until
+        cache_dir is under max_disk_bytes. Workers that have an evicted panel
+        memory-mapped keep reading it until they drop it.
+        """
+        if self.max_disk_bytes is None or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or ".tmp-" in entry.name:
+                continue
+            try:
+                size = sum(item.stat().st_size for item in os.scandir(entry.path) if item.is_file())
+                entries.append((entry.stat().st_mtime, size, entry.name))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+
+    @staticmethod
+    def _touch(path):
+        # Directory mtimes order the entries for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._panels.clear()
+            self._raw.clear()
+            self._latest.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _remember_raw(self, key, raw):
+        with self._lock:
+            self._raw[key] = raw
+            self._raw.move_to_end(key)
+            while len(self._raw) > self.max_in_memory:
+                self._raw.popitem(last=False)
+        return raw
+
+    def _remember(self, key, panel):
+        panel.key = key
+        with self._lock:
+            self._panels[key] = panel
+            self._panels.move_to_end(key)
+            while len(self._panels) > self.max_in_memory:
+                self._panels.popitem(last=False)
+
+
+_panel_cache = None
+
+def get_panel_cache():
+    global _panel_cache
+    if _panel_cache is None:
+        _panel_cache = PanelCache()
+    return _panel_cache
@@ -1,12 +1,8 @@
 import numpy as np
 import pandas as pd
 
-from filterpy.kalman import KalmanFilter
-from statsmodels.regression.linear_model import OLS
-from statsmodels.tools.tools import add_constant
-from statsmodels.tsa.stattools import adfuller
-
-import matplotlib.pyplot as plt
+# filterpy, statsmodels and matplotlib are imported where they are used, so
+# importing this module (and the dashboard) doesn't pay for them up front
 from collections import deque
 
 class OnlineRegression(object):
@@ -41,6 +37,7 @@ class OnlineRegression(object):
         raise NotImplementedError()
 
     def plot_parameters(self):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(14, 7))
 
         plt.subplot(2, 1, 1)
@@ -63,6 +60,7 @@ class KalmanRegression(OnlineRegression):
     Estimated model: ts2 ~ beta * ts1 + alpha
     """
     def __init__(self, ts1, ts2, delta=1e-5, maxlen=3000):
+        from filterpy.kalman import KalmanFilter
         super().__init__(ts1, ts2)
         self.maxlen = maxlen
         self.ts2 = ts2
@@ -120,6 +118,8 @@ class OLSRegression(OnlineRegression):
         self.ts2 = deque(ts2, maxlen=self.maxlen)
 
     def run(self):
+        from statsmodels.regression.linear_model import OLS
+        from statsmodels.tools.tools import add_constant
         data = pd.DataFrame({self._x: list(self.ts1), self._y: list(self.ts2)}) # Swap ts1 and ts2
         self.model = OLS(data[self._y], add_constant(data[self._x])) # Swap x and y
         self.results = self.model.fit()
@@ -158,6 +158,9 @@ class CointegrationTest(OnlineRegression):
         self.run() 
 
     def run(self):
+        from statsmodels.regression.linear_model import OLS
+        from statsmodels.tools.tools import add_constant
+        from statsmodels.tsa.stattools import adfuller
         data = pd.DataFrame({self._x: list(self.ts1), self._y: list(self.ts2)})
         
         self.model = OLS(data[self._y], add_constant(data[self._x])) # Swap x and y
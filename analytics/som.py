@@ -0,0 +1,153 @@
+import numpy as np
+from collections import defaultdict
+
+
+class BatchSOM:
+    def __init__(self, x, y, input_len, sigma=None, sigma_end=0.3, max_epochs=60, tol=1e-4, random_seed=10):
+        """
+        Self-organising map trained in batch mode. Each epoch assigns every sample to
+        its best-matching unit with one distance-matrix computation, then moves every
+        node to the neighbourhood-weighted mean of the samples at once, so an epoch
+        is a handful of matrix products over the whole (N x T) input.
+
+        The neighbourhood radius shrinks from sigma to sigma_end over the first half
+        of max_epochs and then stays at sigma_end. Training stops early once the
+        radius has settled, no sample changes unit and the nodes move less than tol.
+
+        Parameters
+        ----------
+        x, y : int
+            Grid dimensions.
+        input_len : int
+            Length of each sample.
+        sigma : float, optional
+            Initial neighbourhood radius, half the larger grid side by default.
+        sigma_end : float
+            Final neighbourhood radius.
+        max_epochs : int
+            Maximum number of passes over the data.
+        tol : float
+            Largest node movement, relative to the mean node norm, counted as converged.
+        random_seed : int
+            Seed for random weight initialisation.
+        """
+        self.x = x
+        self.y = y
+        self.input_len = input_len
+        self.sigma = sigma if sigma is not None else max(x, y) / 2
+        self.sigma_end = min(sigma_end, self.sigma)
+        self.max_epochs = max_epochs
+        self.tol = tol
+        self.epochs_run = 0
+
+        self._rng = np.random.default_rng(random_seed)
+        self.weights = self._rng.normal(size=(x * y, input_len))
+        self.weights /= np.linalg.norm(self.weights, axis=1, keepdims=True)
+
+        # Squared grid distances between every pair of nodes
+        grid = np.array([(i, j) for i in range(x) for j in range(y)], dtype=float)
+        self._grid_sq_dists = ((grid[:, None, :] - grid[None, :, :]) ** 2).sum(axis=-1)
+
+    def pca_weights_init(self, data):
+        """
+        Spreads the nodes over the plane of the first two principal components.
+        """
+        mean = data.mean(axis=0)
+        _, s, vt = np.linalg.svd(data - mean, full_matrices=False)
+        scale = s[:2] / np.sqrt(max(len(data) - 1, 1))
+        pcs = vt[:2] * scale[:, None]
+        if len(pcs) < 2:
+            pcs = np.vstack([pcs, np.zeros((2 - len(pcs), data.shape[1]))])
+        for node, (c1, c2) in enumerate([(c1, c2) for c1 in np.linspace(-1, 1, self.x) for c2 in np.linspace(-1, 1, self.y)]):
+            self.weights[node] = mean + c1 * pcs[0] + c2 * pcs[1]
+
+    def set_weights(self, weights):
+        """
+        Starts from existing weights of shape (x, y, input_len), e.g. a previous run.
+        """
+        self.weights = np.array(weights, dtype=float).reshape(self.x * self.y, self.input_len)
+
+    def get_weights(self):
+        return self.weights.reshape(self.x, self.y, self.input_len)
+
+    def train(self, data, verbose=False, progress=None):
+        """
+        Parameters
+        ----------
+        data : np.ndarray
+            (N x input_len) samples.
+        verbose : bool
+            Print the quantisation error per epoch.
+        progress : callable, optional
+            Called as progress(epoch, max_epochs) after every epoch.
+
+        Returns
+        -------
+        int
+            Number of epochs run.
+        """
+        data = np.asarray(data, dtype=float)
+        decay_epochs = max(self.max_epochs // 2, 1)
+        prev_bmu = None
+        for epoch in range(self.max_epochs):
+            sigma = self.sigma * (self.sigma_end / self.sigma) ** min(epoch / decay_epochs, 1.0)
+            bmu, sq_dists = self._bmu(data)
+
+            # Neighbourhood weight of every sample on every node: (N x nodes)
+            h = np.exp(-self._grid_sq_dists[bmu] / (2 * sigma ** 2))
+            mass = h.sum(axis=0)
+            new_weights = np.where(mass[:, None] > 1e-12, (h.T @ data) / np.maximum(mass, 1e-12)[:, None], self.weights)
+
+            shift = np.abs(new_weights - self.weights).max() / max(np.linalg.norm(self.weights, axis=1).mean(), 1e-12)
+            self.weights = new_weights
+            self.epochs_run = epoch + 1
+
+            if verbose:
+                print(f"\r [ {epoch + 1} / {self.max_epochs} ] sigma={sigma:.3f} quantization error={np.sqrt(sq_dists).mean():.4f}", end="")
+            if progress is not None:
+                progress(epoch + 1, self.max_epochs)
+
+            settled = epoch >= decay_epochs
+            if settled and prev_bmu is not None and np.array_equal(bmu, prev_bmu) and shift < self.tol:
+                break
+            prev_bmu = bmu
+        if verbose:
+            print(f"\n Stopped after {self.epochs_run} epochs.")
+        return self.epochs_run
+
+    def winners(self, data):
+        """
+        Best-matching unit (i, j) of every sample, as an (N x 2) array.
+        """
+        bmu, _ = self._bmu(np.asarray(data, dtype=float))
+        return np.column_stack(np.unravel_index(bmu, (self.x, self.y)))
+
+    def win_map(self, data, winners=None):
+        """
+        Samples grouped by their best-matching unit, keyed by (i, j) as in MiniSom.
+        """
+        if winners is None:
+            winners = self.winners(data)
+        win_map = defaultdict(list)
+        for sample, (i, j) in zip(data, winners):
+            win_map[(int(i), int(j))].append(sample)
+        return win_map
+
+    def quantization_error(self, data):
+        _, sq_dists = self._bmu(np.asarray(data, dtype=float))
+        return np.sqrt(sq_dists).mean()
+
+    def _bmu(self, data, chunk_size=4096):
+        """
+        Index of the closest node for every sample and its squared distance, from
+        ||d||^2 - 2 d.w + ||w||^2, in chunks of samples to bound memory.
+        """
+        w_sq = (self.weights ** 2).sum(axis=1)
+        bmu = np.empty(len(data), dtype=int)
+        best = np.empty(len(data))
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            sq_dists = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ self.weights.T + w_sq[None, :]
+            bmu[start:start + chunk_size] = sq_dists.argmin(axis=1)
+            best[start:start + chunk_size] = np.maximum(sq_dists.min(axis=1), 0)
+        return bmu, best
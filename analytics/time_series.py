@@ -1,6 +1,4 @@
 import numpy as np
-from statsmodels.tsa.stattools import adfuller
-import matplotlib.pyplot as plt
 
 class TimeSeries:
     def __init__(self, time_series, ticker=None):
@@ -11,6 +9,7 @@ class TimeSeries:
         """
         Plots the time series.
         """
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(figsize=(15, 7))
         ax.plot(self.ts, label=self.ticker)
         ax.legend()
@@ -39,6 +38,7 @@ class TimeSeries:
         """
         Tests whether the time series are stationary using the Augmented Dickey-Fuller test.
         """
+        from statsmodels.tsa.stattools import adfuller
         pvalue = adfuller(self.ts)[1]
         if pvalue < cutoff:
             return True, pvalue
@@ -2,7 +2,12 @@
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State
-from data_loader.singleton import get_data_fetcher
+from uuid import uuid4
+from data_loader.ticker_search import get_ticker_search
+from utils.session import get_session_store
+from utils.jobs import get_job_queue
+from data_loader.singleton import DatabaseConnection
+from utils.startup import warm_up
 
 # GUI INTERFACE
 from gui.screen_1.callbacks import register_analytics_callbacks
@@ -10,18 +15,32 @@ from gui.screen_2.callbacks import register_trade_callbacks
 from gui.screen_1.layout import get_analytics_layout
 from gui.screen_2.layout import get_trading_layout  
 
-data_fetcher = get_data_fetcher()
 
 # LOADERS
-def run_dashboard():
+def enable_compression(server):
+    """
+    Compresses callback responses, mostly figure JSON, and assets with brotli or
+    gzip, whichever the browser accepts, if flask-compress is installed.
+    """
+    try:
+        from flask_compress import Compress
+    except ImportError:
+        print("flask-compress is not installed, responses are sent uncompressed. Run pip install flask-compress to compress them.")
+        return False
+    server.config.setdefault("COMPRESS_ALGORITHM", ["br", "gzip"])
+    server.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    Compress(server)
+    return True
+
+
+def create_app():
+    """
+    Builds the Dash app with its layout and callbacks. Callbacks keep no state in
+    the process, per-session state lives in the session store, so the app can be
+    served by several worker processes.
+    """
     app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True, prevent_initial_callbacks="initial_duplicate")
-    
-    # Function to create dropdown
-    
-    
-    tickers = data_fetcher.get_ticker_names()
-    tickers = frozenset(tickers)
-    names = [ticker + ":" + (data_fetcher.get_ticker_field_info(ticker, field='longName') or ticker) for ticker in tickers]
+    enable_compression(app.server)
     
     hamburger = dbc.Button(
         [
@@ -56,7 +75,12 @@ def run_dashboard():
     loading_state = dcc.Store(id='loading-state', data={'loaded': False})
     outside_click_detector = html.Div(id="outside-click-detector", style={"position": "fixed", "width": "100%", "height": "100%", "z-index": "0"})
     
-    app.layout = html.Div([dcc.Location(id="url"), outside_click_detector, hamburger, sidebar, content], style={'width': '100%', 'max-width': 'none'})
+    def serve_layout():
+        # A new id per page load, kept by the browser for the tab's lifetime
+        session_id = dcc.Store(id='session-id', storage_type='session', data=uuid4().hex)
+        return html.Div([dcc.Location(id="url"), session_id, outside_click_detector, hamburger, sidebar, content], style={'width': '100%', 'max-width': 'none'})
+
+    app.layout = serve_layout
     
     # Define callback to update page content based on URL
     @app.callback(
@@ -65,11 +89,11 @@ def run_dashboard():
     )
     def display_page(pathname):
         if pathname == '/trading':
-            layout = get_trading_layout(names)
+            layout = get_trading_layout()
             return layout
     
         else:
-            layout = get_analytics_layout(names)
+            layout = get_analytics_layout()
             return layout
     
     @app.callback(
@@ -89,7 +113,87 @@ def run_dashboard():
         
     
     register_analytics_callbacks(app)
-    register_trade_callbacks(app, names)
-    
-    app.run_server(debug=True)
+    register_trade_callbacks(app)
+    return app
+
+
+def preload():
+    """
+    Work done once in the parent process before the workers fork. Kept cheap, so
+    workers start accepting requests straight away, and fork-safe: only SQLite
+    connections that are closed again, no MongoClient.
+    """
+    get_session_store().purge()
+    get_job_queue().prune()
+
+
+def start_background_services():
+    """
+    Warm-up that runs while the server already accepts requests. Threads don't
+    survive a fork, so each worker starts its own.
+    """
+    # Ticker dropdowns search this index instead of embedding every ticker
+    get_ticker_search().start()
+    warm_up()
+
+
+def run_dashboard(debug=True):
+    """
+    Development server with the reloader and debug tools.
+    """
+    app = create_app()
+    start_background_services()
+    app.run_server(debug=debug)
+
+
+def run_production(server="gunicorn", host="0.0.0.0", port=8050, workers=4, threads=4, timeout=120):
+    """
+    Serves the app with a multi-worker WSGI server.
+
+    Parameters
+    ----------
+    server : str
+        "gunicorn" (Unix): workers processes of threads threads each, forked after
+        preload. "waitress" (any platform): one process with workers * threads threads.
+    host, port :
+        Address to bind.
+    workers : int
+        Worker processes.
+    threads : int
+        Request threads per worker.
+    timeout : int
+        Seconds a gunicorn worker may spend on a request before it is restarted.
+    """
+    app = create_app()
+    preload()
+    if server == "gunicorn":
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise Exception("gunicorn is not installed, run pip install gunicorn or use --server waitress.")
+
+        class DashApplication(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{host}:{port}")
+                self.cfg.set("workers", workers)
+                self.cfg.set("threads", threads)
+                self.cfg.set("timeout", timeout)
+                self.cfg.set("preload_app", True)
+                self.cfg.set("post_fork", lambda arbiter, worker: start_background_services())
+
+            def load(self):
+                return app.server
+
+        # MongoClients aren't fork-safe, every worker opens its own on first use
+        DatabaseConnection.close()
+        DashApplication().run()
+    elif server == "waitress":
+        try:
+            from waitress import serve
+        except ImportError:
+            raise Exception("waitress is not installed, run pip install waitress.")
+        start_background_services()
+        serve(app.server, host=host, port=port, threads=workers * threads)
+    else:
+        raise Exception("Server must be gunicorn or waitress.")
     
\ No newline at end of file
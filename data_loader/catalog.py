@@ -0,0 +1,123 @@
+import os
+import time
+from threading import Lock
+
+from data_loader.singleton import get_data_fetcher, get_misc_connect
+
+
+class Catalog:
+    # Listing name -> data version it is built from
+    VERSIONS = {"tickers": "prices", "clustering_runs": "clusters", "pair_runs": "pairs"}
+
+    def __init__(self, data_fetcher, misc_connect, check_interval=5.0):
+        """
+        In-memory lists of the tickers, clustering runs and pair runs that the
+        dropdowns and the clustering button list, so they are read without
+        scanning price_data or iterating the run collections.
+
+        Every list is held with the data version it was read at. Writes through
+        post_clustering_results and post_pairs_results in this process add their
+        run to the list straight away. Writes from other processes are picked up
+        from the data versions, checked at most every check_interval seconds with
+        one query; only the lists whose version moved are read again.
+
+        Parameters
+        ----------
+        data_fetcher : GetStockData
+            Source of the ticker list.
+        misc_connect : MongoConnect
+            Source of the runs and of the data versions.
+        check_interval : float
+            Seconds between checks of the data versions.
+        """
+        self.data_fetcher = data_fetcher
+        self.misc_connect = misc_connect
+        self.check_interval = check_interval
+        self._lists = {}
+        self._checked = 0
+        self._lock = Lock()
+        misc_connect.add_write_listener(self.on_write)
+
+    def tickers(self):
+        """
+        Sorted ticker symbols with price data. The list is shared, don't modify it.
+        """
+        return self._get("tickers")
+
+    def clustering_runs(self):
+        """
+        {"method", "start_date", "end_date"} of every clustering run.
+        """
+        return self._get("clustering_runs")
+
+    def pair_runs(self):
+        """
+        {"method", "chosen_cluster", "start_date", "end_date"} of every pair run.
+        """
+        return self._get("pair_runs")
+
+    def on_write(self, data, version, change=None):
+        """
+        Called by MongoConnect.bump_version. A run written on top of the version
+        held is added in place, otherwise the list is read again on next use.
+        """
+        name = {version_name: name for name, version_name in self.VERSIONS.items()}.get(data)
+        if name is None:
+            return
+        with self._lock:
+            held = self._lists.get(name)
+            if held is None:
+                return
+            held_version, items = held
+            if change is not None and held_version == version - 1:
+                # Lists are replaced, not mutated, so readers keep a consistent one
+                self._lists[name] = (version, items if change in items else items + [change])
+            elif held_version < version:
+                del self._lists[name]
+
+    def invalidate(self):
+        with self._lock:
+            self._lists.clear()
+
+    def _get(self, name):
+        if time.time() - self._checked >= self.check_interval:
+            self._check_versions()
+        with self._lock:
+            held = self._lists.get(name)
+        if held is not None:
+            return held[1]
+        # Read the version first, a write racing the load is caught on the next check
+        version = self.misc_connect.get_versions(self.VERSIONS[name])[0]
+        items = self._load(name)
+        with self._lock:
+            current = self._lists.get(name)
+            if current is None or current[0] < version:
+                self._lists[name] = (version, items)
+        return items
+
+    def _check_versions(self):
+        names = list(self.VERSIONS)
+        versions = self.misc_connect.get_versions(*(self.VERSIONS[name] for name in names))
+        with self._lock:
+            self._checked = time.time()
+            for name, version in zip(names, versions):
+                held = self._lists.get(name)
+                if held is not None and held[0] != version:
+                    del self._lists[name]
+
+    def _load(self, name):
+        if name == "tickers":
+            return self.data_fetcher.get_ticker_names()
+        if name == "clustering_runs":
+            return list(self.misc_connect.get_all_clustering_results())
+        return list(self.misc_connect.get_all_pairs_results())
+
+
+_catalog, _catalog_pid = None, None
+
+def get_catalog():
+    global _catalog, _catalog_pid
+    # Listens to this process's MongoConnect, so a forked worker builds its own
+    if _catalog is None or _catalog_pid != os.getpid():
+        _catalog, _catalog_pid = Catalog(get_data_fetcher(), get_misc_connect()), os.getpid()
+    return _catalog
@@ -1,5 +1,4 @@
 from pymongo import MongoClient, errors, ASCENDING
-from yfinance import download, Ticker
 from datetime import datetime
 from tqdm import tqdm
 class SetStockData:
@@ -16,12 +15,15 @@ class SetStockData:
     industry, market cap, number of employees etc.
     
     """
-    def __init__(self, db_name = "equity_data", collection_name="price_data", date_collection_name="date_data",  meta_collection_name="ticker_data", mongo_url="mongodb://localhost:27017/"):
+    def __init__(self, db_name = "equity_data", collection_name="price_data", date_collection_name="date_data",  meta_collection_name="ticker_data", mongo_url="mongodb://localhost:27017/",
+                 versions_collection_name="data_versions"):
         self.client = MongoClient(mongo_url)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
         self.date_collection = self.db[date_collection_name]
         self.meta_collection = self.db[meta_collection_name]
+        # Shared with MongoConnect.bump_version, cached figures key on the "prices" version
+        self.versions_collection = self.db[versions_collection_name]
 
         try:
             self.db.create_collection(collection_name)
@@ -31,6 +33,7 @@ class SetStockData:
             pass  # Collection already exists
 
     def initialise_metadata(self, ticker):
+        from yfinance import Ticker
         try:
             info = Ticker(ticker).info
         except:
@@ -60,6 +63,7 @@ class SetStockData:
             return None, None
     
     def download_data(self, ticker, start_date, end_date):
+        from yfinance import download
         data = download(ticker, start=start_date, end=end_date)
         if data.empty:
             print(f"No new data to download for {ticker}")
@@ -69,13 +73,20 @@ class SetStockData:
         return closing_prices
 
 
-    def update_single_ticker(self, ticker):
+    def update_single_ticker(self, ticker, start_date=None, end_date=None):
+        """
+        Downloads the prices of ticker missing between start_date and end_date,
+        the dates of the last update_data if not given.
+        """
+        if start_date is None and end_date is None:
+            start_date, end_date = self.start_date, self.end_date
+        start_date_dt, end_date_dt = self.str_to_date(start_date), self.str_to_date(end_date)
         earliest_data_date, last_data_date = self.get_data_date_range(ticker)
         earliest_data_date_dt = self.str_to_date(earliest_data_date)
         last_data_date_dt = self.str_to_date(last_data_date)
 
         if earliest_data_date is None and last_data_date is None:
-            data = self.download_data(ticker, self.start_date, self.end_date)
+            data = self.download_data(ticker, start_date, end_date)
             if data is not None:
                 self.collection.update_one(
                     {"_id": ticker},
@@ -88,12 +99,12 @@ class SetStockData:
                     },
                     upsert=True,
                 )
-                self.initialise_date_range(ticker, self.start_date, self.end_date)
+                self.initialise_date_range(ticker, start_date, end_date)
                 self.initialise_metadata(ticker)
             return
 
-        if self.start_date_dt < earliest_data_date_dt:
-            data = self.download_data(ticker, self.start_date, self.date_to_str(earliest_data_date_dt))
+        if start_date_dt < earliest_data_date_dt:
+            data = self.download_data(ticker, start_date, self.date_to_str(earliest_data_date_dt))
             if data is not None:
                 self.collection.update_one(
                     {"_id": ticker},
@@ -111,13 +122,13 @@ class SetStockData:
                     {"_id": ticker},
                     {
                         "$set": {
-                            "earliest_date": self.start_date,
+                            "earliest_date": start_date,
                         }
                     }
                 )
 
-        if last_data_date_dt < self.end_date_dt:
-            data = self.download_data(ticker, self.date_to_str(last_data_date_dt), self.end_date)
+        if last_data_date_dt < end_date_dt:
+            data = self.download_data(ticker, self.date_to_str(last_data_date_dt), end_date)
             if data is not None:
                 self.collection.update_one(
                     {"_id": ticker},
@@ -134,7 +145,7 @@ class SetStockData:
                     {"_id": ticker},
                     {
                         "$set": {
-                            "latest_date": self.end_date
+                            "latest_date": end_date
                         }
                     }
                 )
@@ -148,14 +159,12 @@ class SetStockData:
 
         for ticker in tickers:
             self.update_single_ticker(ticker)
+        self.bump_version()
 
     def update_single_data(self, ticker, start_date, end_date):
-        self.start_date_dt = self.str_to_date(start_date)
-        self.end_date_dt = self.str_to_date(end_date)
-        self.start_date = start_date
-        self.end_date = end_date
-
-        self.update_single_ticker(ticker)
+        # Called from price loads on request threads, so the dates aren't stored on the setter
+        self.update_single_ticker(ticker, start_date, end_date)
+        self.bump_version()
 
     def bulk_insert_data(self, tickers, start_date, end_date):
         """
@@ -163,6 +172,7 @@ class SetStockData:
         for a fixed date range regardless of whether there is data already in the database. We call this function at the initialisation to ensure we don't
         need to wait too long to start running operations. The pre-set date range is 2021-08-01 to 2023-08-01.
         """
+        from yfinance import download
         data = download(tickers, start=start_date, end=end_date, group_by="ticker")
         data = data.dropna(axis=1, how='all')
 
@@ -185,6 +195,10 @@ class SetStockData:
                 },
                 upsert=True,
             )
+        self.bump_version()
+
+    def bump_version(self):
+        self.versions_collection.update_one({"_id": "prices"}, {"$inc": {"version": 1}}, upsert=True)
 
     @staticmethod
     def str_to_date(date_str):
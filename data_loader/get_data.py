@@ -52,29 +52,33 @@ class GetStockData:
     def get_ticker_names(self):
         return sorted([doc['_id'] for doc in self.collection.find({}, {'_id': 1})])
     
-    def get_data_date_range(self, ticker):
+    def get_data_date_range(self, ticker, start_date=None, end_date=None):
+        """
+        Closing prices of ticker between start_date and end_date, the dates of
+        set_dates if not given. They are passed rather than set by collate_dataset,
+        so threads loading different ranges at once don't see each other's dates.
+        """
+        if start_date is None and end_date is None:
+            start_date, end_date = self.start_date, self.end_date
+        start_date_dt, end_date_dt = self.str_to_date(start_date), self.str_to_date(end_date)
         cur_earliest_date, cur_latest_date = self.get_ticker_date_range(ticker)
         cur_earliest_date_dt = self.str_to_date(cur_earliest_date)
         cur_latest_date_dt = self.str_to_date(cur_latest_date)
 
-        if self.start_date_dt is None:
-            start_date = cur_earliest_date_dt
-        else:
-            if self.start_date_dt < cur_earliest_date_dt:
-                self.data_setter.update_single_data(ticker, self.start_date, cur_earliest_date)
-            start_date = self.start_date_dt
+        if start_date_dt is None:
+            start_date_dt = cur_earliest_date_dt
+        elif start_date_dt < cur_earliest_date_dt:
+            self.data_setter.update_single_data(ticker, start_date, cur_earliest_date)
 
-        if self.end_date_dt is  None:
-            end_date = cur_latest_date_dt
-        else:
-            if self.end_date_dt > cur_latest_date_dt:
-                self.data_setter.update_single_data(ticker, cur_latest_date, self.end_date)
-            end_date = self.end_date_dt
+        if end_date_dt is None:
+            end_date_dt = cur_latest_date_dt
+        elif end_date_dt > cur_latest_date_dt:
+            self.data_setter.update_single_data(ticker, cur_latest_date, end_date)
         
         pipeline = [
             {"$match": {"_id": ticker}},
             {"$unwind": "$closing_prices"},
-            {"$match": {"closing_prices.date": {"$gte": start_date , "$lte": end_date}}}
+            {"$match": {"closing_prices.date": {"$gte": start_date_dt , "$lte": end_date_dt}}}
         ]
         
         cursor = list(self.collection.aggregate(pipeline))
@@ -87,6 +91,23 @@ class GetStockData:
         return None
                 
         
+    def get_ticker_fields(self, tickers, fields):
+        """
+        {ticker: {field: value}} of the given info fields for many tickers in a
+        single query. Tickers or fields without a value are left out.
+        """
+        projection = {f"info.{field}": 1 for field in fields}
+        cursor = self.meta_collection.find({"_id": {"$in": list(tickers)}}, projection)
+        return {doc["_id"]: {field: doc["info"][field] for field in fields if field in (doc.get("info") or {})}
+                for doc in cursor}
+
+    def get_ticker_long_names(self):
+        """
+        {ticker: longName} for every ticker with one, in a single query.
+        """
+        cursor = self.meta_collection.find({"info.longName": {"$exists": True}}, {"info.longName": 1})
+        return {doc["_id"]: doc["info"]["longName"] for doc in cursor}
+
     def get_ticker_info(self, ticker):
         meta = self.meta_collection.find_one({"_id": ticker})
         if meta is not None:
@@ -94,11 +115,11 @@ class GetStockData:
         else:
             return None
 
-    def get_data(self, ticker):
+    def get_data(self, ticker, start_date=None, end_date=None):
         """
         
         """
-        cursor = self.get_data_date_range(ticker)
+        cursor = self.get_data_date_range(ticker, start_date, end_date)
         if len(cursor) == 0:
             return None
 
@@ -120,13 +141,17 @@ class GetStockData:
         """
         Collate a dataset from the database for a list of tickers and a date range.
         """
-        self.set_dates(start_date, end_date)
         dfs = []
         for ticker in tickers:
-            df = self.get_data(ticker)
+            df = self.get_data(ticker, start_date, end_date)
+            # Short ranges, e.g. the few new days of a sliding window, can be empty for a ticker
+            if df is None:
+                continue
             df['ticker'] = ticker
 
             dfs.append(df)
+        if len(dfs) == 0:
+            return pd.DataFrame({"close": [], "ticker": []}, index=pd.DatetimeIndex([], name="date"))
         return pd.concat(dfs)
     
     def get_single_date_price(self, ticker, date):
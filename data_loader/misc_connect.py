@@ -1,4 +1,13 @@
-from pymongo import MongoClient, errors
+import atexit
+from itertools import islice
+from threading import Lock
+from uuid import uuid4
+from pymongo import MongoClient, UpdateOne, errors, ASCENDING, DESCENDING, ReturnDocument
+
+from data_loader.strategy_writer import StrategyWriter
+
+PAIR_SCORES = ["coint", "stationary", "mean_reversion"]
+
 
 class MongoConnect:
     """
@@ -7,15 +16,21 @@ class MongoConnect:
     """
     def __init__(self, mongodb_url="mongodb://localhost:27017/", cluster_collection="cluster_results",
                   pairs_collections="pairs_results", strategy_collection="strategy_parameters",
-                  strategy_results_collection="strategy_results", strategy_trades_collection="strategy_trades"):
+                  strategy_results_collection="strategy_results", strategy_trades_collection="strategy_trades",
+                  versions_collection="data_versions", pair_scores_collection="pair_scores", db_name="equity_data"):
         self.client = MongoClient(mongodb_url)
-        self.db = self.client["equity_data"]
+        self.db = self.client[db_name]
 
         self.cluster_collection = self.db[cluster_collection]
         self.pairs_collection = self.db[pairs_collections]
+        self.pair_scores_collection = self.db[pair_scores_collection]
         self.strategy_collection = self.db[strategy_collection]
         self.strategy_results_collection = self.db[strategy_results_collection]
         self.strategy_trades_collection = self.db[strategy_trades_collection]
+        self.versions_collection = self.db[versions_collection]
+        self._write_listeners = []
+        self._strategy_writer = None
+        self._strategy_writer_lock = Lock()
 
         try:
             self.db.create_collection(cluster_collection)
@@ -25,6 +40,121 @@ class MongoConnect:
         except errors.CollectionInvalid:
             pass
 
+        self._create_strategy_indexes()
+        self._create_pair_score_indexes()
+
+    def _create_strategy_indexes(self):
+        """
+        Indexes backing the strategy queries below. The summary fields are
+        written by post_strategy so ranking and filtering never touches the
+        stored time series. create_index is a no-op if the index exists. The
+        unique uuid indexes are created by create_unique_uuid_indexes.
+        """
+        self.strategy_collection.create_index([("ticker_1", ASCENDING), ("ticker_2", ASCENDING), ("method", ASCENDING), ("start_date_trade", ASCENDING)])
+        self.strategy_collection.create_index([("method", ASCENDING)])
+
+        self.strategy_results_collection.create_index([("summary.growth", DESCENDING)])
+        self.strategy_results_collection.create_index([("summary.sharpe", DESCENDING)])
+        self.strategy_results_collection.create_index([("summary.max_drawdown", ASCENDING)])
+        self.strategy_results_collection.create_index([("summary.number_trades", DESCENDING)])
+        self.strategy_results_collection.create_index([("summary.ticker_1", ASCENDING), ("summary.ticker_2", ASCENDING), ("summary.growth", DESCENDING)])
+        self.strategy_results_collection.create_index([("summary.method", ASCENDING), ("summary.growth", DESCENDING)])
+        self.strategy_results_collection.create_index([("summary.start_date_trade", ASCENDING), ("summary.end_date_trade", ASCENDING), ("summary.growth", DESCENDING)])
+
+    def _create_pair_score_indexes(self):
+        """
+        Pair scores are one row per pair, filtered on run_id and sorted or
+        filtered on one of the scores.
+        """
+        self.pair_scores_collection.create_index([("run_id", ASCENDING), ("ticker_1", ASCENDING), ("ticker_2", ASCENDING)], unique=True)
+        for score in PAIR_SCORES:
+            self.pair_scores_collection.create_index([("run_id", ASCENDING), (score, ASCENDING)])
+        self.pairs_collection.create_index([("method", ASCENDING), ("chosen_cluster", ASCENDING), ("start_date", ASCENDING), ("end_date", ASCENDING)])
+
+    def create_unique_uuid_indexes(self):
+        """
+        Creates the unique uuid index of each strategy collection, which the
+        upserts of post_strategy rely on for idempotency. A non-unique uuid index
+        left by an earlier version is replaced. Run once at startup, see
+        utils.startup.run_migrations.
+
+        A collection holding duplicate uuids is logged and skipped, keeping a
+        non-unique uuid index, until the duplicates are removed by hand.
+
+        Returns
+        -------
+        list
+            Names of the collections skipped.
+        """
+        skipped = []
+        for collection in [self.strategy_collection, self.strategy_results_collection, self.strategy_trades_collection]:
+            if not self._create_unique_uuid_index(collection):
+                skipped.append(collection.name)
+        return skipped
+
+    @staticmethod
+    def _create_unique_uuid_index(collection):
+        existing = [(name, info) for name, info in collection.index_information().items()
+                    if [tuple(key) for key in info["key"]] == [("uuid", ASCENDING)]]
+        if any(info.get("unique", False) for _, info in existing):
+            return True
+        duplicates = list(collection.aggregate([
+            {"$group": {"_id": "$uuid", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 5}
+        ]))
+        if len(duplicates) > 0:
+            print(f"Skipped the unique uuid index of {collection.name}, it holds duplicate uuids, e.g. "
+                  f"{[item['_id'] for item in duplicates]}. Remove them and restart to create it.")
+            collection.create_index([("uuid", ASCENDING)])
+            return False
+        for name, _ in existing:
+            collection.drop_index(name)
+        collection.create_index([("uuid", ASCENDING)], unique=True)
+        return True
+
+    def bump_version(self, name, change=None):
+        """
+        Increments the version of a kind of stored data, e.g. "clusters", "pairs",
+        "strategies" or "prices". Cached figures built from that data are keyed
+        on its version, so a write invalidates them in every worker.
+
+        Parameters
+        ----------
+        name : str
+            Kind of data written.
+        change : dict, optional
+            What was written, passed on to the write listeners, e.g. the run
+            added to the catalog.
+
+        Returns
+        -------
+        int
+            The new version.
+        """
+        version = self.versions_collection.find_one_and_update(
+            {"_id": name}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER)["version"]
+        for listener in self._write_listeners:
+            listener(name, version, change)
+        return version
+
+    def add_write_listener(self, listener):
+        """
+        Registers listener(name, version, change), called after every bump_version
+        in this process.
+        """
+        self._write_listeners.append(listener)
+
+    def get_versions(self, *names):
+        """
+        Returns
+        -------
+        tuple
+            Current version of every name, 0 if it was never written.
+        """
+        found = {item["_id"]: item["version"] for item in self.versions_collection.find({"_id": {"$in": list(names)}})}
+        return tuple(found.get(name, 0) for name in names)
+
     def post_clustering_results(self, method, start_date, end_date, cluster_dict):
         """
         Post clustering results to MongoDB.
@@ -50,6 +180,7 @@ class MongoConnect:
             "cluster_dict": cluster_dict
         }}
         self.cluster_collection.update_one(criteria, new_data, upsert=True)
+        self.bump_version("clusters", criteria)
 
     def get_clustering_results(self, method, start_date, end_date):
         """
@@ -112,9 +243,15 @@ class MongoConnect:
         """
         return self.cluster_collection.find({}, {"method": 1, "start_date": 1, "end_date": 1, "_id": 0})
     
-    def post_pairs_results(self, method, chosen_cluster, start_date, end_date, pairs):
+    def post_pairs_results(self, method, chosen_cluster, start_date, end_date, pairs, batch_size=10_000):
         """
-        Post pairs results to MongoDB.
+        Post pairs results to MongoDB. Each pair is a row of the pair scores
+        collection under a new run id, inserted in bulk. The run's document in
+        the pairs collection only points at the run id, so its size doesn't grow
+        with the cluster. It is switched to the new run id once every row is
+        written and the rows of the run it replaces are deleted after, so
+        readers never see a partial run. The switch only happens if no other
+        post of the same run switched it in the meantime.
 
         Parameters
         ----------
@@ -126,24 +263,141 @@ class MongoConnect:
             Start date.
         end_date : str
             End date.
-        pairs : list
-            List of pairs.
-        """
+        pairs : dict
+            {"T1:T2": {"coint": ..., "stationary": ..., "mean_reversion": ...}}.
+        batch_size : int
+            Rows per insert_many.
 
+        Returns
+        -------
+        str
+            Run id, None if a concurrent post of the same run was stored instead.
+        """
+        run_id = self._insert_pair_scores(pairs, batch_size)
         criteria = {
             "method": method,
             "chosen_cluster": chosen_cluster,
             "start_date": start_date,
             "end_date": end_date
         }
-        new_data = { "$set": {
-            "method": method,
-            "chosen_cluster": chosen_cluster,
-            "start_date": start_date,
-            "end_date": end_date,
-            "pairs": pairs
-        }}
-        self.pairs_collection.update_one(criteria, new_data, upsert=True)
+        if not self._swap_pair_run(criteria, run_id, len(pairs)):
+            return None
+        self.bump_version("pairs", criteria)
+        return run_id
+
+    def migrate_pair_results(self, batch_size=10_000):
+        """
+        Moves the scores of pair runs stored as a single document, from before
+        pair scores had their own collection, to rows of the pair scores
+        collection. The scores don't change so the pairs version isn't bumped.
+        Run once at startup, see utils.startup.run_migrations.
+
+        Returns
+        -------
+        int
+            Number of runs migrated.
+        """
+        count = 0
+        for run in self.pairs_collection.find({"pairs": {"$exists": True}}, {"_id": 0, "method": 1, "chosen_cluster": 1, "start_date": 1, "end_date": 1, "pairs": 1}):
+            pairs = run.pop("pairs")
+            if self._swap_pair_run(run, self._insert_pair_scores(pairs, batch_size), len(pairs)):
+                count += 1
+        return count
+
+    def _insert_pair_scores(self, pairs, batch_size):
+        run_id = uuid4().hex
+        rows = (self._pair_score_row(run_id, key, scores) for key, scores in pairs.items())
+        while True:
+            batch = list(islice(rows, batch_size))
+            if len(batch) == 0:
+                break
+            self.pair_scores_collection.insert_many(batch, ordered=False)
+        return run_id
+
+    def _swap_pair_run(self, criteria, run_id, number_pairs):
+        """
+        Points the run's document at run_id if it still points at the run read
+        here, then deletes the rows of that run. If another post of the same run
+        swapped it first, the rows under run_id are deleted instead.
+
+        Returns
+        -------
+        bool
+            Whether run_id was stored.
+        """
+        previous = self.pairs_collection.find_one(criteria, {"run_id": 1})
+        fields = dict(criteria, run_id=run_id, number_pairs=number_pairs)
+        if previous is None:
+            result = self.pairs_collection.update_one(criteria, {"$setOnInsert": fields}, upsert=True)
+            swapped = result.upserted_id is not None
+        else:
+            # run_id None also matches the documents that only hold "pairs"
+            result = self.pairs_collection.update_one({"_id": previous["_id"], "run_id": previous.get("run_id")},
+                                                      {"$set": fields, "$unset": {"pairs": ""}})
+            swapped = result.matched_count == 1
+        if not swapped:
+            self.pair_scores_collection.delete_many({"run_id": run_id})
+        elif previous is not None and previous.get("run_id") is not None:
+            self.pair_scores_collection.delete_many({"run_id": previous["run_id"]})
+        return swapped
+
+    @staticmethod
+    def _pair_score_row(run_id, key, scores):
+        ticker_1, ticker_2 = key.split(':')
+        row = {"run_id": run_id, "ticker_1": ticker_1, "ticker_2": ticker_2}
+        for score in PAIR_SCORES:
+            value = scores.get(score)
+            row[score] = float(value) if value is not None else None
+        return row
+
+    def query_pair_scores(self, method, chosen_cluster, start_date, end_date, sort_by=None, ascending=True,
+                          max_scores=None, skip=0, limit=0):
+        """
+        Scores of a pair identification run, sorted and filtered by the database.
+
+        Parameters
+        ----------
+        method, chosen_cluster, start_date, end_date : str
+            The run, as in post_pairs_results.
+        sort_by : str, optional
+            "coint", "stationary" or "mean_reversion". Unsorted rows come in no
+            particular order.
+        ascending : bool
+            Sort direction.
+        max_scores : dict, optional
+            Score name to the largest value kept, e.g. {"coint": 0.05}.
+        skip, limit : int
+            Rows to skip and the most rows returned, 0 for all.
+
+        Returns
+        -------
+        pymongo.cursor.Cursor
+            Rows with ticker_1, ticker_2 and the three scores.
+        """
+        run = self.pairs_collection.find_one({"method": method, "chosen_cluster": chosen_cluster, "start_date": start_date, "end_date": end_date},
+                                             {"run_id": 1, "pairs": 1})
+        if run is None:
+            return iter([])
+        if "pairs" in run:
+            # Stored as a single document by an earlier version, not migrated yet
+            return self._legacy_pair_scores(run["pairs"], sort_by, ascending, max_scores, skip, limit)
+        query = {"run_id": run["run_id"]}
+        for score, cutoff in (max_scores or {}).items():
+            query[score] = {"$lte": cutoff}
+        cursor = self.pair_scores_collection.find(query, {"_id": 0, "run_id": 0})
+        if sort_by is not None:
+            cursor = cursor.sort(sort_by, ASCENDING if ascending else DESCENDING)
+        return cursor.skip(skip).limit(limit)
+
+    @staticmethod
+    def _legacy_pair_scores(pairs, sort_by, ascending, max_scores, skip, limit):
+        rows = [MongoConnect._pair_score_row(None, key, scores) for key, scores in pairs.items()]
+        rows = [row for row in rows if all(row[score] is not None and row[score] <= cutoff for score, cutoff in (max_scores or {}).items())]
+        if sort_by is not None:
+            rows.sort(key=lambda row: (row[sort_by] is not None, row[sort_by]), reverse=not ascending)
+        for row in rows:
+            del row["run_id"]
+        return iter(rows[skip:skip + limit] if limit > 0 else rows[skip:])
 
     def get_pairs_results(self, method, chosen_cluster, start_date, end_date):
         """
@@ -162,10 +416,11 @@ class MongoConnect:
 
         Returns
         -------
-        list
-            List of pairs.
+        dict
+            {"T1:T2": {"coint": ..., "stationary": ..., "mean_reversion": ...}}.
         """
-        return self.pairs_collection.find_one({"method": method,"chosen_cluster": chosen_cluster,"start_date": start_date,"end_date": end_date})["pairs"]
+        return {f"{row['ticker_1']}:{row['ticker_2']}": {score: row.get(score) for score in PAIR_SCORES}
+                for row in self.query_pair_scores(method, chosen_cluster, start_date, end_date)}
     
     def get_all_pairs_results(self):
         """
@@ -178,17 +433,59 @@ class MongoConnect:
         """
         return self.pairs_collection.find({}, {"method": 1, "chosen_cluster": 1, "start_date": 1, "end_date": 1, "_id": 0})
     
-    def post_strategy(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades):
+    def post_strategy(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades, summary=None):
         """
-        Posts list of trades to MongoDB.
+        Posts list of trades to MongoDB. If summary metrics are given they are
+        stored next to the results together with the strategy parameters they
+        are filtered on.
+
+        The strategy is queued on the connection's StrategyWriter, which writes
+        the parameters, results and trades of every queued strategy with one
+        bulk_write per collection once 500 are queued or 5 seconds have passed.
         """
-        self.post_strategy_parameters(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades)
-        self.post_strategy_results(uuid, results)
-        self.post_strategy_trades(uuid, trades)
+        self.get_shared_strategy_writer().post_strategy(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade,
+                                                        hyperparameters, uuid, results, trades, summary=summary)
 
-    def post_strategy_parameters(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades):
-        
-        criteria = {
+    def get_shared_strategy_writer(self):
+        """
+        The StrategyWriter behind post_strategy, started on first use and
+        flushed when the connection is closed or the process exits.
+        """
+        with self._strategy_writer_lock:
+            if self._strategy_writer is None:
+                self._strategy_writer = StrategyWriter(self)
+                atexit.register(self._strategy_writer.close)
+            return self._strategy_writer
+
+    def get_strategy_writer(self, max_buffer=500, flush_interval=5.0):
+        """
+        Buffered writer for posting many strategies, e.g. in a parameter sweep.
+        See data_loader.strategy_writer.StrategyWriter.
+        """
+        return StrategyWriter(self, max_buffer=max_buffer, flush_interval=flush_interval)
+
+    def flush_strategies(self):
+        """
+        Writes the strategies queued by post_strategy now.
+        """
+        with self._strategy_writer_lock:
+            writer = self._strategy_writer
+        return writer.flush() if writer is not None else 0
+
+    def close(self):
+        """
+        Writes the queued strategies and closes the client.
+        """
+        with self._strategy_writer_lock:
+            writer, self._strategy_writer = self._strategy_writer, None
+        if writer is not None:
+            atexit.unregister(writer.close)
+            writer.close()
+        self.client.close()
+
+    @staticmethod
+    def _build_strategy_summary(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, metrics):
+        summary = {
             "ticker_1": ticker_1,
             "ticker_2": ticker_2,
             "method": method,
@@ -196,7 +493,29 @@ class MongoConnect:
             "end_training_date": end_training_date,
             "start_date_trade": start_date_trade,
             "end_date_trade": end_date_trade,
-            "hyperparameters": hyperparameters,
+        }
+        summary.update(metrics)
+        return summary
+
+    def post_strategy_parameters(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades):
+        criteria, new_data = self.strategy_parameters_update(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid)
+        self.strategy_collection.update_one(criteria, new_data, upsert=True)
+
+    def post_strategy_results(self, uuid, results, summary=None):
+        criteria, new_data = self.strategy_results_update(uuid, results, summary)
+        self.strategy_results_collection.update_one(criteria, new_data, upsert=True)
+
+    def post_strategy_trades(self, uuid, trades):
+        criteria, new_data = self.strategy_trades_update(uuid, trades)
+        self.strategy_trades_collection.update_one(criteria, new_data, upsert=True)
+
+    @staticmethod
+    def strategy_parameters_update(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid):
+        """
+        Upsert criteria and update for a strategy's parameters. We match on the
+        uniquely indexed uuid only, never on the hyperparameter dict.
+        """
+        criteria = {
             "uuid": uuid
         }
         new_data = { "$set": {
@@ -210,10 +529,10 @@ class MongoConnect:
             "hyperparameters": hyperparameters,
             "uuid": uuid
         }}
-        self.strategy_collection.update_one(criteria, new_data, upsert=True)
-
-    def post_strategy_results(self, uuid, results):
+        return criteria, new_data
 
+    @staticmethod
+    def strategy_results_update(uuid, results, summary=None):
         criteria = {
             "uuid": uuid
         }
@@ -221,9 +540,12 @@ class MongoConnect:
             "uuid": uuid,
             "results": results
         }}
-        self.strategy_results_collection.update_one(criteria, new_data, upsert=True)
+        if summary is not None:
+            new_data["$set"]["summary"] = summary
+        return criteria, new_data
 
-    def post_strategy_trades(self, uuid, trades):
+    @staticmethod
+    def strategy_trades_update(uuid, trades):
         criteria = {
             "uuid": uuid,
         }
@@ -231,8 +553,8 @@ class MongoConnect:
             "uuid": uuid,
             "trades": trades
         }}
-        self.strategy_trades_collection.update_one(criteria, new_data, upsert=True)
-        
+        return criteria, new_data
+
     def query_specific_strategy(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade):
         criteria = {
             "ticker_1": ticker_1,
@@ -246,9 +568,86 @@ class MongoConnect:
         return [item["uuid"] for item in self.strategy_collection.find(criteria, {"uuid": 1})]
 
 
-    def query_most_profitable(self, top_k):
-        # Sort by profit in descending order and limit to top K results
-        return [item["uuid"] for item in self.strategy_results_collection.find({}, {"uuid": 1}).sort("results.growth", -1).limit(top_k)]
+    def query_strategy_summaries(self, criteria=None, sort_by="growth", top_k=None, ascending=False):
+        """
+        Rank and filter stored strategies on their summary metrics.
+
+        Parameters
+        ----------
+        criteria : dict, optional
+            Filter on summary fields, e.g. {"method": "OLSRegression", "sharpe": {"$gt": 0}}.
+        sort_by : str
+            Summary field to sort on, one of growth, sharpe, max_drawdown, number_trades etc.
+        top_k : int, optional
+            Maximum number of strategies to return.
+        ascending : bool
+            Sort direction.
+
+        Returns
+        -------
+        list
+            Documents of the form {"uuid": ..., "summary": {...}}.
+        """
+        criteria = {f"summary.{key}": value for key, value in (criteria or {}).items()}
+        cursor = self.strategy_results_collection.find(criteria, {"uuid": 1, "summary": 1, "_id": 0})
+        cursor = cursor.sort(f"summary.{sort_by}", ASCENDING if ascending else DESCENDING)
+        if top_k is not None:
+            cursor = cursor.limit(top_k)
+        return list(cursor)
+
+    def get_strategy_summaries(self, uuids):
+        """
+        Summary metrics for a list of strategies in a single query.
+
+        Returns
+        -------
+        dict
+            uuid to summary, strategies without a summary are left out.
+        """
+        cursor = self.strategy_results_collection.find({"uuid": {"$in": list(uuids)}, "summary": {"$exists": True}}, {"uuid": 1, "summary": 1, "_id": 0})
+        return {item["uuid"]: item["summary"] for item in cursor}
+
+    def backfill_strategy_summaries(self, summarise, risk_free_rate, target_return, batch_size=500):
+        """
+        Writes summaries for strategies stored before summaries existed, or
+        whose summary was computed with other rates. Run once at startup, see
+        utils.startup.run_migrations.
+
+        Strategies are read batch_size at a time with query_uuids and their
+        summaries written with one bulk_write per batch.
+
+        Parameters
+        ----------
+        summarise : callable
+            Takes (parameters, results, trades) documents and the two rates and
+            returns the summary metrics.
+        risk_free_rate : float
+            Risk-free rate of the Sharpe and Sortino ratios.
+        target_return : float
+            Target return of the Sortino ratio.
+        batch_size : int
+            Strategies read and written per round trip.
+        """
+        count = 0
+        criteria = {"$or": [{"summary.risk_free_rate": {"$ne": risk_free_rate}}, {"summary.target_return": {"$ne": target_return}}]}
+        # Read up front, the cursor would otherwise run over the documents being updated
+        uuids = [item["uuid"] for item in self.strategy_results_collection.find(criteria, {"uuid": 1, "_id": 0})]
+        for start in range(0, len(uuids), batch_size):
+            updates = []
+            for uuid, stored in self.query_uuids(uuids[start:start + batch_size]).items():
+                parameters, results, trades = stored["data"], stored["portfolio"], stored["trades"]
+                if parameters is None or results is None:
+                    continue
+                summary = self._build_strategy_summary(
+                    parameters["ticker_1"], parameters["ticker_2"], parameters["method"], parameters["start_training_date"], parameters["end_training_date"],
+                    parameters["start_date_trade"], parameters["end_date_trade"], summarise(parameters, results, trades, risk_free_rate, target_return))
+                updates.append(UpdateOne({"uuid": uuid}, {"$set": {"summary": summary}}))
+            if len(updates) > 0:
+                self.strategy_results_collection.bulk_write(updates, ordered=False)
+                count += len(updates)
+        if count > 0:
+            self.bump_version("strategies")
+        return count
     
     def query_by_tickers(self, ticker_1, ticker_2):
         criteria = {
@@ -269,4 +668,41 @@ class MongoConnect:
         criteria = {
             "uuid": uuid
         }
-        return self.strategy_collection.find(criteria),self.strategy_results_collection.find(criteria),self.strategy_trades_collection.find(criteria)
\ No newline at end of file
+        return self.strategy_collection.find(criteria),self.strategy_results_collection.find(criteria),self.strategy_trades_collection.find(criteria)
+
+    def query_uuids(self, uuids, parameters_projection=None, results_projection=None, trades_projection=None, collections=("data", "portfolio", "trades")):
+        """
+        Batched version of query_uuid. Each collection is resolved with a single
+        $in query rather than one query per uuid.
+
+        Parameters
+        ----------
+        uuids : list
+            Strategy uuids to retrieve.
+        parameters_projection, results_projection, trades_projection : dict, optional
+            Fields to return from strategy_parameters, strategy_results and
+            strategy_trades, e.g. {"results.historic_pnl": 1}. uuid is always included.
+        collections : tuple
+            Which of "data", "portfolio" and "trades" to retrieve.
+
+        Returns
+        -------
+        dict
+            uuid to {"data": ..., "portfolio": ..., "trades": ...}, in the order of uuids.
+            Missing documents are None.
+        """
+        uuids = list(dict.fromkeys(uuids))
+        res_dict = {uuid: {"data": None, "portfolio": None, "trades": None} for uuid in uuids}
+        sources = [
+            ("data", self.strategy_collection, parameters_projection),
+            ("portfolio", self.strategy_results_collection, results_projection),
+            ("trades", self.strategy_trades_collection, trades_projection),
+        ]
+        for name, collection, projection in sources:
+            if name not in collections:
+                continue
+            if projection is not None:
+                projection = dict(projection, uuid=1)
+            for item in collection.find({"uuid": {"$in": uuids}}, projection):
+                res_dict[item["uuid"]][name] = item
+        return res_dict
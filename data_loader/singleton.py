@@ -1,25 +1,66 @@
+import os
+
 from data_loader.get_data import GetStockData
 from data_loader.misc_connect import MongoConnect
 from data_loader.data_loader import SetStockData
 
 
 class DatabaseConnection:
+    """
+    The connectors of this process. MongoClients are not fork-safe, so a process
+    forked after the connection was made, e.g. a gunicorn worker, opens its own
+    on first use with the same settings instead of using the parent's.
+    """
     _instance = None
+    _settings = None
     
-    def __new__(cls, mongo_url):
-        if cls._instance is None:
+    def __new__(cls, mongo_url, db_name="equity_data"):
+        cls._settings = (mongo_url, db_name)
+        if cls._instance is None or cls._instance.pid != os.getpid():
             cls._instance = super(DatabaseConnection, cls).__new__(cls)
-            cls._instance.data_setter = SetStockData(mongo_url=mongo_url)
-            cls._instance.misc_connect = MongoConnect(mongodb_url=mongo_url)
-            cls._instance.data_fetcher = GetStockData(cls._instance.data_setter, mongo_url=mongo_url)
+            cls._instance.pid = os.getpid()
+            cls._instance.data_setter = SetStockData(db_name=db_name, mongo_url=mongo_url)
+            cls._instance.misc_connect = MongoConnect(mongodb_url=mongo_url, db_name=db_name)
+            cls._instance.data_fetcher = GetStockData(cls._instance.data_setter, db_name=db_name, mongo_url=mongo_url)
 
         return cls._instance
 
+    @classmethod
+    def get(cls):
+        if cls._settings is None:
+            raise Exception("DatabaseConnection has not been created.")
+        return cls(*cls._settings)
+
+    @classmethod
+    def close(cls):
+        """
+        Closes this process's clients, e.g. in the parent before forking workers.
+        The settings are kept, so the next get() reconnects.
+        """
+        if cls._instance is not None and cls._instance.pid == os.getpid():
+            cls._instance.misc_connect.close()
+            for connector in [cls._instance.data_setter, cls._instance.data_fetcher]:
+                connector.client.close()
+        cls._instance = None
+
+class LazyConnector:
+    """
+    Module-level stand-in for a connector, e.g. data_fetcher = LazyConnector(get_data_fetcher).
+    The connector is looked up on first attribute access, so modules can be imported
+    before DatabaseConnection is created.
+    """
+    def __init__(self, getter):
+        self._getter = getter
+
+    def __getattr__(self, name):
+        return getattr(self._getter(), name)
+
+
 def get_misc_connect():
-    return DatabaseConnection._instance.misc_connect
+    return DatabaseConnection.get().misc_connect
 
 def get_data_setter():
-    return DatabaseConnection._instance.data_setter
+    return DatabaseConnection.get().data_setter
 
 def get_data_fetcher():
-    return DatabaseConnection._instance.data_fetcher
\ No newline at end of file
+    return DatabaseConnection.get().data_fetcher
\ No newline at end of file
@@ -0,0 +1,104 @@
+from pymongo import UpdateOne
+from threading import Event, Lock, Thread
+from time import monotonic
+
+
+class StrategyWriter:
+    """
+    Buffers strategy posts and writes them to MongoDB with one bulk_write per
+    collection instead of three update_one round trips per backtest.
+
+    The buffer is flushed once it holds max_buffer strategies, or by a
+    background thread once flush_interval seconds have passed since the last
+    flush. Every write is an upsert on the uniquely indexed uuid, so replaying
+    a batch after a failure is idempotent.
+
+    MongoConnect.post_strategy queues on a writer shared by the connection. A
+    parameter sweep can use its own, with thresholds suited to it, and pass it
+    to Strategy.post_trades in place of the connection:
+
+        with misc_connect.get_strategy_writer() as writer:
+            for strategy in strategies:
+                strategy.post_trades(writer)
+    """
+    def __init__(self, misc_connect, max_buffer=500, flush_interval=5.0):
+        self.misc_connect = misc_connect
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+
+        self._lock = Lock()
+        self._parameters, self._results, self._trades = [], [], []
+        self._last_flush = monotonic()
+
+        self._closed = Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def post_strategy(self, ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid, results, trades, summary=None):
+        """
+        Queues the three upserts for a strategy, flushing if the buffer is full.
+        """
+        if self._closed.is_set():
+            raise Exception("StrategyWriter is closed.")
+        m = self.misc_connect
+        if summary is not None:
+            summary = m._build_strategy_summary(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, summary)
+        parameters = UpdateOne(*m.strategy_parameters_update(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade, hyperparameters, uuid), upsert=True)
+        results = UpdateOne(*m.strategy_results_update(uuid, results, summary), upsert=True)
+        trades = UpdateOne(*m.strategy_trades_update(uuid, trades), upsert=True)
+
+        with self._lock:
+            self._parameters.append(parameters)
+            self._results.append(results)
+            self._trades.append(trades)
+            full = len(self._parameters) >= self.max_buffer
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything buffered so far. Returns the number of strategies written.
+        """
+        with self._lock:
+            parameters, results, trades = self._parameters, self._results, self._trades
+            self._parameters, self._results, self._trades = [], [], []
+            self._last_flush = monotonic()
+        if len(parameters) == 0:
+            return 0
+        m = self.misc_connect
+        try:
+            m.strategy_collection.bulk_write(parameters, ordered=False)
+            m.strategy_results_collection.bulk_write(results, ordered=False)
+            m.strategy_trades_collection.bulk_write(trades, ordered=False)
+        except Exception:
+            # Upserts are idempotent, so put the batch back to be retried in full
+            with self._lock:
+                self._parameters[:0], self._results[:0], self._trades[:0] = parameters, results, trades
+            raise
+        m.bump_version("strategies")
+        return len(parameters)
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            if monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Strategy flush failed, retrying on the next flush: {e}")
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,199 @@
+import re
+import time
+from bisect import bisect_left
+from threading import Lock, Thread, Event
+
+from data_loader.singleton import get_data_fetcher, LazyConnector
+from data_loader.catalog import get_catalog
+
+
+class TickerSearchIndex:
+    def __init__(self, data_fetcher, max_results=20, refresh_interval=3600, catalog=None):
+        """
+        Server-side search over ticker symbols and company names for the ticker
+        dropdowns. The dropdowns only hold the options matching what is typed, so
+        page layouts no longer embed the whole universe.
+
+        Symbols and the words of every name are kept sorted for prefix lookups by
+        bisection, and every symbol + name string is indexed by its trigrams for
+        substring matches. The index is built once from two queries and rebuilt in
+        a background thread every refresh_interval seconds; searches always see a
+        complete snapshot.
+
+        Parameters
+        ----------
+        data_fetcher : GetStockData
+            Source of the tickers and their longName.
+        max_results : int
+            Options returned per search.
+        refresh_interval : float
+            Seconds between background rebuilds, None to never refresh.
+        catalog : Catalog, optional
+            Source of the ticker list, read from data_fetcher if None.
+        """
+        self.data_fetcher = data_fetcher
+        self.max_results = max_results
+        self.refresh_interval = refresh_interval
+        self.catalog = catalog
+        self._snapshot = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def build(self):
+        """
+        Reads the tickers and their names and swaps in a new index.
+        """
+        tickers = self.catalog.tickers() if self.catalog is not None else self.data_fetcher.get_ticker_names()
+        long_names = self.data_fetcher.get_ticker_long_names()
+        names = [long_names.get(ticker) or ticker for ticker in tickers]
+
+        symbols = sorted((ticker.upper(), i) for i, ticker in enumerate(tickers))
+        words = sorted((word, i) for i, name in enumerate(names) for word in set(self.tokenize(name)))
+        trigrams = {}
+        for i, (ticker, name) in enumerate(zip(tickers, names)):
+            for trigram in self.trigrams(f"{ticker} {name}".lower()):
+                trigrams.setdefault(trigram, set()).add(i)
+
+        snapshot = {
+            "tickers": tickers,
+            "names": names,
+            "ids": {ticker: i for i, ticker in enumerate(tickers)},
+            "symbols": symbols,
+            "symbol_keys": [symbol for symbol, _ in symbols],
+            "words": words,
+            "word_keys": [word for word, _ in words],
+            "trigrams": trigrams,
+            "built": time.time(),
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return self
+
+    def start(self):
+        """
+        Builds the index in a background thread, unless build() was already called,
+        then keeps refreshing it.
+        """
+        if self._thread is None:
+            self._thread = Thread(target=self._refresh_loop, name="ticker-search", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_ready(self):
+        return self._snapshot is not None
+
+    def search(self, query, limit=None):
+        """
+        Ranked tickers matching query: exact symbol, then symbol prefix, then
+        name word prefix, then substring of symbol or name. Ties are broken
+        alphabetically.
+
+        Returns
+        -------
+        list
+            At most limit (max_results by default) ticker symbols.
+        """
+        snapshot = self._get_snapshot()
+        limit = limit or self.max_results
+        query = (query or "").strip()
+        if not query or snapshot is None:
+            return []
+        ranks = {}
+
+        upper = query.upper()
+        exact = snapshot["ids"].get(upper, snapshot["ids"].get(query))
+        if exact is not None:
+            ranks[exact] = 0
+        for i in self._prefix(snapshot["symbol_keys"], snapshot["symbols"], upper):
+            ranks.setdefault(i, 1)
+        for word in self.tokenize(query)[:1]:
+            for i in self._prefix(snapshot["word_keys"], snapshot["words"], word):
+                ranks.setdefault(i, 2)
+        if len(query) >= 3:
+            for i in self._substring(snapshot, query.lower()):
+                ranks.setdefault(i, 3)
+
+        tickers = snapshot["tickers"]
+        ranked = sorted(ranks, key=lambda i: (ranks[i], tickers[i]))
+        return [tickers[i] for i in ranked[:limit]]
+
+    def options(self, tickers):
+        """
+        Dropdown options for tickers, labelled by symbol and searchable by name.
+        """
+        snapshot = self._get_snapshot()
+        options = []
+        for ticker in tickers or []:
+            name = ticker
+            if snapshot is not None and ticker in snapshot["ids"]:
+                name = snapshot["names"][snapshot["ids"][ticker]]
+            options.append({'label': ticker, 'value': ticker, 'search': f"{ticker}:{name}"})
+        return options
+
+    def search_options(self, query, selected=None):
+        """
+        Options for a dropdown's search_value, keeping the selected values first so
+        the dropdown can still display them.
+        """
+        if isinstance(selected, str):
+            selected = [selected]
+        selected = list(selected or [])
+        matches = [ticker for ticker in self.search(query) if ticker not in selected]
+        return self.options(selected + matches)
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"[a-z0-9]+", text.lower())
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _get_snapshot(self):
+        with self._lock:
+            return self._snapshot
+
+    @staticmethod
+    def _prefix(keys, entries, prefix):
+        for k in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[k].startswith(prefix):
+                break
+            yield entries[k][1]
+
+    def _substring(self, snapshot, query):
+        candidates = None
+        for trigram in self.trigrams(query):
+            ids = snapshot["trigrams"].get(trigram)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+        # Trigrams match in any order, so confirm the substring
+        tickers, names = snapshot["tickers"], snapshot["names"]
+        return [i for i in candidates if query in f"{tickers[i]} {names[i]}".lower()]
+
+    def _refresh_loop(self):
+        # Built before a fork, the first refresh can wait
+        if self._snapshot is not None:
+            if self.refresh_interval is None or self._stop.wait(self.refresh_interval):
+                return
+        while True:
+            try:
+                self.build()
+            except Exception as e:
+                print(f"Ticker search index refresh failed: {e}")
+            if self.refresh_interval is None or self._stop.wait(self.refresh_interval):
+                return
+
+
+_ticker_search = None
+
+def get_ticker_search():
+    global _ticker_search
+    if _ticker_search is None:
+        # Resolved on use, the index is created before the workers fork
+        _ticker_search = TickerSearchIndex(LazyConnector(get_data_fetcher), catalog=LazyConnector(get_catalog))
+    return _ticker_search
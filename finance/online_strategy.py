@@ -26,6 +26,7 @@ class OnlineRegressionStrategy(Strategy):
         self.time_series_2 = self.ts[self.ts["Mode"] == "Train"][self.ticker_2]
 
         self.count = len(self.time_series_1.index)
+        self.last_date = None
 
         if method == 'KalmanRegression':
             self.method = KalmanRegression(self.time_series_1, self.time_series_2, 
@@ -89,55 +90,68 @@ class OnlineRegressionStrategy(Strategy):
         self.update_threshold(observation)
     
     def trade_model(self):
-        
-        portfolio_value = self.capital
         observations = self.ts[self.ts["Mode"] == "Trade"][[self.ticker_1, self.ticker_2]].values
         dates = self.ts[self.ts["Mode"] == "Trade"].index
         for indx, observation in enumerate(observations):
-            if observation is None:
-                continue
-            if observation[0] is None or observation[1] is None:
-                continue
-            if isnan(observation[0]) or isnan(observation[1]):
-                continue
-            self.store_results([
-                    self.threshold_normal_buy,
-                    self.threshold_swapped_buy,
-                    self.threshold_normal_sell_low,
-                    self.threshold_swapped_sell_low,
-                    self.threshold_normal_sell_high,
-                    self.threshold_swapped_sell_high,
-                    self.method.get_spread(observation),
-            ])
-            date = dates[indx]
-            observation = (observation[0], observation[1])
-            if self.cur_pos == 0:
-                buy_1, buy_2 = self.buy_condition(observation)
-                if buy_1 and not buy_2:
-                    self.cur_pos = 1
-
-                elif buy_2 and not buy_1:
-                    self.cur_pos = -1
-
-                if buy_1 or buy_2:
-                    self.execute_trade(date, self.method.cur_beta)
-                    self.trade_open_date = date
-            else:
-                sell = self.sell_condition(observation)
-                if sell:
-                    self.exit_position(date)
-                    self.trade_open_date = None
-                    self.cur_pos = 0
-            self.portfolio.store_results(date)
-            portfolio_value = self.portfolio.portfolio_value
-            if portfolio_value < 0:
-                print("Portfolio value is negative. You're broken. Exiting.")
+            if not self.trade_observation(dates[indx], observation):
                 break
-            self.update_model(observation)
+        self.close_positions()
+
+    def trade_observation(self, date, observation):
+        """
+        Trades and updates the model on one day of the trading period. Missing
+        observations are skipped.
+
+        Returns
+        -------
+        bool
+            False once the portfolio value turns negative and trading must stop.
+        """
+        if observation is None:
+            return True
+        if observation[0] is None or observation[1] is None:
+            return True
+        if isnan(observation[0]) or isnan(observation[1]):
+            return True
+        self.store_results([
+                self.threshold_normal_buy,
+                self.threshold_swapped_buy,
+                self.threshold_normal_sell_low,
+                self.threshold_swapped_sell_low,
+                self.threshold_normal_sell_high,
+                self.threshold_swapped_sell_high,
+                self.method.get_spread(observation),
+        ])
+        self.last_date = date
+        observation = (observation[0], observation[1])
+        if self.cur_pos == 0:
+            buy_1, buy_2 = self.buy_condition(observation)
+            if buy_1 and not buy_2:
+                self.cur_pos = 1
+
+            elif buy_2 and not buy_1:
+                self.cur_pos = -1
+
+            if buy_1 or buy_2:
+                self.execute_trade(date, self.method.cur_beta)
+                self.trade_open_date = date
+        else:
+            sell = self.sell_condition(observation)
+            if sell:
+                self.exit_position(date)
+                self.trade_open_date = None
+                self.cur_pos = 0
+        self.portfolio.store_results(date)
+        if self.portfolio.portfolio_value < 0:
+            print("Portfolio value is negative. You're broken. Exiting.")
+            return False
+        self.update_model(observation)
+        return True
 
+    def close_positions(self):
         if self.cur_pos != 0:
             # Close out of all positions at the end of the trading period
-            self.exit_position(date)
+            self.exit_position(self.last_date)
             self.trade_open_date = None
             self.cur_pos = 0
 
@@ -2,6 +2,10 @@
 
 import numpy as np
 
+# Defaults of the trade explorer's sliders, stored summaries are computed with them
+DEFAULT_RISK_FREE_RATE = 0.01
+DEFAULT_TARGET_RETURN = 0.01
+
 class PostTradeMetrics:
     def __init__(self, ticker_1, ticker_2, start_date, end_date):
         self.ticker_1 = ticker_1
@@ -14,6 +18,7 @@ class PostTradeMetrics:
         self.starting_capital = starting_capital
         if isinstance(daily_pnl, list):
             daily_pnl = np.array(daily_pnl)
+        self.length = len(daily_pnl)
         self._set_return_series(daily_pnl)
         self.pnl = pnl
         self.growth = growth
@@ -75,47 +80,249 @@ class PostTradeMetrics:
 
         return (mean_return - d_rr) / downside_deviation
     
-    def historic_sharpe_ratio(self, rr=0.1):
-        sharpe_ratios = [0, 0]
+    def summarise(self, rr=DEFAULT_RISK_FREE_RATE, target_return=DEFAULT_TARGET_RETURN):
+        """
+        Compact summary of the strategy, stored next to its results so that
+        ranking and filtering never needs the full time series.
 
-        for indx in range(2, len(self.return_series)): # Start from 2 to avoid std = 2
-            sharpe_ratios.append(self.calculate_sharpe_ratio(rr, self.return_series[:indx]))
+        Returns
+        -------
+        dict
+            Final metrics along with the return moments and the rates they were
+            built from.
+        """
+        n = len(self.return_series)
+        return {
+            "growth": float(self.growth),
+            "pnl": float(self.pnl),
+            "sharpe": float(self.calculate_sharpe_ratio(rr)) if n > 0 else 0.0,
+            "sortino": float(self.calculate_sortino_ratio(rr, target_return)) if n > 0 else 0.0,
+            "calmar": float(self.calculate_calmar_ratio()) if n > 0 else 0.0,
+            "max_drawdown": float(self.calculate_max_drawdown()) if n > 0 else 0.0,
+            "mean_return": float(np.mean(self.return_series)) if n > 0 else 0.0,
+            "std_return": float(np.std(self.return_series)) if n > 0 else 0.0,
+            "number_trades": len(getattr(self, "closed_trades", {}) or {}),
+            "length": self.length,
+            "risk_free_rate": rr,
+            "target_return": target_return,
+        }
 
-        return sharpe_ratios
+    def historic_metrics(self, rr=0.1, target_return=0.0):
+        """
+        Computes the expanding-window Sharpe, max drawdown, Calmar and Sortino
+        curves in a single O(T) pass over the return series.
+
+        Returns
+        -------
+        dict
+            Keys "sharpe", "max_drawdown", "calmar" and "sortino", each an array
+            where entry i is the metric over returns_series[:i+1].
+        """
+        return expanding_metrics(self.return_series, rr, target_return)
+
+    def historic_sharpe_ratio(self, rr=0.1):
+        return sharpe_history(expanding_sharpe_ratio(self.return_series, rr)).tolist()
     
     def historic_calmar_ratio(self):
-        calmar_ratios = []
+        return expanding_calmar_ratio(self.return_series).tolist()
 
-        for indx in range(1, len(self.return_series) + 1):
-            calmar_ratios.append(self.calculate_calmar_ratio(self.return_series[:indx]))
+    def historic_sortino_ratio(self, rr=0.1, target_return=0.0):
+        return expanding_sortino_ratio(self.return_series, rr, target_return).tolist()
 
-        return calmar_ratios
+    def historic_max_drawdown(self):
+        return expanding_max_drawdown(self.return_series).tolist()
+    
+    def _set_return_series(self, daily_pnl):
+        """
+        Returns the return series of the strategy.
+        """
+        self.return_series = pnl_to_returns(daily_pnl)
 
-    def historic_sortino_ratio(self, rr=0.1, target_return=0.0):
-        sortino_ratios = []
 
-        for indx in range(1, len(self.return_series) + 1):
-            sortino_ratios.append(self.calculate_sortino_ratio(rr, target_return, self.return_series[:indx],))
+def summarise_stored_strategy(parameters, results, trades, rr=DEFAULT_RISK_FREE_RATE, target_return=DEFAULT_TARGET_RETURN):
+    """
+    Summary metrics for a strategy read back from MongoDB, used to backfill
+    summaries for strategies posted before they were stored.
+    """
+    post_trade = PostTradeMetrics(parameters["ticker_1"], parameters["ticker_2"], parameters["start_date_trade"], parameters["end_date_trade"])
+    post_trade.initialise_portfolio(results["results"]["starting_capital"], results["results"]["historic_pnl"], results["results"]["pnl"], results["results"]["growth"])
+    post_trade.initialise_trades(trades["trades"] if trades is not None else {})
+    return post_trade.summarise(rr, target_return)
 
-        return sortino_ratios
 
-    def historic_max_drawdown(self):
-        max_drawdowns = []
+def pnl_to_returns(daily_pnl):
+    """
+    Converts a cumulative PnL history into a daily return series.
+    """
+    daily_pnl = np.asarray(daily_pnl, dtype=float)
+    daily_changes_pnl = np.diff(daily_pnl)
 
-        for indx in range(1, len(self.return_series) + 1):
-            max_drawdowns.append(self.calculate_max_drawdown(self.return_series[:indx]))
+    prev_pnl_nonzero = np.where(daily_pnl[:-1] == 0, 1, daily_pnl[:-1])
 
-        return max_drawdowns
-    
-    def _set_return_series(self, daily_pnl):
+    daily_returns = daily_changes_pnl / prev_pnl_nonzero
+
+    daily_returns[prev_pnl_nonzero == 1] = 0
+    return daily_returns
+
+
+# Expanding-window metrics. Each function works along the last axis, so a single
+# series of shape (T,) or a stack of series of shape (K, T) is accepted, and entry
+# [..., i] always holds the metric computed over the first i+1 returns.
+
+def _expanding_mean_var(returns_series):
+    """
+    Running mean and population variance from cumulative sums. The series is
+    shifted by its mean first so the sum of squares doesn't lose precision.
+    """
+    n = np.arange(1, returns_series.shape[-1] + 1)
+    shift = returns_series.mean(axis=-1, keepdims=True) if returns_series.shape[-1] else 0.0
+    centred = returns_series - shift
+    mean_centred = np.cumsum(centred, axis=-1) / n
+    var = np.cumsum(np.square(centred), axis=-1) / n - np.square(mean_centred)
+    return mean_centred + shift, np.maximum(var, 0)
+
+
+def expanding_sharpe_ratio(returns_series, rr=0.1):
+    returns_series = np.asarray(returns_series, dtype=float)
+    mean, var = _expanding_mean_var(returns_series)
+    std_dev = np.sqrt(var)
+    d_rr = rr / 252 # Assuming 252 trading days in a year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std_dev < 1e-4, 0.0, (mean - d_rr) / std_dev)
+
+
+def sharpe_history(sharpe):
+    """
+    The original layout of the historic Sharpe ratio from an expanding curve:
+    two leading zeros as warm-up, then the Sharpe of prefixes of length 2..T-1,
+    so entry i covers the first i returns rather than i+1.
+    """
+    return np.concatenate([[0.0, 0.0], sharpe[1:len(sharpe) - 1]])
+
+
+def expanding_max_drawdown(returns_series):
+    returns_series = np.asarray(returns_series, dtype=float)
+    cumulative_returns = np.cumprod(1 + returns_series, axis=-1) - 1
+    running_max = np.maximum.accumulate(cumulative_returns, axis=-1)
+    return np.maximum.accumulate(running_max - cumulative_returns, axis=-1)
+
+
+def expanding_calmar_ratio(returns_series, max_drawdown=None):
+    returns_series = np.asarray(returns_series, dtype=float)
+    if max_drawdown is None:
+        max_drawdown = expanding_max_drawdown(returns_series)
+    n = np.arange(1, returns_series.shape[-1] + 1)
+    avg_annual_return = np.cumsum(returns_series, axis=-1) / n * 252 # Assuming 252 trading days in a year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(max_drawdown < 1e-5, 0.0, avg_annual_return / max_drawdown)
+
+
+def expanding_sortino_ratio(returns_series, rr=0.1, target_return=0.0):
+    returns_series = np.asarray(returns_series, dtype=float)
+    d_tr = target_return / 252 # Assuming 252 trading days in a year
+    d_rr = rr / 252 # Assuming 252 trading days in a year
+    n = np.arange(1, returns_series.shape[-1] + 1)
+    mean_return = np.cumsum(returns_series, axis=-1) / n
+
+    # Downside moments only count the returns below target
+    below = returns_series < d_tr
+    downside_count = np.cumsum(below, axis=-1)
+    downside_sq = np.cumsum(np.where(below, np.square(returns_series - d_tr), 0.0), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside_deviation = np.where(downside_count > 0, np.sqrt(downside_sq / np.maximum(downside_count, 1)), 0.0)
+        return np.where(downside_deviation < 1e-5, 0.0, (mean_return - d_rr) / downside_deviation)
+
+
+def expanding_metrics(returns_series, rr=0.1, target_return=0.0):
+    """
+    All four expanding-window curves, sharing the drawdown between Calmar and
+    max drawdown.
+    """
+    returns_series = np.asarray(returns_series, dtype=float)
+    max_drawdown = expanding_max_drawdown(returns_series)
+    return {
+        "sharpe": expanding_sharpe_ratio(returns_series, rr),
+        "max_drawdown": max_drawdown,
+        "calmar": expanding_calmar_ratio(returns_series, max_drawdown),
+        "sortino": expanding_sortino_ratio(returns_series, rr, target_return),
+    }
+
+
+class BatchPostTradeMetrics:
+    """
+    Risk metrics for many stored strategies at once. The return series of K
+    strategies, possibly of different lengths, are packed into a zero-padded
+    (K, T_max) array. Padding sits after each series so it never changes the
+    prefixes, and every metric is computed for all K in one vectorised pass.
+    """
+    def __init__(self, daily_pnls, keys=None):
         """
-        Returns the return series of the strategy.
+        Parameters
+        ----------
+        daily_pnls : dict or list
+            Cumulative PnL histories, keyed by uuid if a dict is passed.
+        keys : list, optional
+            Labels for the rows when daily_pnls is a list.
+        """
+        if isinstance(daily_pnls, dict):
+            keys = list(daily_pnls.keys())
+            daily_pnls = list(daily_pnls.values())
+        elif keys is None:
+            keys = list(range(len(daily_pnls)))
+        self.keys = list(keys)
+
+        return_series = [pnl_to_returns(daily_pnl) for daily_pnl in daily_pnls]
+        self.lengths = np.array([len(returns) for returns in return_series], dtype=int)
+        max_length = int(self.lengths.max()) if len(self.lengths) else 0
+
+        self.return_matrix = np.zeros((len(return_series), max_length))
+        for row, returns in enumerate(return_series):
+            self.return_matrix[row, :len(returns)] = returns
+        # mask[k, i] is True where row k has a real return at position i
+        self.mask = np.arange(max_length) < self.lengths[:, None]
+
+    def historic_metrics(self, rr=0.1, target_return=0.0):
         """
-        daily_changes_pnl = np.diff(daily_pnl)
+        Expanding-window curves for every strategy.
 
-        prev_pnl_nonzero = np.where(daily_pnl[:-1] == 0, 1, daily_pnl[:-1])
+        Returns
+        -------
+        dict
+            Metric name to a (K, T_max) array, NaN past the end of each series.
+        """
+        curves = expanding_metrics(self.return_matrix, rr, target_return)
+        return {name: np.where(self.mask, curve, np.nan) for name, curve in curves.items()}
+
+    def final_metrics(self, rr=0.1, target_return=0.0, curves=None):
+        """
+        Metrics over the full length of each strategy, i.e. the last point of
+        each expanding curve. Strategies with no returns score 0.
 
-        daily_returns = daily_changes_pnl / prev_pnl_nonzero
+        Returns
+        -------
+        dict
+            Metric name to a (K,) array.
+        """
+        if curves is None:
+            curves = self.historic_metrics(rr, target_return)
+        last = np.maximum(self.lengths - 1, 0)
+        rows = np.arange(len(self.keys))
+        finals = {}
+        for name, curve in curves.items():
+            if curve.shape[1] == 0:
+                finals[name] = np.zeros(len(self.keys))
+                continue
+            finals[name] = np.where(self.lengths > 0, curve[rows, last], 0.0)
+        return finals
 
-        daily_returns[prev_pnl_nonzero == 1] = 0
-        self.return_series = daily_returns
\ No newline at end of file
+    def get_curve(self, curves, name, key):
+        """
+        Trimmed curve for a single strategy from the output of historic_metrics,
+        laid out as the matching PostTradeMetrics.historic_* list so it starts
+        and warms up the same way.
+        """
+        row = self.keys.index(key)
+        curve = curves[name][row, :self.lengths[row]]
+        if name == "sharpe":
+            return sharpe_history(curve)
+        return curve
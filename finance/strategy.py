@@ -1,16 +1,31 @@
 from abc import ABC, abstractmethod
 
-from data_loader.singleton import get_data_fetcher
+from data_loader.singleton import get_data_fetcher, LazyConnector
 from analytics.regression import CointegrationTest
 from finance.portfolio_single import SinglePairPortfolio
+from finance.post_trade_analysis import PostTradeMetrics
 
 from uuid import uuid4
 from datetime import datetime
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
-data_fetcher = get_data_fetcher()
+data_fetcher = LazyConnector(get_data_fetcher)
+
+
+def load_pair_series(ticker_1, ticker_2, start_training_date, end_training_date, start_date, end_date):
+    """
+    Close prices of the two tickers over the training and trading periods, indexed
+    by date string with a "Mode" column of "Train" or "Trade".
+    """
+    train_ticker_data = data_fetcher.collate_dataset([ticker_1, ticker_2], start_training_date, end_training_date).pivot(columns='ticker', values='close')
+    train_ticker_data["Mode"] = "Train"
+    trade_ticker_data = data_fetcher.collate_dataset([ticker_1, ticker_2], start_date, end_date).pivot(columns='ticker', values='close')
+    trade_ticker_data["Mode"] = "Trade"
+    ts = pd.concat([train_ticker_data, trade_ticker_data])
+    ts.index = ts.index.strftime('%Y-%m-%d').tolist()
+    return ts
+
 
 class Strategy(ABC):
     def __init__(self, capital, ticker_1, ticker_2, start_training_date, end_training_date, start_date, end_date, hyperparameters = {}, ts=None):        
@@ -60,12 +75,8 @@ class Strategy(ABC):
         """
         Stores the time series data for the two tickers.
         """
-        train_ticker_data = data_fetcher.collate_dataset([self.ticker_1, self.ticker_2], self.start_training_date, self.end_training_date).pivot(columns='ticker', values='close')
-        train_ticker_data["Mode"] = "Train"
-        trade_ticker_data = data_fetcher.collate_dataset([self.ticker_1, self.ticker_2], self.start_date, self.end_date).pivot(columns='ticker', values='close')
-        trade_ticker_data["Mode"] = "Trade"
-        self.ts = pd.concat([train_ticker_data, trade_ticker_data])
-        self.ts.index = self.ts.index.strftime('%Y-%m-%d').tolist()
+        self.ts = load_pair_series(self.ticker_1, self.ticker_2, self.start_training_date, self.end_training_date,
+                                   self.start_date, self.end_date)
 
 
     def execute_trade(self, date, hedge_ratio):
@@ -90,6 +101,7 @@ class Strategy(ABC):
         
         if res.shape[1] != len(labels):
             raise ValueError(f"Number of labels must match number of columns in results ({res.shape[0]}).")
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots()
         for i in range(res.shape[1])[-1:]:
             plt.plot(res[:, i], label=labels[i])
@@ -135,8 +147,18 @@ class Strategy(ABC):
         results = self.portfolio._post_strategy_results()
         m.post_strategy(
             self.ticker_1, self.ticker_2, self.method_name, self.start_training_date, self.end_training_date, self.start_date, self.end_date,
-            self.hyperparameters, uuid, results, self.portfolio.closed_trades
+            self.hyperparameters, uuid, results, self.portfolio.closed_trades, summary=self.summarise_results(results)
         )
+        return uuid
+
+    def summarise_results(self, results):
+        """
+        Summary metrics written alongside the results for indexed ranking.
+        """
+        post_trade = PostTradeMetrics(self.ticker_1, self.ticker_2, self.start_date, self.end_date)
+        post_trade.initialise_portfolio(results["starting_capital"], results["historic_pnl"], results["pnl"], results["growth"])
+        post_trade.initialise_trades(self.portfolio.closed_trades)
+        return post_trade.summarise()
 
     @abstractmethod
     def set_hyperparameters(self, hyperparameters):
@@ -0,0 +1,153 @@
+from numpy import isnan
+
+from analytics.regression import CointegrationTest
+from finance.strategy import load_pair_series
+from finance.online_strategy import OnlineRegressionStrategy
+from utils.cache import get_computation_cache
+
+
+class PairStrategyRun:
+    def __init__(self, method, capital, ticker_1, ticker_2, start_training_date, end_training_date,
+                 start_date, end_date, hyperparameters=None, adf_window=50, cache=None, prices_version=0):
+        """
+        Artefact of one single-pair backtest: the spread, thresholds, positions and
+        trades of the strategy and the rolling cointegration test of the pair.
+
+        It is built in stages, each cached in the computation cache under the
+        inputs it depends on:
+
+        - prices: pair, dates and the version of the stored prices.
+        - trades: prices plus method and hyperparameters.
+        - cointegration: prices plus adf_window.
+
+        Moving one slider only recomputes the stage it feeds. When both the trades
+        and the cointegration test are missing they are computed together in one
+        pass over the trading period.
+
+        Parameters
+        ----------
+        method : str
+            "KalmanRegression" or "OLSRegression".
+        capital : float
+            Starting capital of the portfolio.
+        hyperparameters : dict
+            buy_sigma, sell_sigma_low, sell_sigma_high and maxlen of the strategy.
+        adf_window : int
+            Window of the rolling ADF test.
+        cache : ComputationCache, optional
+            Defaults to the shared computation cache.
+        prices_version : int
+            MongoConnect.get_versions("prices"), re-ingested prices invalidate every stage.
+        """
+        self.method = method
+        self.capital = capital
+        self.ticker_1 = ticker_1
+        self.ticker_2 = ticker_2
+        self.start_training_date = start_training_date
+        self.end_training_date = end_training_date
+        self.start_date = start_date
+        self.end_date = end_date
+        self.hyperparameters = dict(hyperparameters or {})
+        self.adf_window = adf_window
+        self.cache = cache if cache is not None else get_computation_cache()
+
+        pair = (ticker_1, ticker_2, start_training_date, end_training_date, start_date, end_date, prices_version)
+        self.prices_key = self.cache.make_key("strategy_prices", pair)
+        self.trades_key = self.cache.make_key("strategy_trades", pair, method, capital,
+                                              tuple(sorted(self.hyperparameters.items())))
+        self.coint_key = self.cache.make_key("strategy_cointegration", pair, adf_window)
+
+    def run(self, progress=None, post_to=None):
+        """
+        Returns the artefact, computing the stages not found in the cache.
+
+        Parameters
+        ----------
+        progress : callable, optional
+            progress(done, total, message), e.g. a JobProgress.
+        post_to : optional
+            Connection trades are posted to when the trades stage is computed. Cached
+            trades were posted by the run that computed them.
+
+        Returns
+        -------
+        dict
+            ticker_1, ticker_2, ts, closed_trades, store_res (thresholds and spread
+            per trading day), positions, starting_capital, pnl, dates, coint_spread,
+            p_values and the run's inputs.
+        """
+        progress = progress or (lambda done, total, message=None: None)
+        progress(0, 1, "Loading prices")
+        ts = self.cache.get_or_compute(self.prices_key, lambda: load_pair_series(
+            self.ticker_1, self.ticker_2, self.start_training_date, self.end_training_date,
+            self.start_date, self.end_date))
+
+        found_trades, trades = self.cache.get(self.trades_key)
+        found_coint, coint = self.cache.get(self.coint_key)
+        if not (found_trades and found_coint):
+            new_trades, new_coint = self._stream(ts, not found_trades, not found_coint, progress, post_to)
+            if not found_trades:
+                trades = new_trades
+                self.cache.put(self.trades_key, trades)
+            if not found_coint:
+                coint = new_coint
+                self.cache.put(self.coint_key, coint)
+        progress(1, 1)
+
+        return {
+            "ticker_1": self.ticker_1,
+            "ticker_2": self.ticker_2,
+            "ts": ts.dropna(),
+            **trades,
+            **coint,
+            "adf_window": self.adf_window,
+            "start_date_train": self.start_training_date,
+            "end_date_train": self.end_training_date,
+            "start_date_trade": self.start_date,
+            "end_date_trade": self.end_date,
+        }
+
+    def _stream(self, ts, trade, test, progress, post_to):
+        strategy, coint = None, None
+        if trade:
+            strategy = OnlineRegressionStrategy(self.method, self.capital, self.ticker_1, self.ticker_2,
+                                                self.start_training_date, self.end_training_date,
+                                                self.start_date, self.end_date,
+                                                dict(self.hyperparameters), ts)
+            strategy.train_model()
+        ts = ts.dropna()
+        if test:
+            train = ts[ts["Mode"] == "Train"]
+            coint = CointegrationTest(train[self.ticker_1], train[self.ticker_2], maxlen=self.adf_window)
+            coint.run()
+
+        observations = ts[ts["Mode"] == "Trade"][[self.ticker_1, self.ticker_2]]
+        message = " and ".join(stage for stage, needed in [("Trading", trade), ("cointegration test", test)] if needed)
+        positions, dates, coint_spread, p_values = [], [], [], []
+        trading = trade
+        for indx, (date, observation) in enumerate(zip(observations.index, observations.values)):
+            progress(indx, len(observations), message.capitalize())
+            if trading:
+                trading = strategy.trade_observation(date, observation)
+                positions.append(strategy.cur_pos)
+            if test and not (isnan(observation[0]) or isnan(observation[1])):
+                coint.update(observation)
+                p_values.append(coint.cur_adf)
+                coint_spread.append(coint.get_spread())
+                dates.append(date)
+
+        trades, test_result = None, None
+        if trade:
+            strategy.close_positions()
+            if post_to is not None:
+                strategy.post_trades(post_to)
+            trades = {
+                "closed_trades": strategy.portfolio.closed_trades,
+                "store_res": strategy.store_res,
+                "positions": positions,
+                "starting_capital": strategy.portfolio.starting_capital,
+                "pnl": strategy.portfolio.pnl,
+            }
+        if test:
+            test_result = {"dates": dates, "coint_spread": coint_spread, "p_values": p_values}
+        return trades, test_result
@@ -1,27 +1,248 @@
 from dash.dependencies import Input, Output, State
-from dash import html, dash_table
+from dash import html, dash_table, no_update, Patch
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
 from analytics.regression import KalmanRegression, OLSRegression, CointegrationTest
 from analytics.cluster_tickers import ClusterTickers
-from analytics.identify_tickers import IdentifyCandidates, ScoreCandidates
+from analytics.cluster_index import ClusterIndex
+from analytics.features import FeatureExtractor
+from analytics.identify_tickers import IdentifyCandidates, PairScoreTable
 
-from data_loader.singleton import get_data_fetcher, get_misc_connect
-from gui.utils import date_handler
+from data_loader.singleton import get_data_fetcher, get_misc_connect, LazyConnector
+from data_loader.catalog import get_catalog
+from gui.utils import date_handler, register_ticker_search, cached_outputs
 from utils.utils import safe_round
+from utils.jobs import get_job_queue, format_seconds
+from utils.cache import get_computation_cache
+from utils.session import get_session_store
 
 import numpy as np
 import pandas as pd
 
-data_fetcher = get_data_fetcher()
-misc_connect = get_misc_connect()
-
-global cluster_method
+data_fetcher = LazyConnector(get_data_fetcher)
+misc_connect = LazyConnector(get_misc_connect)
+catalog = LazyConnector(get_catalog)
+job_queue = get_job_queue()
+computation_cache = get_computation_cache()
+session_store = get_session_store()
+
+
+def prices_version():
+    return misc_connect.get_versions("prices")[0]
+
+
+@computation_cache.memoize("prices")
+def get_prices(tickers, start_date, end_date, version):
+    """
+    (dates x tickers) closing prices, shared by every callback on the same inputs.
+    version, of the prices data, only keys the cache.
+    """
+    df = data_fetcher.collate_dataset(list(tickers), start_date, end_date)
+    return df.pivot(columns='ticker', values='close')
+
+
+@computation_cache.memoize("hedge_fit")
+def get_hedge_fit(ticker1, ticker2, start_date, end_date, version):
+    """
+    OLS and Kalman hedge ratios of ticker1 on ticker2 and the ADF statistic of the pair.
+    """
+    df = get_prices((ticker1, ticker2), start_date, end_date, version).dropna()
+    ols = OLSRegression(df[ticker2], df[ticker1])
+    ols.run()
+    kalman = KalmanRegression(df[ticker2], df[ticker1])
+    kalman.run()
+    coint = CointegrationTest(df[ticker1], df[ticker2])
+    coint.run()
+    return {"ols_beta": ols.cur_beta, "ols_alpha": ols.cur_alpha,
+            "kf_beta": kalman.cur_beta, "kf_alpha": kalman.cur_alpha,
+            "adf": coint.cur_adf}
+
+
+@computation_cache.memoize("ticker_info")
+def get_ticker_info(ticker, version):
+    return data_fetcher.get_ticker_info(ticker) or {}
+
+
+PAIR_COLUMNS = ['Ticker 1', 'Ticker 2', '\u03B2 1', '\u03B2 2', 'Market Cap 1/B', 'Market Cap 2/B', 'Coint', 'Hurst', 'MR', 'Total']
+
+
+@computation_cache.memoize("pair_scores")
+def get_pair_scores(str_, versions):
+    """
+    Scores of a stored pair screening as a PairScoreTable, with the beta and market
+    cap (in billions) of its tickers from a single query. versions, of the pairs
+    and prices data, only keys the cache.
+    """
+    method, cluster, start_date, end_date = str_.split(':')
+    table = PairScoreTable.from_rows(misc_connect.query_pair_scores(method, cluster, start_date, end_date))
+    fields = data_fetcher.get_ticker_fields(table.tickers.tolist(), ['beta', 'marketCap'])
+    beta = np.array([safe_round(fields.get(ticker, {}).get('beta'), 2) for ticker in table.tickers], dtype=float)
+    market_cap = np.array([safe_round(fields.get(ticker, {}).get('marketCap')) for ticker in table.tickers], dtype=float)/1_000_000_000
+    return table, beta, market_cap
+
+
+def pair_column(str_, versions, weights, column):
+    """
+    Values of one table column for every pair, the sort key of that column.
+    """
+    table, beta, market_cap = get_pair_scores(str_, versions)
+    columns = {
+        'Ticker 1': lambda: table.symbol_keys(table.ticker_1),
+        'Ticker 2': lambda: table.symbol_keys(table.ticker_2),
+        '\u03B2 1': lambda: beta[table.ticker_1],
+        '\u03B2 2': lambda: beta[table.ticker_2],
+        'Market Cap 1/B': lambda: market_cap[table.ticker_1],
+        'Market Cap 2/B': lambda: market_cap[table.ticker_2],
+        'Coint': lambda: table.scores[:, 0],
+        'Hurst': lambda: table.scores[:, 1],
+        'MR': lambda: table.scores[:, 2],
+        'Total': lambda: table.weighted(*weights),
+    }
+    return columns[column]()
+
+
+def pairs_page(str_, versions, weights, page_current, page_size, sort_by):
+    """
+    Rows of one page of the pairs table. Pairs are ranked by the sorted column,
+    by Total (lowest first) by default, and only the page's rows are built.
+    """
+    table, beta, market_cap = get_pair_scores(str_, versions)
+    column, descending = 'Total', False
+    if sort_by:
+        column, descending = sort_by[0]['column_id'], sort_by[0]['direction'] == 'desc'
+    start = page_current * page_size
+    rows = PairScoreTable.rank(pair_column(str_, versions, weights, column), start, start + page_size, descending)
+
+    total = table.weighted(*weights)[rows]
+    ticker_1, ticker_2 = table.ticker_1[rows], table.ticker_2[rows]
+    page = {
+        'Ticker 1': table.tickers[ticker_1],
+        'Ticker 2': table.tickers[ticker_2],
+        '\u03B2 1': beta[ticker_1],
+        '\u03B2 2': beta[ticker_2],
+        'Market Cap 1/B': np.round(market_cap[ticker_1], 2),
+        'Market Cap 2/B': np.round(market_cap[ticker_2], 2),
+        'Coint': np.round(table.scores[rows, 0], 3),
+        'Hurst': np.round(table.scores[rows, 1], 3),
+        'MR': np.round(table.scores[rows, 2], 3),
+        'Total': np.round(total, 3),
+    }
+    return pd.DataFrame(page, columns=PAIR_COLUMNS).to_dict('records')
+
+
+def pairs_summary(str_, versions, weights):
+    """
+    Histograms of the scores, betas and market caps over all pairs, binned here so
+    the figure doesn't carry every pair, and the colour scale of the table.
+    """
+    table, beta, market_cap = get_pair_scores(str_, versions)
+    pair_beta = np.concatenate([beta[table.ticker_1], beta[table.ticker_2]])
+    pair_market_cap = np.concatenate([market_cap[table.ticker_1], market_cap[table.ticker_2]])
+
+    # Define quantiles for the columns
+    quantiles = {
+        'Hurst': np.linspace(0, 1, 11),
+        'MR': np.linspace(0, 1, 11),
+        'Coint': np.linspace(0, 1, 11),
+        'Total': np.linspace(0, 1, 11),
+        '\u03B2': np.linspace(np.nanmin(beta), np.nanmax(beta), 11),
+        'Market Cap': np.linspace(np.nanmin(market_cap), np.nanmax(market_cap), 11),
+    }
+
+    # Define colors for the quantiles
+    colors = list(reversed(['#a6d96a', '#b8e081', '#cde996', '#e1f2ac', '#f5fac2', '#f9f8a2', '#fde480', '#fbcf5e', '#f9b93d', '#f79e1b']))
+
+
+    # Create style_data_conditional
+    style_data_conditional = []
+    columns_to_style = ['\u03B2 1', '\u03B2 2', 'Market Cap 1/B', 'Market Cap 2/B', 'Coint', 'Hurst', 'MR', 'Total']
+    for column in columns_to_style:
+        if column in ['\u03B2 1', '\u03B2 2']:
+            quants = quantiles['\u03B2']
+        elif column in ['Market Cap 1/B', 'Market Cap 2/B']:
+            quants = quantiles['Market Cap']
+        else:
+            quants = quantiles[column]
+        for i in range(10):
+            condition = {
+                "if": {
+                    "filter_query": f"{{{column}}} >= {quants[i]} && {{{column}}} < {quants[i+1]}",
+                    "column_id": column
+                },
+                "backgroundColor": colors[i] if column in ['\u03B2 1', '\u03B2 2', 'Market Cap 1/B', 'Market Cap 2/B'] else colors[9-i]
+            }
+            style_data_conditional.append(condition)
+
+    nbins = 10
+    # Create a 3x2 grid of subplots
+    fig = make_subplots(rows=3, cols=2, subplot_titles=['\u03B2', 'Market Cap', 'Cointegration', 'Hurst', 'MR', 'Total'])
+    for (row, col), values, name in [((1, 1), pair_beta, 'Beta'),
+                                     ((1, 2), pair_market_cap, 'Market Cap'),
+                                     ((2, 1), table.scores[:, 0], 'Cointegration'),
+                                     ((2, 2), table.scores[:, 1], 'Hurst'),
+                                     ((3, 1), table.scores[:, 2], 'MR'),
+                                     ((3, 2), table.weighted(*weights), 'Total')]:
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            continue
+        counts, edges = np.histogram(values, bins=nbins)
+        fig.add_trace(go.Bar(x=(edges[:-1] + edges[1:])/2, y=counts, width=np.diff(edges), name=name), row=row, col=col)
+
+    # Update layout
+    fig.update_layout(title='Histograms', showlegend=False, bargap=0)
+    fig.update_layout(margin=dict(l=0, r=0, t=36, b=0))
+
+    return fig, style_data_conditional
+
+
+def run_clustering(progress, tickers, method, start_date, end_date, features, previous=None):
+    """
+    Background job behind the Cluster button, returns the fitted ClusterTickers.
+    features is FeatureExtractor.get_params(), or None to cluster the full series.
+    """
+    feature_extractor = FeatureExtractor(**features) if features is not None else None
+    cluster_method = ClusterTickers(tickers, method, start_date, end_date, feature_extractor=feature_extractor, previous=previous)
+    cluster_method.get_candidates(progress)
+    # Sorting the dictionary by the length of the lists
+    sorted_clusters = {k: v for k, v in sorted(cluster_method.clusters.items(), key=lambda item: len(item[1]), reverse=True)}
+    misc_connect.post_clustering_results(method, start_date, end_date, sorted_clusters)
+    return cluster_method
+
+
+def run_identify_pairs(progress, method, cluster, start_date, end_date):
+    """
+    Background job behind the pair identification Submit button, returns the number of scored pairs.
+    """
+    tickers = list(misc_connect.get_cluster(method, cluster, start_date, end_date))
+    ticker_pairs = ClusterIndex.from_dict({cluster: tickers}).pairs()
+    df = data_fetcher.collate_dataset(tickers, start_date, end_date)
+    df = df.pivot(columns='ticker', values='close')
+
+    candidates = IdentifyCandidates(ticker_pairs, df, max_lag=None)
+    candidates.iterate_tickers(progress)
+    misc_connect.post_pairs_results(method, cluster, start_date, end_date, candidates.score)
+    return len(candidates.score)
+
+
+def get_cluster_method(session_id):
+    """
+    The session's last finished clustering. The session only stores the job id,
+    the ClusterTickers itself is read back from the job queue.
+    """
+    job_id = session_store.get(session_id, "cluster_job_id")
+    return job_queue.result(job_id) if job_id is not None else None
+
+
+def describe_job(status, unit):
+    if status["total"]:
+        return f"{status['done']}/{status['total']} {unit}, {status['rate']:.1f} {unit}/s"
+    return status["status"].capitalize() + "..."
 
 def register_analytics_callbacks(app):
-    global cluster_method
-    cluster_method = None
+    for dropdown_id in ['ticker-dropdown-1', 'ticker-dropdown-2']:
+        register_ticker_search(app, dropdown_id)
+
     @app.callback(
         Output('ticker-dropdown-2', 'value'),
         Input('ticker-dropdown-2', 'value')
@@ -44,15 +265,16 @@ def register_analytics_callbacks(app):
         start_date = date_handler(s_date)
         end_date = date_handler(e_date)
         # Fetch data
-        data_fetcher.set_dates(start_date, end_date)
+        df = get_prices(tuple(tickers), start_date, end_date, prices_version())
         fig = go.Figure()
 
         for ticker in tickers:
-            df = data_fetcher.get_data(ticker)
-            ts = df['close'].values
+            if ticker not in df:
+                continue
+            ts = df[ticker].dropna()
 
             # Create figure
-            fig.add_trace(go.Scatter(x=df.index, y=ts, mode='lines', name=ticker))
+            fig.add_trace(go.Scatter(x=ts.index, y=ts.values, mode='lines', name=ticker))
             #fig.update_layout(title=f"{ticker} (Stationary: {is_stationary}/{p_value:.5f})      (Mean Reversion: {is_mean_reversion}/{h:.5f})", xaxis_title="Date", yaxis_title="Price")
         fig.update_layout(xaxis_title="Date", yaxis_title="Price", margin=dict(l=0, r=0, t=0, b=0))
 
@@ -61,73 +283,128 @@ def register_analytics_callbacks(app):
 
 
     @app.callback(
-        Output('dependent-dropdown', 'options'),
+        [Output('cluster-job-id', 'data'),
+         Output('cluster-job-interval', 'disabled')],
         [Input('submit-button-3', 'n_clicks'),
         Input('automatic-dropdown-1', 'value'),
         Input('my-date-picker-range-3', 'start_date'),
         Input('my-date-picker-range-3', 'end_date')],
+        [State('feature-dropdown-1', 'value'),
+         State('session-id', 'data')]
     )
-    def cluster_tickers(n, method, s_date, e_date):
-        global cluster_method  # Declare cluster_method as global
+    def cluster_tickers(n, method, s_date, e_date, features, session_id):
         if n is None:
-            return []
+            return None, True
         start_date = date_handler(s_date)
         end_date = date_handler(e_date)
-        data_fetcher.set_dates(start_date, end_date)
-        tickers = data_fetcher.get_ticker_names()
-        # To repeat loading in data repetitively
-        if cluster_method is None:
-            cluster_method = ClusterTickers(tickers, method, start_date, end_date)
-        else:
-            if cluster_method.start_date != start_date or cluster_method.end_date != end_date:
-                cluster_method = ClusterTickers(tickers, method, start_date, end_date)
-            cluster_method.clusters = None
-            cluster_method.set_dates(start_date, end_date)
-            cluster_method.set_method(method)
-        cluster_method.get_candidates()
-        # Sorting the dictionary by the length of the lists
-        sorted_clusters = {k: v for k, v in sorted(cluster_method.clusters.items(), key=lambda item: len(item[1]), reverse=True)}
-        misc_connect.post_clustering_results(method, start_date, end_date, sorted_clusters)
-        # Creating the sorted_list by iterating through the sorted keys
-        sorted_list = [{"label": key, "value": key, "search": key} for key in sorted_clusters.keys()]
-        return sorted_list
+        tickers = catalog.tickers()
+        cluster_method = get_cluster_method(session_id)
+        # A previous run of the same method lets the SOM warm-start and the clusters be diffed
+        previous = cluster_method if cluster_method is not None and cluster_method.method == method else None
+        # Every parameter of the extractor is part of the job's identity, not just its method
+        features = FeatureExtractor(features).get_params() if features not in [None, 'None'] else None
+        params = {"tickers": tickers, "method": method, "start_date": start_date, "end_date": end_date, "features": features}
+        job_id = job_queue.submit("cluster_tickers", run_clustering, params, extra={"previous": previous},
+                                  versions={"prices": prices_version()})
+        return job_id, False
+
+    @app.callback(
+        [Output('dependent-dropdown', 'options'),
+         Output('cluster-job-status', 'children'),
+         Output('cluster-job-interval', 'disabled', allow_duplicate=True)],
+        [Input('cluster-job-interval', 'n_intervals')],
+        [State('cluster-job-id', 'data'),
+         State('session-id', 'data')],
+        prevent_initial_call=True
+    )
+    def poll_clustering(n, job_id, session_id):
+        if job_id is None:
+            return no_update, "", True
+        status = job_queue.status(job_id)
+        if status is None:
+            return no_update, "Clustering job not found.", True
+        if status["status"] == "failed":
+            return no_update, f"Clustering failed: {status['error']}", True
+        if status["status"] != "done":
+            return no_update, "Clustering: " + describe_job(status, "epochs"), False
+        result = job_queue.result(job_id)
+        if result is None:
+            return no_update, "Clustering result is no longer available, please run it again.", True
+        cluster_method = result
+        session_store.set(session_id, "cluster_job_id", job_id)
+        # Creating the sorted_list by iterating through the clusters sorted by size
+        sorted_clusters = sorted(cluster_method.clusters.items(), key=lambda item: len(item[1]), reverse=True)
+        sorted_list = [{"label": key, "value": key, "search": key} for key, _ in sorted_clusters]
+        return sorted_list, f"Clustered in {format_seconds(status['elapsed'])}.", True
 
     @app.callback(
         [Output('cluster-plot-1', 'figure'),
-         Output('bar-plot-1', 'figure')],
+         Output('bar-plot-1', 'figure'),
+         Output('barycenter-interval', 'disabled')],
         [Input('submit-button-4', 'n_clicks'), 
          Input('average-method-choice', 'value'),
          Input('dependent-dropdown', 'value'),
          Input('groupby-dropdown', 'value')],
+        [State('session-id', 'data')]
     )
-    def plot_clusters(n, avg_method, cluster, groupby):
-        global cluster_method
+    def plot_clusters(n, avg_method, cluster, groupby, session_id):
+        cluster_method = get_cluster_method(session_id)
         if cluster_method is not None and cluster is not None and n is not None and n != 0 and cluster_method.clusters is not None:
-            fig_1 = cluster_method.plot_time_series_clusters(avg_method, cluster)
-            if groupby == 'None':
-                fig_2 = cluster_method.plot_bar()
-            elif groupby == 'sector':
-                cluster_method_copy = ClusterTickers(cluster_method.tickers, "Sector", cluster_method.start_date, cluster_method.end_date, serialise=True)
-                cluster_method_copy._serialise(cluster_method.df)
-                cluster_method_copy.get_candidates()
-                fig_2 = cluster_method.plot_bar(cluster_method_copy.clusters)
-            elif groupby == 'market_cap':
-                cluster_method_copy = ClusterTickers(cluster_method.tickers, "Market Cap", cluster_method.start_date, cluster_method.end_date, serialise=True)
-                cluster_method_copy._serialise(cluster_method.df)
-                cluster_method_copy.get_candidates()
-                fig_2 = cluster_method.plot_bar(cluster_method_copy.clusters)
-
-            
-            fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            fig_2.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-
-            return fig_1, fig_2    
+            def build():
+                fig_1 = cluster_method.plot_time_series_clusters(avg_method, cluster)
+                if groupby == 'None':
+                    fig_2 = cluster_method.plot_bar()
+                elif groupby == 'sector':
+                    cluster_method_copy = ClusterTickers(cluster_method.tickers, "Sector", cluster_method.start_date, cluster_method.end_date, serialise=True)
+                    cluster_method_copy._serialise(cluster_method.panel)
+                    cluster_method_copy.get_candidates()
+                    fig_2 = cluster_method.plot_bar(cluster_method_copy.clusters)
+                elif groupby == 'market_cap':
+                    cluster_method_copy = ClusterTickers(cluster_method.tickers, "Market Cap", cluster_method.start_date, cluster_method.end_date, serialise=True)
+                    cluster_method_copy._serialise(cluster_method.panel)
+                    cluster_method_copy.get_candidates()
+                    fig_2 = cluster_method.plot_bar(cluster_method_copy.clusters)
+
+                fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
+                fig_2.update_layout(margin=dict(l=0, r=0, t=0, b=0))
+                return fig_1, fig_2
+
+            # Keep polling until the background barycenter replaces the placeholder
+            pending = avg_method == "Barycenters" and not cluster_method.barycenter_ready(cluster)
+            if pending:
+                fig_1, fig_2 = build()
+            else:
+                # A clustering job's result never changes, so its id versions the figures
+                job_id = session_store.get(session_id, "cluster_job_id")
+                fig_1, fig_2 = cached_outputs("clusters", (job_id, avg_method, cluster, groupby), build)
+            return fig_1, fig_2, not pending
         else:
             fig_1 = go.Figure()
             fig_2 = go.Figure()
             fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
             fig_2.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            return fig_1, fig_2
+            return fig_1, fig_2, True
+
+    @app.callback(
+        [Output('cluster-plot-1', 'figure', allow_duplicate=True),
+         Output('barycenter-interval', 'disabled', allow_duplicate=True)],
+        [Input('barycenter-interval', 'n_intervals')],
+        [State('average-method-choice', 'value'),
+         State('dependent-dropdown', 'value'),
+         State('session-id', 'data')],
+        prevent_initial_call=True
+    )
+    def poll_barycenter(n, avg_method, cluster, session_id):
+        cluster_method = get_cluster_method(session_id)
+        if cluster_method is None or cluster_method.clusters is None or cluster not in cluster_method.clusters or avg_method != "Barycenters":
+            return no_update, True
+        if not cluster_method.barycenter_ready(cluster):
+            return no_update, False
+        fig_1 = cluster_method.plot_time_series_clusters(avg_method, cluster)
+        # Only the barycenter, the last trace, changes, the cluster's series stay on the client
+        patch = Patch()
+        patch["data"][len(fig_1.data) - 1] = fig_1.data[-1].to_plotly_json()
+        return patch, True
 
     @app.callback(
             Output('cluster-dropdown', 'options'),
@@ -136,7 +413,7 @@ def register_analytics_callbacks(app):
     def update_cluster_dropdown(n):
         if n is not None and n != 0:
             options = []
-            dict_ = misc_connect.get_all_clustering_results()
+            dict_ = catalog.clustering_runs()
             for document in dict_:
                 method = document['method']
                 start_date = document['start_date']
@@ -198,11 +475,13 @@ def register_analytics_callbacks(app):
 
         data = []
         n = max(0, -7+len(tickers))
+        version = prices_version()
         for ticker in tickers[n:]:
-            sector = data_fetcher.get_ticker_field_info(ticker, field='sector')
-            industry = data_fetcher.get_ticker_field_info(ticker, field='industry')
-            marketCap = data_fetcher.get_ticker_field_info(ticker, field='marketCap')
-            beta = data_fetcher.get_ticker_field_info(ticker, field='beta')
+            info = get_ticker_info(ticker, version)
+            sector = info.get('sector')
+            industry = info.get('industry')
+            marketCap = info.get('marketCap')
+            beta = info.get('beta')
 
 
             marketCap = safe_round(marketCap/1_000_000_000,2) if marketCap is not None else 0
@@ -236,7 +515,9 @@ def register_analytics_callbacks(app):
 
         return table
     @app.callback(
-        Output('pairs-success', 'children'),
+        [Output('pairs-success', 'children'),
+         Output('pairs-job-id', 'data'),
+         Output('pairs-job-interval', 'disabled')],
         [Input('submit-button-5', 'n_clicks')],
         [State('cluster-dropdown', 'value'),
          State('cluster-selection', 'value'),
@@ -249,45 +530,46 @@ def register_analytics_callbacks(app):
         if n is not None and n != 0:
             if cluster is not None:
                 method, start_date, end_date = clusters.split(':')
-                #if cluster == 'All':
-                #    s = defaultdict(list)
-                #    for cluster in misc_connect.get_clustering_results(method, start_date, end_date):
-                #        s[cluster] = list(misc_connect.get_cluster(method, cluster, start_date, end_date))
-                #    tickers = list(set([item for sublist in s.values() for item in sublist]))
-                #    ticker_pairs = [(tickers[i], tickers[j]) for i in range(len(tickers)) for j in range(i+1, len(tickers))]
-                tickers = list(misc_connect.get_cluster(method, cluster, start_date, end_date))
-                ticker_pairs = [(tickers[i], tickers[j]) for i in range(len(tickers)) for j in range(i+1, len(tickers))]
-                df = data_fetcher.collate_dataset(tickers, start_date, end_date)
-                df = df.pivot(columns='ticker', values='close')
-
-                candidates = IdentifyCandidates(ticker_pairs, df, max_lag=None)
-                candidates.iterate_tickers()
-                misc_connect.post_pairs_results(method, cluster, start_date, end_date, candidates.score)
-                return "Done!"
+                params = {"method": method, "cluster": cluster, "start_date": start_date, "end_date": end_date}
+                versions = dict(zip(["clusters", "prices"], misc_connect.get_versions("clusters", "prices")))
+                job_id = job_queue.submit("identify_pairs", run_identify_pairs, params, versions=versions)
+                return "Queued...", job_id, False
             else:
-                return ""
+                return "", None, True
         else:
-            return ""
+            return "", None, True
         
     @app.callback(
         [Output('loading-bar', 'value'),
          Output('time-taken', 'children'),
-         Output('time-remaining', 'children')],
-        [Input('submit-button-5', 'n_clicks')],
+         Output('time-remaining', 'children'),
+         Output('pairs-success', 'children', allow_duplicate=True),
+         Output('pairs-job-interval', 'disabled', allow_duplicate=True)],
+        [Input('pairs-job-interval', 'n_intervals')],
+        [State('pairs-job-id', 'data')],
+        prevent_initial_call=True
     )    
-    def update_progress_bar(n_clicks):
-        progress = 50  # Example value
-        time_taken = 10  # Example value in seconds
-        time_remaining = 20  # Example value in seconds
-
-        return progress, f'Time taken: {time_taken}s', f'Time remaining: {time_remaining}s'
+    def update_progress_bar(n, job_id):
+        if job_id is None:
+            return 0, "", "", no_update, True
+        status = job_queue.status(job_id)
+        if status is None:
+            return 0, "", "", "Job not found.", True
+        progress = 100 * status["fraction"]
+        time_taken = f'Time taken: {format_seconds(status["elapsed"])}'
+        time_remaining = f'Time remaining: {format_seconds(status["eta"])}'
+        if status["status"] == "failed":
+            return progress, time_taken, "", f"Failed: {status['error']}", True
+        if status["status"] == "done":
+            return 100, time_taken, time_remaining, "Done!", True
+        return progress, time_taken, time_remaining, describe_job(status, "pairs"), False
     
     @app.callback(
             Output("pairs-dropdown", "options"),
             [Input("submit-button-8", "n_clicks")]
     )
     def get_all_pair_runs(n_clicks):
-        res = list(misc_connect.get_all_pairs_results())
+        res = catalog.pair_runs()
         if len(res) > 0:
             options = []
             for dict_ in res:
@@ -303,8 +585,11 @@ def register_analytics_callbacks(app):
             return []
         
     @app.callback(
-        [Output('pair-data-1', 'children'),
-         Output('pair-plot-1', 'figure')],
+        [Output('pair-plot-1', 'figure'),
+         Output('pairs-table', 'style_data_conditional'),
+         Output('pairs-table', 'page_size'),
+         Output('pairs-table', 'page_count'),
+         Output('pairs-table', 'page_current')],
         [Input('submit-button-7', 'n_clicks'),
          Input('pairs-dropdown', 'value')],
          [
@@ -314,135 +599,34 @@ def register_analytics_callbacks(app):
              State('slider-coint', 'value'),
           ]
     )
-    def get_pairs_table(n, str_, K, hurst, mr, coint):
-        if str_ is None:
+    def get_pairs_summary(n, str_, K, hurst, mr, coint):
+        versions = misc_connect.get_versions("pairs", "prices")
+        if str_ is None or len(get_pair_scores(str_, versions)[0]) == 0:
             fig = go.Figure()
             fig.update_layout(xaxis_title="Date", yaxis_title="Price", margin=dict(l=0, r=0, t=36, b=0))
-            return "", fig
-        method, cluster, start_date, end_date = str_.split(':')
-        cursor = misc_connect.get_pairs_results(method, cluster, start_date, end_date)
-        res = dict(cursor)
-        S = ScoreCandidates(hurst, mr, coint, res)
-
-        final_table = []
-        tickers = S.get_top_candidates()
-        for key in tickers:
-            ticker_1, ticker_2 = key.split(':')
-            t1_beta = safe_round(data_fetcher.get_ticker_field_info(ticker_1, 'beta'), 2)
-            t1_market_cap = safe_round(data_fetcher.get_ticker_field_info(ticker_1, 'marketCap'))/1_000_000_000
-            t2_beta = safe_round(data_fetcher.get_ticker_field_info(ticker_2, 'beta'), 2)
-            t2_market_cap = safe_round(data_fetcher.get_ticker_field_info(ticker_2, 'marketCap'))/1_000_000_000
-            coint_val = safe_round(res[key]['coint'], 3)
-            hurst_val = safe_round(res[key]['stationary'], 3)
-            mr_val = safe_round(res[key]['mean_reversion'], 3)
-
-            s_ = hurst+mr+coint
-            total = safe_round((coint*coint_val + hurst*hurst_val + mr*mr_val)/s_, 3)
-            final_table.append({
-                    'Ticker 1': ticker_1,
-                    'Ticker 2': ticker_2,
-                    '\u03B2 1': t1_beta,
-                    '\u03B2 2': t2_beta,
-                    'Market Cap 1/B': t1_market_cap,
-                    'Market Cap 2/B': t2_market_cap,
-                    'Coint': coint_val,
-                    'Hurst': hurst_val,
-                    'MR': mr_val,
-                    'Total': total
-                })
-            
-
-        df_fin = pd.DataFrame(final_table)
-        # Combine beta and market cap values, and drop duplicates
-        beta_values = pd.Series(df_fin['\u03B2 1'].tolist() + df_fin['\u03B2 2'].tolist()).drop_duplicates().sort_values()
-        market_cap_values = pd.Series(df_fin['Market Cap 1/B'].tolist() + df_fin['Market Cap 2/B'].tolist()).drop_duplicates().sort_values()
-
-        # Define quantiles for the columns
-        quantiles = {
-            'Hurst': np.linspace(0, 1, 11),
-            'MR': np.linspace(0, 1, 11),
-            'Coint': np.linspace(0, 1, 11),
-            'Total': np.linspace(0, 1, 11),
-            '\u03B2': np.linspace(beta_values.min(), beta_values.max(), 11),
-            'Market Cap': np.linspace(market_cap_values.min(), market_cap_values.max(), 11),
-        }
-
-        # Define colors for the quantiles
-        colors = list(reversed(['#a6d96a', '#b8e081', '#cde996', '#e1f2ac', '#f5fac2', '#f9f8a2', '#fde480', '#fbcf5e', '#f9b93d', '#f79e1b']))
-
-
-        # Create style_data_conditional
-        style_data_conditional = []
-        columns_to_style = ['\u03B2 1', '\u03B2 2', 'Market Cap 1/B', 'Market Cap 2/B', 'Coint', 'Hurst', 'MR', 'Total']
-        for column in columns_to_style:
-            if column in ['\u03B2 1', '\u03B2 2']:
-                quants = quantiles['\u03B2']
-            elif column in ['Market Cap 1/B', 'Market Cap 2/B']:
-                quants = quantiles['Market Cap']
-            else:
-                quants = quantiles[column]
-            for i in range(10):
-                condition = {
-                    "if": {
-                        "filter_query": f"{{{column}}} >= {quants[i]} && {{{column}}} < {quants[i+1]}",
-                        "column_id": column
-                    },
-                    "backgroundColor": colors[i] if column in ['\u03B2 1', '\u03B2 2', 'Market Cap 1/B', 'Market Cap 2/B'] else colors[9-i]
-                }
-                style_data_conditional.append(condition)
-        df_table = pd.DataFrame(final_table[:K])
-        table = dash_table.DataTable(
-            id='table',
-            columns=[{"name": i, "id": i} for i in df_table.columns],
-            data=df_table.to_dict('records'),
-            style_cell={'textAlign': 'left'},
-            style_data_conditional=style_data_conditional
-        )
-        nbins = 10
-        # Create a 3x2 grid of subplots
-        fig = make_subplots(rows=3, cols=2, subplot_titles=['\u03B2', 'Market Cap', 'Cointegration', 'Hurst', 'MR', 'Total'])
-
-        # Add the histogram for beta
-        fig.add_trace(
-            go.Histogram(x=pd.concat([df_fin['\u03B2 1'], df_fin['\u03B2 2']], axis=0), nbinsx=nbins, name='Beta'),
-            row=1, col=1
-        )
-
-        # Add the histogram for market cap
-        fig.add_trace(
-            go.Histogram(x=pd.concat([df_fin['Market Cap 1/B'], df_fin['Market Cap 2/B']], axis=0), nbinsx=nbins, name='Market Cap'),
-            row=1, col=2
-        )
-
-        # Add the histogram for cointegration
-        fig.add_trace(
-            go.Histogram(x=df_fin['Coint'], nbinsx=nbins, name='Cointegration'),
-            row=2, col=1
-        )
+            return fig, [], K, 1, 0
+        weights = (hurst, mr, coint)
+        fig, style_data_conditional = cached_outputs("pairs_summary", (str_, weights, *versions),
+                                                     lambda: pairs_summary(str_, versions, weights))
+        table = get_pair_scores(str_, versions)[0]
+        # Back to the first page, which also reloads the rows through get_pairs_table
+        return fig, style_data_conditional, K, max(-(-len(table) // K), 1), 0
 
-        # Add the histogram for Hurst
-        fig.add_trace(
-            go.Histogram(x=df_fin['Hurst'], nbinsx=nbins, name='Hurst'),
-            row=2, col=2
-        )
-
-        # Add the histogram for MR
-        fig.add_trace(
-            go.Histogram(x=df_fin['MR'], nbinsx=nbins, name='MR'),
-            row=3, col=1
-        )
-
-        # Add the histogram for Total
-        fig.add_trace(
-            go.Histogram(x=df_fin['Total'], nbinsx=nbins, name='Total'),
-            row=3, col=2
-        )
-
-        # Update layout
-        fig.update_layout(title='Histograms', showlegend=False)
-        fig.update_layout(margin=dict(l=0, r=0, t=36, b=0))
-
-        return table, fig
+    @app.callback(
+        Output('pairs-table', 'data'),
+        [Input('pairs-table', 'page_current'),
+         Input('pairs-table', 'page_size'),
+         Input('pairs-table', 'sort_by')],
+        [State('pairs-dropdown', 'value'),
+         State('slider-hurst', 'value'),
+         State('slider-mr', 'value'),
+         State('slider-coint', 'value')]
+    )
+    def get_pairs_table(page_current, page_size, sort_by, str_, hurst, mr, coint):
+        if str_ is None or page_size is None:
+            return []
+        versions = misc_connect.get_versions("pairs", "prices")
+        return pairs_page(str_, versions, (hurst, mr, coint), page_current or 0, page_size, sort_by)
     
     @app.callback(
         [Output('time-series-plot-3', 'figure'),
@@ -462,25 +646,16 @@ def register_analytics_callbacks(app):
             return fig
         ticker1, ticker2 = tickers[-2:]
 
-        # Fetch data
-        df = data_fetcher.collate_dataset([ticker1, ticker2], start_date, end_date)
-        df = df.pivot(columns='ticker', values='close')
-        df = df.dropna()
-        # Compute OLS hedging ratio
-        ols = OLSRegression(df[ticker2], df[ticker1])   
-        ols.run()
-        ols_hedging_ratio = ols.cur_beta
-        ols_hedging_const = ols.cur_alpha
-
-        # Compute Kalman Filter hedging ratio
-        kalman = KalmanRegression(df[ticker2], df[ticker1])
-        kalman.run()
-        kf_hedging_ratio = kalman.cur_beta
-        kf_hedging_const = kalman.cur_alpha
-        # Compute cointegration test
-        coint = CointegrationTest(df[ticker1], df[ticker2])
-        coint.run()
-        adf_coef = coint.cur_adf
+        # Fetch data, shared with update_time_series_plot_2
+        version = prices_version()
+        df = get_prices((ticker1, ticker2), start_date, end_date, version).dropna()
+        # OLS and Kalman Filter hedging ratios and cointegration test
+        fit = get_hedge_fit(ticker1, ticker2, start_date, end_date, version)
+        ols_hedging_ratio = fit["ols_beta"]
+        ols_hedging_const = fit["ols_alpha"]
+        kf_hedging_ratio = fit["kf_beta"]
+        kf_hedging_const = fit["kf_alpha"]
+        adf_coef = fit["adf"]
 
         # Create figure
         fig = go.Figure()
@@ -517,9 +692,8 @@ def register_analytics_callbacks(app):
             return fig
 
         ticker1, ticker2 = tickers[-2:]
-        # Fetch data
-        df = data_fetcher.collate_dataset([ticker1, ticker2], start_date, end_date)
-        df = df.pivot(columns='ticker', values='close')
+        # Fetch data, copied as the cached frame is shared
+        df = get_prices((ticker1, ticker2), start_date, end_date, prices_version()).copy()
         df['baseline'] = df[ticker1] - df[ticker2]
         mu, var = df['baseline'].mean(), df['baseline'].var()
         df['baseline'] = (df['baseline'] - mu) / np.sqrt(var)
@@ -1,20 +1,20 @@
-from dash import dcc, html
+from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
 from gui.utils import create_dropdown, create_date_picker, create_button_with_loading, create_slider, create_divider
 
 # Define the layout here
-def get_analytics_layout(names):
+def get_analytics_layout():
     layout = html.Div([
         dbc.Container([
             get_title(),
             create_divider(),
-            identify_stat_and_mr(names),
+            identify_stat_and_mr(),
             create_divider(),
             cluster_tickers(),
             create_divider(),
             pair_identification(),
             create_divider(),
-            hedging_ratio(names),
+            hedging_ratio(),
             create_divider()
         ], style={'width': '90%', 'max-width': 'none'}),
     ])
@@ -24,11 +24,11 @@ def get_analytics_layout(names):
 def get_title():
     return dbc.Row(dbc.Col(html.H1("Financial Analysis Dashboard")), style={'padding-top': "8%"})
 
-def identify_stat_and_mr(names):
+def identify_stat_and_mr():
     title = dbc.Row(dbc.Col(html.H2("Identify Stationary & Mean-Reverting Series")), style={'margin-bottom': '20px'})
     
     input_ = dbc.Row([
-        dbc.Col(create_dropdown('ticker-dropdown-1', names, ["CDMO", "GOLF"]), width=4),
+        dbc.Col(create_dropdown('ticker-dropdown-1', ["CDMO", "GOLF"]), width=4),
         dbc.Col(create_date_picker('my-date-picker-range-1'), width="auto"),
         dbc.Col(
             dbc.Button("Submit", id="submit-button-1", color="primary"),
@@ -61,11 +61,26 @@ def cluster_tickers():
                    #{'label': 'Market Cap', 'value': 'Market Cap', 'search': 'Market Cap'},
                     {'label': 'SOM', 'value': 'SOM'},
                     {'label': 'Market Cap', 'value': 'Market Cap'},
+                    {'label': 'Correlation', 'value': 'Correlation'},
+                    {'label': 'K-Means', 'value': 'K-Means'},
+                    {'label': 'DBSCAN', 'value': 'DBSCAN'},
 
                 ],
                 value='Industry',
                 multi=False,
             ), width=2),
+        dbc.Col(dcc.Dropdown(
+                id='feature-dropdown-1',
+                options=[
+                    {'label': 'Full Series', 'value': 'None'},
+                    {'label': 'PCA', 'value': 'pca'},
+                    {'label': 'PAA', 'value': 'paa'},
+                    {'label': 'SAX', 'value': 'sax'},
+                    {'label': 'Segment Returns', 'value': 'returns'},
+                ],
+                value='None',
+                multi=False,
+            ), width=2),
         dbc.Col(create_date_picker('my-date-picker-range-3'), width="auto"),
         create_button_with_loading("submit-button-3", "Cluster", "3"),
         dbc.Col(dcc.Dropdown(
@@ -95,9 +110,16 @@ def cluster_tickers():
             style={'overflow': 'visible', 'text-align': 'left'}
         )
     ], style={'margin-bottom': '10px'})
+    job = dbc.Row([
+        dcc.Store(id='cluster-job-id'),
+        dcc.Interval(id='cluster-job-interval', interval=1000, disabled=True),
+        dbc.Col(html.Div(id='cluster-job-status', children=''))
+    ], style={'margin-bottom': '10px'})
     res = dbc.Row([
                  dbc.Col([
-                    dcc.Graph(id='cluster-plot-1')
+                    dcc.Graph(id='cluster-plot-1'),
+                    # Polls for the barycenter while the mean curve stands in for it
+                    dcc.Interval(id='barycenter-interval', interval=1000, disabled=True)
                 ], width=8),
                  dbc.Col([
                     dcc.Graph(id='bar-plot-1')
@@ -105,7 +127,7 @@ def cluster_tickers():
             ], style={'margin-bottom': '20px'})
     
     
-    return html.Div([title, input_, res])
+    return html.Div([title, input_, job, res])
 
 
 def pair_identification():
@@ -139,6 +161,14 @@ def pair_identification():
         dbc.Col(html.Div(id='pairs-success', children=''))
     ], style={'margin-bottom': '10px'})
 
+    progress = dbc.Row([
+        dcc.Store(id='pairs-job-id'),
+        dcc.Interval(id='pairs-job-interval', interval=1000, disabled=True),
+        dbc.Col(dbc.Progress(id='loading-bar', value=0, striped=True), width=6),
+        dbc.Col(html.Div(id='time-taken', children=''), width="auto"),
+        dbc.Col(html.Div(id='time-remaining', children=''), width="auto")
+    ], style={'margin-bottom': '10px'})
+
 
     load_res = dbc.Row([
         dbc.Col(dbc.Button(
@@ -168,21 +198,36 @@ def pair_identification():
     ])
     res = dbc.Row([
         dbc.Col([
-                html.Div(id='pair-data-1')
+                html.Div(id='pair-data-1', children=[
+                    # Pages and sorting are served by get_pairs_table, the browser only holds one page
+                    dash_table.DataTable(
+                        id='pairs-table',
+                        columns=[{"name": column, "id": column} for column in ['Ticker 1', 'Ticker 2', '\u03B2 1', '\u03B2 2', 'Market Cap 1/B',
+                                                                              'Market Cap 2/B', 'Coint', 'Hurst', 'MR', 'Total']],
+                        data=[],
+                        page_action='custom',
+                        page_current=0,
+                        page_size=14,
+                        sort_action='custom',
+                        sort_mode='single',
+                        sort_by=[],
+                        style_cell={'textAlign': 'left'},
+                    )
+                ])
             ], width=8),
             dbc.Col([
                 dcc.Graph(id='pair-plot-1')
             ], width=4)
     ], style={'margin-bottom': '20px'})
 
-    return html.Div([title, input_, load_res, res])
+    return html.Div([title, input_, progress, load_res, res])
 
 
-def hedging_ratio(names):
+def hedging_ratio():
     title = dbc.Row(dbc.Col(html.H2("Compute Hedging Ratio")), style={'margin-bottom': '20px'})
     
     input_ = dbc.Row([
-            dbc.Col(create_dropdown('ticker-dropdown-2', names, ["CDMO", "GOLF"]), width=4),
+            dbc.Col(create_dropdown('ticker-dropdown-2', ["CDMO", "GOLF"]), width=4),
             dbc.Col(create_date_picker('my-date-picker-range-2'), width="auto"),
             dbc.Col(
                 dbc.Button("Submit", id="submit-button-2", color="primary"),
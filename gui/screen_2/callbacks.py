@@ -1,31 +1,352 @@
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
-from dash import dcc, dash_table
+from dash import dcc, dash_table, no_update, ctx, Patch
 from dash.exceptions import PreventUpdate
 
 import plotly.graph_objects as go
 
-from gui.utils import str_to_date, date_handler, create_dropdown
-from finance.online_strategy import OnlineRegressionStrategy
-from finance.post_trade_analysis import PostTradeMetrics
-from data_loader.singleton import get_misc_connect
+from gui.utils import str_to_date, date_handler, create_dropdown, register_ticker_search, cached_outputs
+from finance.strategy_run import PairStrategyRun
+from finance.post_trade_analysis import BatchPostTradeMetrics
+from data_loader.singleton import get_misc_connect, LazyConnector
+from utils.jobs import get_job_queue
+from utils.session import get_session_store
 
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
-misc_connect = get_misc_connect()
+misc_connect = LazyConnector(get_misc_connect)
+job_queue = get_job_queue()
+session_store = get_session_store()
+
+CAPITAL = 10_000_000
+
+
+def run_pair_strategy(progress, tickers, method, hyperparameters, adf_window,
+                      start_date_train, end_date_train, start_date_trade, end_date_trade):
+    """
+    Background job behind the Submit button of the trading screen. Trains and
+    trades the pair, posts the trades and runs the rolling cointegration test,
+    reusing whichever of those stages are cached for the same inputs.
+
+    Returns
+    -------
+    dict
+        What plot_trade_results needs, without the strategy's database handles.
+    """
+    ticker_1, ticker_2 = tickers
+    run = PairStrategyRun(method+"Regression", CAPITAL, ticker_1, ticker_2,
+                          date_handler(start_date_train), date_handler(end_date_train),
+                          date_handler(start_date_trade), date_handler(end_date_trade),
+                          hyperparameters, adf_window, prices_version=misc_connect.get_versions("prices")[0])
+    return run.run(progress, post_to=misc_connect)
+
+
+def vertical_lines(dates, y_min, y_max):
+    """
+    x and y of a vertical line at every date, joined into one line broken by gaps.
+    """
+    x = np.empty(3 * len(dates), dtype=object)
+    x[0::3], x[1::3] = dates, dates
+    y = np.tile([y_min, y_max, np.nan], len(dates))
+    return x, y
+
+
+def plot_trade_results(result):
+    ticker_1, ticker_2 = result["ticker_1"], result["ticker_2"]
+    ts = result["ts"]
+    closed_trades = result["closed_trades"]
+    dates, coint_spread, p_values = result["dates"], result["coint_spread"], result["p_values"]
+    adf_window = result["adf_window"]
+    start_date_train, end_date_train = result["start_date_train"], result["end_date_train"]
+    start_date_trade, end_date_trade = result["start_date_trade"], result["end_date_trade"]
+
+    fig1 = go.Figure()
+    ts1 = ts[ts["Mode"] == "Trade"][ticker_1]
+    ts1.index = pd.to_datetime(ts1.index)
+    ts2 = ts[ts["Mode"] == "Trade"][ticker_2]
+    ts2.index = pd.to_datetime(ts2.index)
+    # Add line traces for ts1 and ts2
+    fig1.add_trace(go.Scatter(x=ts1.index, y=ts1.values, mode='lines', name=ticker_1, line=dict(color='orange')))
+    fig1.add_trace(go.Scatter(x=ts2.index, y=ts2.values, mode='lines', name=ticker_2, line=dict(color='blue')))
+
+    # Add trade details
+    y_values_combined = np.concatenate([ts1.values, ts2.values])
+
+    # Compute the lower and upper bounds
+    y_max = y_values_combined.max()*1.1
+    y_min = 0
+    fig1.update_yaxes(range=[y_min, y_max])
+    trades = list(closed_trades.values())
+    entry_dates = pd.to_datetime([trade["entry_date"] for trade in trades])
+    exit_dates = pd.to_datetime([trade["trade_exit_date"] for trade in trades])
+    pnls = np.array([trade["pnl"] for trade in trades], dtype=float)
+    normal = np.array([trade["long_ticker"] == ticker_1 for trade in trades], dtype=bool)
+
+    # One NaN-separated trace per category rather than two traces per trade
+    for mask, dash_style, name in [(normal, "dash", f"{ticker_1}/{ticker_2}"), (~normal, "dot", f"{ticker_2}/{ticker_1}")]:
+        if not mask.any():
+            continue
+        x, y = vertical_lines(entry_dates[mask], y_min, y_max)
+        fig1.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(color='green', dash=dash_style), name="Enter " + name))
+        x, y = vertical_lines(exit_dates[mask], y_min, y_max)
+        fig1.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(color='red', dash=dash_style), name="Exit " + name))
+
+    # Trade days, each exit is booked on the first trading day on or after it
+    days = ts1.index
+    exit_days = np.minimum(days.searchsorted(exit_dates), len(days) - 1)
+    if len(trades):
+        # PnL of each trade at the exit price of its long leg, as a single marker trace
+        exit_prices = np.where(normal, ts1.values[exit_days], ts2.values[exit_days])
+        fig1.add_trace(go.Scatter(x=days[exit_days], y=exit_prices, mode='markers', name="PnL",
+                                  marker=dict(color=np.where(pnls >= 0, 'green', 'red'), symbol='triangle-down', size=9),
+                                  text=np.round(pnls, 2), hovertemplate="%{x}<br>PnL: %{text}<extra></extra>"))
+
+    fig1.update_layout(xaxis_title="Date", yaxis_title="Price")
+    fig1.update_layout(margin=dict(l=0, r=0, t=36, b=0))
+
+    # Daily PnL on the trade days, summed per exit day
+    pnl_total, pnl_normal, pnl_swapped = np.zeros((3, len(days)))
+    np.add.at(pnl_total, exit_days, pnls)
+    np.add.at(pnl_normal, exit_days[normal], pnls[normal])
+    np.add.at(pnl_swapped, exit_days[~normal], pnls[~normal])
+    df = pd.DataFrame({'PnLSwapped': pnl_swapped, 'PnLNormal': pnl_normal, 'PnL': pnl_total}, index=days)
+
+    fig2 = go.Figure()
+    fig2.add_trace(go.Scatter(x = df.index, y=df["PnL"].cumsum(), mode='lines', name=f"Profit"))
+    fig2.add_trace(go.Scatter(x = df.index, y=df["PnLNormal"].cumsum(), mode='lines', line=dict(dash='dash'), name=f"Normal {ticker_1}/{ticker_2}"))
+    fig2.add_trace(go.Scatter(x = df.index, y=df["PnLSwapped"].cumsum(), mode='lines', line=dict(dash='dash'), name=f"Swapped {ticker_2}/{ticker_1}"))
+    fig2.update_layout(yaxis_title="Profit", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
+    fig2.update_layout(legend=dict(x=0,y=1,xanchor='left',yanchor='top'))
+
+
+    final_total_profit = df["PnL"].cumsum().iloc[-1] 
+    final_normal_profit = df["PnLNormal"].cumsum().iloc[-1] 
+    final_swapped_profit = df["PnLSwapped"].cumsum().iloc[-1] 
+
+    unique_final_profits = {
+        final_total_profit: f"Total",
+        final_normal_profit: f"Normal",
+        final_swapped_profit: f"Swapped",
+    }
+
+    # Create annotations for each unique final profit
+    annotations = []
+    for profit, label in unique_final_profits.items():
+        y_values = [
+            final_total_profit if label == "Total" else None,
+            final_normal_profit if label == f"Normal" else None,
+            final_swapped_profit if label == f"Swapped" else None,
+        ]
+        y_values = [y for y in y_values if y is not None]
+        y_pos = y_values[0]  # Position for the annotation (they are equal, so any value can be used)
+
+        text = f"<b>{profit:.3e}</b>"
+
+        annotations.append(
+            dict(
+                x=df.index[-1], y=y_pos,
+                text=text,
+                showarrow=True, arrowhead=2, ax=-10, ay=-40,
+                font=dict(size=12)
+            )
+        )
+
+    fig2.update_layout(annotations=annotations)
+
+    res = np.array(result['store_res'])
+
+    # Create a Plotly figure
+    fig3 = go.Figure()
+    # Add line traces for each column in res
+    fig3.add_trace(go.Scatter(y=res[:, 0], mode='lines', name="Normal Buy"))
+    fig3.add_trace(go.Scatter(y=res[:, 1], mode='lines', name="Swapped Buy"))
+    fig3.add_trace(go.Scatter(y=res[:, 2], mode='lines', name="Normal Sell"))
+    fig3.add_trace(go.Scatter(y=res[:, 3], mode='lines', name="Swapped Sell"))
+    fig3.add_trace(go.Scatter(y=coint_spread, mode='lines', name=f"Cointegration: {adf_window}"))
+
+    if not np.isnan(res[:, 4]).any() and not np.isnan(res[:, 5]).any():
+        fig3.add_trace(go.Scatter(y=res[:, 4], mode='lines', name="Normal StopLoss"))
+        fig3.add_trace(go.Scatter(y=res[:, 5], mode='lines', name="Swapped StopLoss"))
+    fig3.add_trace(go.Scatter(y=res[:, -1], mode='lines', name="Estimated Spread"))
+
+    # Set title, x label, and legend position
+    fig3.update_layout(yaxis_title="Spread", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
+    print('-'*50)
+    print(f'For Pair Strategy: {ticker_1} / {ticker_2}')
+    print(f"Training: {start_date_train} / {end_date_train}")
+    print(f"Trading: {start_date_trade} / {end_date_trade}")
+    print(f"Starting Capital: {result['starting_capital']}")
+    print(f"Profit: {result['pnl']}")
+    print(f"Trades: {len(closed_trades)}")
+    #print(f"Sharpe Ratio: {strategy.portfolio.calculate_sharpe_ratio(0.01)}")
+    #print(f"Max Drawdown: {strategy.portfolio.calculate_max_drawdown()}")
+    #print(f"Calmar Ratio: {strategy.portfolio.calculate_calmar_ratio()}")
+    #print(f"Sortino Ratio: {strategy.portfolio.calculate_sortino_ratio(0.01, 0.01)}")
+
+    print('-'*50)
+
+
+    fig4 = go.Figure()
+    fig4.add_trace(go.Scatter(x=dates, y=p_values, mode='lines', name="p-value"))
+    fig4.update_layout(yaxis_title="ADF p-value", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
+    return fig1, fig2, fig3, fig4
+
+
+def risk_metric_results(uuids, risk_free_rate, target_rate, max_rows=14):
+    """
+    Expanding risk metric curves and summary rows of stored strategies.
+
+    Returns
+    -------
+    tuple
+        Sharpe, max drawdown, calmar and sortino figures with one trace per
+        strategy, the table rows of the first max_rows strategies and the uuids
+        found in the database, in plotting order.
+    """
+    # One $in query per collection, without the trade lists or tracked portfolios
+    res_dict = misc_connect.query_uuids(uuids,
+                                        parameters_projection={"method": 1},
+                                        results_projection={"results.historic_pnl": 1, "results.growth": 1, "summary.number_trades": 1},
+                                        collections=("data", "portfolio"))
+    res_dict = {uuid: value for uuid, value in res_dict.items() if value["data"] is not None and value["portfolio"] is not None}
+    uuids = list(res_dict.keys())
+    if len(uuids) < 1:
+        return [], [], []
+    
+    # Strategies stored before summaries existed still need their trades counted
+    missing_counts = [uuid for uuid in uuids[:max_rows] if "number_trades" not in res_dict[uuid]["portfolio"].get("summary", {})]
+    if len(missing_counts) > 0:
+        for uuid, value in misc_connect.query_uuids(missing_counts, collections=("trades",)).items():
+            trades = value["trades"]["trades"] if value["trades"] is not None else {}
+            res_dict[uuid]["portfolio"].setdefault("summary", {})["number_trades"] = len(trades)
+    
+    # All strategies are evaluated together on a padded (K, T) return matrix
+    batch = BatchPostTradeMetrics({key: value["portfolio"]["results"]["historic_pnl"] for key, value in res_dict.items()})
+    store_curves = batch.historic_metrics(risk_free_rate, target_rate)
+    final_metrics = batch.final_metrics(risk_free_rate, target_rate, store_curves)
+    
+    figures = []
+    for metric, yaxis_title, xaxis_title in [("sharpe", "Sharpe Ratio", "Time"),
+                                             ("max_drawdown", "Max Drawdown", "Trading Duration"),
+                                             ("calmar", "Calmar Ratio", "Trading Duration"),
+                                             ("sortino", "Sortino Ratio", "Trading Duration")]:
+        fig = go.Figure()
+        for key in batch.keys:
+            curve = batch.get_curve(store_curves, metric, key)
+            fig.add_trace(go.Scatter(x = np.linspace(0,1,len(curve)), y=curve, mode='lines', name=f"{key}",  showlegend=False))
+        fig.update_layout(yaxis_title=yaxis_title, xaxis_title=xaxis_title, margin=dict(l=0, r=0, t=36, b=0))
+        figures.append(fig)
+    data = []
+    for uuid in uuids[:max_rows]:
+        row_index = batch.keys.index(uuid)
+        row = {
+            "ID": uuid,
+            "method": res_dict[uuid]["data"]["method"].split("Regression")[0],
+            "length": len(res_dict[uuid]["portfolio"]["results"]["historic_pnl"]),
+            "number_trade": res_dict[uuid]["portfolio"]["summary"]["number_trades"],
+            "pnl": res_dict[uuid]["portfolio"]["results"]["growth"],
+            "sharpe": float(np.round(final_metrics["sharpe"][row_index], 2)),
+            "max_drawdown": float(np.round(final_metrics["max_drawdown"][row_index], 2)),
+            "calmar": float(np.round(final_metrics["calmar"][row_index], 2)),
+            "sortino": float(np.round(final_metrics["sortino"][row_index], 2)),
+        }
+        data.append(row)
+
+    return figures, data, uuids
+
+
+def risk_metrics_table(data):
+    table = dash_table.DataTable(
+        data=data,
+        columns=[{'name': 'ID', 'id': 'ID'},
+                 {'name': 'Method', 'id': 'method'},
+                 {'name': 'Length', 'id': 'length'},
+                 {'name': 'N Trades', 'id': 'number_trade'},
+                 {'name': 'PnL %', 'id': 'pnl'},
+                 {'name': 'Sharpe', 'id': 'sharpe'},
+                 {'name': 'Drawdown', 'id': 'max_drawdown'},
+                 {'name': 'Calmar', 'id': 'calmar'},
+                 {'name': 'Sortino', 'id': 'sortino'},],
+        style_cell={
+            'textAlign': 'left',
+            'overflow': 'hidden', # this line will keep the text from spilling out of the cell
+            'textOverflow': 'ellipsis', # this line will truncate the text with an ellipsis
+            'maxWidth': 0, # this line will allow the text to break across lines
+            'whiteSpace': 'normal' # this line will allow the text to break across lines
+
+        },
+        style_data_conditional=[{'if': {'column_id': 'column 1'}, 'textOverflow': 'ellipsis'}],
+        style_table={
+            'overflowX': 'scroll', # this line will make the table horizontally scrollable
+        },
+        css=[{
+            'selector': '.dash-cell div.dash-cell-value',
+            'rule': 'display: inline; white-space: inherit; overflow: inherit; text-overflow: inherit;'
+        }]
+        )
+    return table
+
+
+def patch_risk_metrics(view, uuids, risk_free_rate, target_rate, max_rows=14):
+    """
+    Partial updates of the risk metric figures when the strategy list grows or
+    shrinks at its end with the same rates. Only the added traces are sent, or
+    the removed ones deleted, instead of all four figures. view, the state the
+    client shows, is updated in place.
+
+    Returns
+    -------
+    tuple or None
+        Patches of the four figures and the table, None if uuids doesn't extend
+        or truncate the plotted list.
+    """
+    previous = view["uuids"]
+    if len(uuids) > len(previous) and uuids[:len(previous)] == previous:
+        figures, data, plotted = risk_metric_results(uuids[len(previous):], risk_free_rate, target_rate, max_rows)
+        patches = [no_update] * 4
+        if len(plotted) > 0:
+            patches = []
+            for figure in figures:
+                patch = Patch()
+                patch["data"].extend(figure.to_plotly_json()["data"])
+                patches.append(patch)
+        table = no_update
+        if len(view["data"]) < max_rows and len(data) > 0:
+            view["data"] = (view["data"] + data)[:max_rows]
+            table = risk_metrics_table(view["data"])
+        view["plotted"] = view["plotted"] + plotted
+    elif len(uuids) < len(previous) and previous[:len(uuids)] == uuids:
+        kept = set(uuids)
+        plotted = [uuid for uuid in view["plotted"] if uuid in kept]
+        if len(plotted) < 1:
+            return None
+        patches = []
+        for _ in range(4):
+            patch = Patch()
+            # Traces are in plotting order, so the removed ones are the last
+            for index in reversed(range(len(plotted), len(view["plotted"]))):
+                del patch["data"][index]
+            patches.append(patch)
+        # The rows are a prefix of the plotted strategies, so they are truncated the same way
+        data = [row for row in view["data"] if row["ID"] in kept]
+        table = risk_metrics_table(data) if len(data) < len(view["data"]) else no_update
+        view["plotted"], view["data"] = plotted, data
+    else:
+        return None
+    view["uuids"] = list(uuids)
+    return *patches, table
+
+
+def register_trade_callbacks(app):
+    for dropdown_id in ['trade-ticker-dropdown-1', 'ticker-options-main-1', 'ticker-options-search-1']:
+        register_ticker_search(app, dropdown_id)
 
-global uuids
-def register_trade_callbacks(app, names):
-    global uuids
-    uuids = None
     @app.callback(
-        [Output('trade-results-1', 'figure'),
-         Output('trade-results-2', 'figure'),
-         Output('trade-results-3', 'figure'),
-         Output('trade-results-4', 'figure')
-         ],
+        [Output('trade-job-id', 'data'),
+         Output('trade-job-interval', 'disabled'),
+         Output('trade-job-status', 'children')],
          [
              Input('run-trade-button', 'n_clicks'),
              Input('trade-ticker-dropdown-1', 'value'),
@@ -48,262 +369,45 @@ def register_trade_callbacks(app, names):
                                maxlen, adf_window, start_date_train, end_date_train,
                                start_date_trade, end_date_trade):
         if n is None or n == 0:
-            fig_1 = go.Figure()
-            fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            return fig_1, fig_1, fig_1, fig_1
-        if tickers is None:
-            fig_1 = go.Figure()
-            fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            return fig_1, fig_1, fig_1, fig_1
-        if len(tickers) != 2:
-            fig_1 = go.Figure()
-            fig_1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            return fig_1, fig_1, fig_1, fig_1
-        
-        start_date_train = date_handler(start_date_train)
-        end_date_train = date_handler(end_date_train)
-        start_date_trade = date_handler(start_date_trade)
-        end_date_trade = date_handler(end_date_trade)
+            return None, True, ""
+        if tickers is None or len(tickers) != 2:
+            return None, True, ""
 
-        CAPITAL = 10_000_000
-        ticker_1, ticker_2 = tickers
         hyperparameters = {"buy_sigma": sigma_buy, "sell_sigma_low": sigma_sell_low,
                      "sell_sigma_high": sigma_sell_high, "maxlen": maxlen}
-        method_name = method+"Regression"
-
-        strategy = OnlineRegressionStrategy(method_name, CAPITAL, ticker_1, ticker_2, 
-                                            start_date_train, end_date_train,
-                                            start_date_trade, end_date_trade,
-                                            hyperparameters, None)
-        strategy.train_model()
-        strategy.trade_model()
-        strategy.post_trades(misc_connect)
-        # Cointegration results
-        dates, coint_spread, p_values = strategy.run_cointegration_test(adf_window)
-
-        fig1 = go.Figure()
-        ts1 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_1]
-        ts1.index = pd.to_datetime(ts1.index)
-        ts2 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_2]
-        ts2.index = pd.to_datetime(ts2.index)
-        # Add line traces for ts1 and ts2
-        fig1.add_trace(go.Scatter(x=ts1.index, y=ts1.values, mode='lines', name=ticker_1, line=dict(color='orange')))
-        fig1.add_trace(go.Scatter(x=ts2.index, y=ts2.values, mode='lines', name=ticker_2, line=dict(color='blue')))
-
-        # Add trade details
-        ticker_1 = strategy.ticker_1
-        ticker_2 = strategy.ticker_2
-        y_values_combined = np.concatenate([ts1.values, ts2.values])
-
-        # Compute the lower and upper bounds
-        y_max = y_values_combined.max()*1.1
-        y_min = 0
-        fig1.update_yaxes(range=[y_min, y_max])
-        legend_1, legend_2 = None, None
-        for key in list(strategy.portfolio.closed_trades.keys()):
-            trade = strategy.portfolio.closed_trades[key]
-            entry_date = pd.to_datetime(trade["entry_date"])
-            exit_date = pd.to_datetime(trade["trade_exit_date"])
-            pnl = trade["pnl"]
-
-            if trade['long_ticker'] == ticker_1:
-                dash_style = "dash"
-                name = f"{ticker_1}/{ticker_2}"
-                if legend_1 is None:
-                    legend_1 = True
-                fig1.add_annotation(x=exit_date, y=ts1.loc[exit_date], text=np.round(pnl, 2), showarrow=True, arrowhead=1, arrowcolor='green')
-
-            else:
-                dash_style = "dot"
-                name = f"{ticker_1}/{ticker_2}"
-                if legend_2 is None:
-                    legend_2 = True
-                fig1.add_annotation(x=exit_date, y=ts2.loc[exit_date], text=np.round(pnl, 2), showarrow=True, arrowhead=1, arrowcolor='green')
-
-
-
-            if legend_1 or legend_2:
-                fig1.add_trace(go.Scatter(
-                    x=[entry_date, entry_date], 
-                    y=[y_min,y_max], 
-                    mode='lines', 
-                    line=dict(color='green', dash=dash_style), 
-                    name="Enter " + name, # Legend label 
-                    yaxis='y1'))
-
-                fig1.add_trace(go.Scatter(
-                    x=[exit_date, exit_date], 
-                    y=[y_min,y_max], 
-                    mode='lines', 
-                    line=dict(color='red', dash=dash_style), 
-                    name="Exit " + name, # Legend label 
-                    yaxis='y1'))
-                if legend_1:
-                    legend_1 = False
-                if legend_2:
-                    legend_2 = False
-            else:
-                fig1.add_trace(go.Scatter(
-                    x=[entry_date, entry_date], 
-                    y=[y_min,y_max], 
-                    mode='lines', 
-                    line=dict(color='green', dash=dash_style), 
-                    name="Enter " + name, # Legend label 
-                    yaxis='y1',
-                    showlegend=False))
-
-                fig1.add_trace(go.Scatter(
-                    x=[exit_date, exit_date], 
-                    y=[y_min,y_max], 
-                    mode='lines', 
-                    line=dict(color='red', dash=dash_style), 
-                    name="Exit " + name, # Legend label 
-                    yaxis='y1',
-                    showlegend=False))
-
-        fig1.update_layout(xaxis_title="Date", yaxis_title="Price")
-        fig1.update_layout(margin=dict(l=0, r=0, t=36, b=0))
-        ts1 = strategy.ts[strategy.ts["Mode"] == "Train"][ticker_1]
-        ts1.index = pd.to_datetime(ts1.index)
-        ts2 = strategy.ts[strategy.ts["Mode"] == "Train"][ticker_2]
-        ts2.index = pd.to_datetime(ts2.index)
-
-        # Plot portfolio value
-        trades_ = strategy.portfolio.closed_trades
-
-        exit_dates = [trades_[record]["trade_exit_date"] for record in trades_.keys()]
-
-        pnls = [trades_[record]["pnl"] for record in trades_.keys()]
-
-        exit_dates_normal = [trades_[record]["trade_exit_date"] for record in trades_.keys() if trades_[record]["long_ticker"] == ticker_1]
-        exit_dates_swapped = [trades_[record]["trade_exit_date"] for record in trades_.keys() if trades_[record]["long_ticker"] == ticker_2]
-
-        pnls_normal = [trades_[record]["pnl"] for record in trades_.keys() if trades_[record]["long_ticker"] == ticker_1]
-        pnls_swapped = [trades_[record]["pnl"] for record in trades_.keys() if trades_[record]["long_ticker"] == ticker_2]
-
-        # Create date range
-        all_dates = pd.date_range(start=start_date_trade, end=end_date_trade, freq='D')
-        # Create DataFrame
-        df = pd.DataFrame(index=all_dates)
-        df['PnLSwapped'] = None
-        df['PnLNormal'] = None
-        df['PnL'] = None
-
-        # Fill PnL_Exit column with PnL values at exit dates
-        for date, pnl in zip(exit_dates, pnls):
-            df.loc[date, 'PnL'] = pnl
-
-        # Fill PnL_Exit column with PnL values at exit dates
-        for date, pnl in zip(exit_dates_normal, pnls_normal):
-            df.loc[date, 'PnLNormal'] = pnl
-        
-        # Fill PnL_Exit column with PnL values at exit dates
-        for date, pnl in zip(exit_dates_swapped, pnls_swapped):
-            df.loc[date, 'PnLSwapped'] = pnl
-        
-        # Fill forward PnL column
-        df['PnL'] = df['PnL'].fillna(0)
-        df['PnLSwapped'] = df['PnLSwapped'].fillna(0)
-        df['PnLNormal'] = df['PnLNormal'].fillna(0)
-
-        # Fill with zeros between the first date and the first trade
-        if len(exit_dates)>= 1:
-            first_trade_date = exit_dates[0]
-            df.loc[:first_trade_date, 'PnL'] = df.loc[:first_trade_date, 'PnL'].fillna(0)
-        else:
-            df['PnL'] = df['PnL'].fillna(0)
-        if len(exit_dates_normal)>= 1:
-            first_trade_date = exit_dates_normal[0]
-            df.loc[:first_trade_date, 'PnLNormal'] = df.loc[:first_trade_date, 'PnLNormal'].fillna(0)
-        else:
-            df['PnLNormal'] = df['PnLNormal'].fillna(0)
-
-        if len(exit_dates_swapped)>= 1:
-            first_trade_date = exit_dates_swapped[0]
-            df.loc[:first_trade_date, 'PnLSwapped'] = df.loc[:first_trade_date, 'PnLSwapped'].fillna(0)
-        else:
-            df['PnLSwapped'] = df['PnLSwapped'].fillna(0)
-        # Resulting DataFrame
-        
-        fig2 = go.Figure()
-        fig2.add_trace(go.Scatter(x = df.index, y=df["PnL"].cumsum(), mode='lines', name=f"Profit"))
-        fig2.add_trace(go.Scatter(x = df.index, y=df["PnLNormal"].cumsum(), mode='lines', line=dict(dash='dash'), name=f"Normal {ticker_1}/{ticker_2}"))
-        fig2.add_trace(go.Scatter(x = df.index, y=df["PnLSwapped"].cumsum(), mode='lines', line=dict(dash='dash'), name=f"Swapped {ticker_2}/{ticker_1}"))
-        fig2.update_layout(yaxis_title="Profit", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
-        fig2.update_layout(legend=dict(x=0,y=1,xanchor='left',yanchor='top'))
-
-
-        final_total_profit = df["PnL"].cumsum().iloc[-1] 
-        final_normal_profit = df["PnLNormal"].cumsum().iloc[-1] 
-        final_swapped_profit = df["PnLSwapped"].cumsum().iloc[-1] 
-
-        unique_final_profits = {
-            final_total_profit: f"Total",
-            final_normal_profit: f"Normal",
-            final_swapped_profit: f"Swapped",
-        }
+        params = {"tickers": list(tickers), "method": method, "hyperparameters": hyperparameters,
+                  "adf_window": adf_window,
+                  "start_date_train": start_date_train, "end_date_train": end_date_train,
+                  "start_date_trade": start_date_trade, "end_date_trade": end_date_trade}
+        # A resubmitted run reuses its cached stages rather than a finished job
+        job_id = job_queue.submit("pair_strategy", run_pair_strategy, params, dedupe=False)
+        return job_id, False, "Queued..."
 
-        # Create annotations for each unique final profit
-        annotations = []
-        for profit, label in unique_final_profits.items():
-            y_values = [
-                final_total_profit if label == "Total" else None,
-                final_normal_profit if label == f"Normal" else None,
-                final_swapped_profit if label == f"Swapped" else None,
-            ]
-            y_values = [y for y in y_values if y is not None]
-            y_pos = y_values[0]  # Position for the annotation (they are equal, so any value can be used)
-
-            text = f"<b>{profit:.3e}</b>"
-
-            annotations.append(
-                dict(
-                    x=df.index[-1], y=y_pos,
-                    text=text,
-                    showarrow=True, arrowhead=2, ax=-10, ay=-40,
-                    font=dict(size=12)
-                )
-            )
-
-        fig2.update_layout(annotations=annotations)
-
-        res = np.array(strategy.store_res)
-
-        # Create a Plotly figure
-        fig3 = go.Figure()
-        # Add line traces for each column in res
-        fig3.add_trace(go.Scatter(y=res[:, 0], mode='lines', name="Normal Buy"))
-        fig3.add_trace(go.Scatter(y=res[:, 1], mode='lines', name="Swapped Buy"))
-        fig3.add_trace(go.Scatter(y=res[:, 2], mode='lines', name="Normal Sell"))
-        fig3.add_trace(go.Scatter(y=res[:, 3], mode='lines', name="Swapped Sell"))
-        fig3.add_trace(go.Scatter(y=coint_spread, mode='lines', name=f"Cointegration: {adf_window}"))
-
-        if not np.isnan(res[:, 4]).any() and not np.isnan(res[:, 5]).any():
-            fig3.add_trace(go.Scatter(y=res[:, 4], mode='lines', name="Normal StopLoss"))
-            fig3.add_trace(go.Scatter(y=res[:, 5], mode='lines', name="Swapped StopLoss"))
-        fig3.add_trace(go.Scatter(y=res[:, -1], mode='lines', name="Estimated Spread"))
-
-        # Set title, x label, and legend position
-        fig3.update_layout(yaxis_title="Spread", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
-        print('-'*50)
-        print(f'For Pair Strategy: {ticker_1} / {ticker_2}')
-        print(f"Training: {start_date_train} / {end_date_train}")
-        print(f"Trading: {start_date_trade} / {end_date_trade}")
-        print(f"Starting Capital: {strategy.portfolio.starting_capital}")
-        print(f"Profit: {strategy.portfolio.pnl}")
-        print(f"Trades: {len(strategy.portfolio.closed_trades)}")
-        #print(f"Sharpe Ratio: {strategy.portfolio.calculate_sharpe_ratio(0.01)}")
-        #print(f"Max Drawdown: {strategy.portfolio.calculate_max_drawdown()}")
-        #print(f"Calmar Ratio: {strategy.portfolio.calculate_calmar_ratio()}")
-        #print(f"Sortino Ratio: {strategy.portfolio.calculate_sortino_ratio(0.01, 0.01)}")
-
-        print('-'*50)
-
-
-        fig4 = go.Figure()
-        fig4.add_trace(go.Scatter(x=dates, y=p_values, mode='lines', name="p-value"))
-        fig4.update_layout(yaxis_title="ADF p-value", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
-        return fig1, fig2, fig3, fig4
+    @app.callback(
+        [Output('trade-results-1', 'figure'),
+         Output('trade-results-2', 'figure'),
+         Output('trade-results-3', 'figure'),
+         Output('trade-results-4', 'figure'),
+         Output('trade-job-status', 'children', allow_duplicate=True),
+         Output('trade-job-interval', 'disabled', allow_duplicate=True)],
+        [Input('trade-job-interval', 'n_intervals')],
+        [State('trade-job-id', 'data')],
+        prevent_initial_call=True
+    )
+    def poll_trade_results(n, job_id):
+        if job_id is None:
+            return no_update, no_update, no_update, no_update, "", True
+        status = job_queue.status(job_id)
+        if status is None:
+            return no_update, no_update, no_update, no_update, "Strategy run not found.", True
+        if status["status"] == "failed":
+            return no_update, no_update, no_update, no_update, f"Strategy run failed: {status['error']}", True
+        if status["status"] != "done":
+            return no_update, no_update, no_update, no_update, status["message"] or "Queued...", False
+        result = job_queue.result(job_id)
+        if result is None:
+            return no_update, no_update, no_update, no_update, "Strategy results are no longer available, please run it again.", True
+        return *plot_trade_results(result), "", True
     
 
 
@@ -313,12 +417,12 @@ def register_trade_callbacks(app, names):
         Output('empty-div', 'children'),
         Output('uuid-storage-final', 'data'),
         Input('submit-button-trade', 'n_clicks'),
+        State('session-id', 'data'),
     )
-    def evaluate_strategy(n):
+    def evaluate_strategy(n, session_id):
         if n is None or n == 0:
             return "", {}
-        global uuids
-        
+        uuids = session_store.get(session_id, "uuids")
         if uuids is None:
             return "", {}
         if len(uuids) < 1:
@@ -340,9 +444,10 @@ def register_trade_callbacks(app, names):
         Input('uuid-storage-final', 'data')],
         [
         State('target-return', 'value'),
-        State('risk-free-rate', 'value')]
+        State('risk-free-rate', 'value'),
+        State('session-id', 'data')]
     )
-    def plot_results(n, uuids, target_rate, risk_free_rate):
+    def plot_results(n, uuids, target_rate, risk_free_rate, session_id):
         if n is None or n == 0:
             fig = go.Figure()
             fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
@@ -355,105 +460,27 @@ def register_trade_callbacks(app, names):
             fig = go.Figure()
             fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
             return fig, fig, fig, fig, ""
-        
-
-        res_dict = {}
-        for uuid in uuids:
-            strategy_data, strategy_portfolio_data, strategy_trade_data  = misc_connect.query_uuid(uuid)
-            res_dict[uuid] = {"data": list(strategy_data)[0], "portfolio": list(strategy_portfolio_data)[0], "trades": list(strategy_trade_data)[0]}
 
-        fig = go.Figure()
-        fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-        store_portfolios = {}
-        for key, value in res_dict.items():
-            post_trade = PostTradeMetrics(value["data"]["ticker_1"], value["data"]["ticker_2"], value["data"]["start_date_trade"], value["data"]["end_date_trade"])
-            post_trade.initialise_portfolio(value["portfolio"]["results"]["starting_capital"], value["portfolio"]["results"]["historic_pnl"], value["portfolio"]["results"]["pnl"], value["portfolio"]["results"]["growth"])
-            post_trade.initialise_trades(value["trades"])
-
-            store_portfolios[key] = post_trade
-
-        max_duration = 0
-        # Metric 1: Sharpe Ratio
-        fig1 = go.Figure()
-        fig1.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-        for key, value in store_portfolios.items():
-            hist_sharpe = value.historic_sharpe_ratio(risk_free_rate)
-            fig1.add_trace(go.Scatter(x = np.linspace(0,1,len(hist_sharpe,)), y=hist_sharpe, mode='lines', name=f"{key}",  showlegend=False))
-            
-            if len(hist_sharpe) > max_duration:
-                max_duration = len(hist_sharpe)
-        fig1.update_layout(yaxis_title="Sharpe Ratio", xaxis_title="Time", margin=dict(l=0, r=0, t=36, b=0))
-
-        # Metric 2: Max Drawdown
-        fig2 = go.Figure()
-        fig2.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-        for key, value in store_portfolios.items():
-            max_drawdown = value.historic_max_drawdown()
-            fig2.add_trace(go.Scatter(x = np.linspace(0,1,len(max_drawdown,)), y=max_drawdown, mode='lines', name=f"{key}",  showlegend=False))
-        fig2.update_layout(yaxis_title="Max Drawdown", xaxis_title="Trading Duration", margin=dict(l=0, r=0, t=36, b=0))
-
-        # Metric 3: Calmar Ratio
-        fig3 = go.Figure()
-        fig3.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-        for key, value in store_portfolios.items():
-            calmar_ratio = value.historic_calmar_ratio()
-            fig3.add_trace(go.Scatter(x = np.linspace(0,1,len(calmar_ratio,)), y=calmar_ratio, mode='lines', name=f"{key}",  showlegend=False))
-        fig3.update_layout(yaxis_title="Calmar Ratio", xaxis_title="Trading Duration", margin=dict(l=0, r=0, t=36, b=0))
-
-        # Metric 4: Sortino Ratio
-        fig4 = go.Figure()
-        fig4.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-        for key, value in store_portfolios.items():
-            sortino_ratio = value.historic_sortino_ratio(risk_free_rate, target_rate)
-            fig4.add_trace(go.Scatter(x = np.linspace(0,1,len(sortino_ratio,)), y=sortino_ratio, mode='lines', name=f"{key}",  showlegend=False))
-
-        fig4.update_layout(yaxis_title="Sortino Ratio", xaxis_title="Trading Duration", margin=dict(l=0, r=0, t=36, b=0))
-
-            
-        data = []
-        for uuid in uuids[:14]:
-            row = {
-                "ID": uuid,
-                "method": res_dict[uuid]["data"]["method"].split("Regression")[0],
-                "length": len(res_dict[uuid]["portfolio"]["results"]["historic_pnl"]),
-                "number_trade": len(res_dict[uuid]["trades"]["trades"]),
-                "pnl": res_dict[uuid]["portfolio"]["results"]["growth"],
-                "sharpe": float(np.round(store_portfolios[uuid].calculate_sharpe_ratio(risk_free_rate), 2)),
-                "max_drawdown": float(np.round(store_portfolios[uuid].calculate_max_drawdown(), 2)),
-                "calmar": float(np.round(store_portfolios[uuid].calculate_calmar_ratio(), 2)),
-                "sortino": float(np.round(store_portfolios[uuid].calculate_sortino_ratio(risk_free_rate, target_rate), 2)),
-            }
-            data.append(row)
-
-        table = dash_table.DataTable(
-            data=data,
-            columns=[{'name': 'ID', 'id': 'ID'},
-                     {'name': 'Method', 'id': 'method'},
-                     {'name': 'Length', 'id': 'length'},
-                     {'name': 'N Trades', 'id': 'number_trade'},
-                     {'name': 'PnL %', 'id': 'pnl'},
-                     {'name': 'Sharpe', 'id': 'sharpe'},
-                     {'name': 'Drawdown', 'id': 'max_drawdown'},
-                     {'name': 'Calmar', 'id': 'calmar'},
-                     {'name': 'Sortino', 'id': 'sortino'},],
-            style_cell={
-                'textAlign': 'left',
-                'overflow': 'hidden', # this line will keep the text from spilling out of the cell
-                'textOverflow': 'ellipsis', # this line will truncate the text with an ellipsis
-                'maxWidth': 0, # this line will allow the text to break across lines
-                'whiteSpace': 'normal' # this line will allow the text to break across lines
-                
-            },
-            style_data_conditional=[{'if': {'column_id': 'column 1'}, 'textOverflow': 'ellipsis'}],
-            style_table={
-                'overflowX': 'scroll', # this line will make the table horizontally scrollable
-            },
-            css=[{
-                'selector': '.dash-cell div.dash-cell-value',
-                'rule': 'display: inline; white-space: inherit; overflow: inherit; text-overflow: inherit;'
-            }]
-            )
-        return fig1, fig2, fig3, fig4, table
+        version = misc_connect.get_versions("strategies")
+        view = session_store.get(session_id, "risk_metrics_view")
+        if (ctx.triggered_id == 'uuid-storage-final' and view is not None
+                and view["settings"] == (risk_free_rate, target_rate, version)):
+            patches = patch_risk_metrics(view, uuids, risk_free_rate, target_rate)
+            if patches is not None:
+                session_store.set(session_id, "risk_metrics_view", view)
+                return patches
+
+        figures, data, plotted = cached_outputs(
+            "risk_metrics", (tuple(uuids), risk_free_rate, target_rate, version),
+            lambda: risk_metric_results(uuids, risk_free_rate, target_rate))
+        if len(plotted) < 1:
+            fig = go.Figure()
+            fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
+            return fig, fig, fig, fig, ""
+        # What the client now shows, for patching it when strategies are added or removed
+        session_store.set(session_id, "risk_metrics_view", {
+            "settings": (risk_free_rate, target_rate, version), "uuids": list(uuids), "plotted": plotted, "data": data})
+        return *figures, risk_metrics_table(data)
 
 
 
@@ -493,7 +520,7 @@ def register_trade_callbacks(app, names):
                     start_date=datetime(2022, 6, 2),
                     end_date=datetime(2023, 7, 1),
                 ), width="auto"),
-                dbc.Col([create_dropdown("ticker-options-main-1", names, ["CDMO", "GOLF"])], width=3),
+                dbc.Col([create_dropdown("ticker-options-main-1", ["CDMO", "GOLF"])], width=3),
                 dbc.Col([dcc.Dropdown(id='method-selection-main-1', options=[{"label": "Kalman", "value": "Kalman", "search": "Kalman"},
                                                                       {"label": "OLS", "value": "OLS", "search": "OLS"}],
                                                                         placeholder='Method')], width=1),
@@ -525,7 +552,7 @@ def register_trade_callbacks(app, names):
             ])
         elif option == 'tickers':
             return dbc.Row([
-                dbc.Col([create_dropdown("ticker-options-search-1", names, ["CDMO", "GOLF"])], width=4),
+                dbc.Col([create_dropdown("ticker-options-search-1", ["CDMO", "GOLF"])], width=4),
                 dbc.Col(dbc.Button(
                     "Load", id="submit-button-trade", color="primary"
                     ),
@@ -572,50 +599,55 @@ def register_trade_callbacks(app, names):
         Input('training-dates', 'end_date'),
         Input('trade-dates', 'start_date'),
         Input('trade-dates', 'end_date'),
+        State('session-id', 'data'),
     )
-    def retrieve_specific_strategy(tickers, method, start_training_date, end_training_date, start_date_trade, end_date_trade):
+    def retrieve_specific_strategy(tickers, method, start_training_date, end_training_date, start_date_trade, end_date_trade, session_id):
         if tickers is None:
             raise PreventUpdate
         ticker_1, ticker_2 = tickers
-        global uuids
-        uuids = misc_connect.query_specific_strategy(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade)
+        uuids = list(misc_connect.query_specific_strategy(ticker_1, ticker_2, method, start_training_date, end_training_date, start_date_trade, end_date_trade))
+        session_store.set(session_id, "uuids", uuids)
 
-        return {'uuids': list(uuids)}
+        return {'uuids': uuids}
 
     @app.callback(
         Output('uuid-storage-2', 'data'),
         Input('top-k', 'value'),
+        State('session-id', 'data'),
     )
-    def retrieve_most_profitable(top_k):
+    def retrieve_most_profitable(top_k, session_id):
         if top_k is None:
             raise PreventUpdate
         
-        global uuids
-        uuids = misc_connect.query_most_profitable(top_k)
-        return {'uuids': list(uuids)}
+        uuids = [item["uuid"] for item in misc_connect.query_strategy_summaries(sort_by="growth", top_k=top_k)]
+        session_store.set(session_id, "uuids", uuids)
+        return {'uuids': uuids}
 
     @app.callback(
         Output('uuid-storage-3', 'data'),
         Input('ticker-options-search-1', 'value'),
+        State('session-id', 'data'),
     )
-    def retrieve_by_tickers(tickers):
+    def retrieve_by_tickers(tickers, session_id):
         if tickers is None:
             raise PreventUpdate
         ticker_1, ticker_2 = tickers
-        global uuids
-        uuids = misc_connect.query_by_tickers(ticker_1, ticker_2)
-        return {'uuids': list(uuids)}
+        uuids = list(misc_connect.query_by_tickers(ticker_1, ticker_2))
+        session_store.set(session_id, "uuids", uuids)
+        return {'uuids': uuids}
 
     @app.callback(
         Output('uuid-storage-4', 'data'),
         Input('method-selection', 'value'),
+        State('session-id', 'data'),
     )
-    def retrieve_by_method(method):
+    def retrieve_by_method(method, session_id):
         if method is None:
             raise PreventUpdate
-        global uuids
-        uuids = misc_connect.query_by_method(method)
-        return {'uuids': list(uuids)}
+        # Most profitable first, from the (summary.method, summary.growth) index
+        uuids = [item["uuid"] for item in misc_connect.query_strategy_summaries({"method": method}, sort_by="growth")]
+        session_store.set(session_id, "uuids", uuids)
+        return {'uuids': uuids}
 
 
 
@@ -4,12 +4,13 @@ import dash_bootstrap_components as dbc
 from datetime import datetime
 
 from gui.utils import create_slider, create_dropdown, create_divider
+from finance.post_trade_analysis import DEFAULT_RISK_FREE_RATE, DEFAULT_TARGET_RETURN
 
-def get_trading_layout(names):
+def get_trading_layout():
     layout = html.Div([
         dbc.Container([
             get_title(),
-            run_single_trade(names),
+            run_single_trade(),
             create_divider(),
             load_trade(),
             evaluate_trade(),
@@ -20,11 +21,11 @@ def get_trading_layout(names):
 def get_title():
     return dbc.Row(dbc.Col(html.H1("Trading Simulation")), style={'margin-bottom': '20px', 'padding-top': "8%"})
 
-def run_single_trade(names):
+def run_single_trade():
     title = dbc.Row(dbc.Col(html.H2("Run Single Pair Strategies")), style={'margin-bottom': '20px'})
     
     input_ = dbc.Row([
-        dbc.Col(create_dropdown('trade-ticker-dropdown-1', names, ["CDMO", "GOLF"]), width=3),
+        dbc.Col(create_dropdown('trade-ticker-dropdown-1', ["CDMO", "GOLF"]), width=3),
         dbc.Col(dcc.Dropdown(
                 id = 'choose-method-dropdown',
                 options = [
@@ -64,6 +65,11 @@ def run_single_trade(names):
             style={'overflow': 'visible', 'text-align': 'left'}
         )
     ], style={'margin-bottom': '10px'})
+    job = dbc.Row([
+        dcc.Store(id='trade-job-id'),
+        dcc.Interval(id='trade-job-interval', interval=1000, disabled=True),
+        dbc.Col(html.Div(id='trade-job-status'), width="auto"),
+    ], style={'margin-bottom': '10px'})
 
 
     # Main trading graph placeholder
@@ -91,7 +97,7 @@ def run_single_trade(names):
             ], width=4)
     ], style={'margin-bottom': '30px'})
 
-    return html.Div([title, input_, hyperparameters, res, res_2])
+    return html.Div([title, input_, hyperparameters, job, res, res_2])
 
 def load_trade():
     title = dbc.Row(dbc.Col(html.H2("Post-Trade Analysis")), style={'margin-bottom': '20px'})
@@ -124,8 +130,8 @@ def load_trade():
 
 def evaluate_trade():
     input_ = dbc.Row([
-        create_slider('risk-free-rate', 0, 0.1, 0.01, 0.01),
-        create_slider('target-return', 0, 0.15, 0.01, 0.01),
+        create_slider('risk-free-rate', 0, 0.1, 0.01, DEFAULT_RISK_FREE_RATE),
+        create_slider('target-return', 0, 0.15, 0.01, DEFAULT_TARGET_RETURN),
         dbc.Col(dbc.Button("Evaluate", id="evaluate-button", color="primary"), width="auto", style={'overflow': 'visible', 'text-align': 'left'}),
     ], style={'margin-bottom': '10px', 'margin-top': '40px'})
 
@@ -1,16 +1,69 @@
-from dash import dcc, html
+from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from datetime import datetime
+import plotly.graph_objects as go
 
-def create_dropdown(id, names, default_values):
+from data_loader.ticker_search import get_ticker_search
+from utils.cache import get_figure_cache
+
+def create_dropdown(id, default_values):
+    # Only the selected tickers are sent with the layout, the rest come from
+    # the search callback registered with register_ticker_search
     dropdown= dcc.Dropdown(
         id=id,
-        options=[{'label': name.split(':', 1)[0], 'value': name.split(':', 1)[0], 'search': name} for name in names],
+        options=get_ticker_search().options(default_values),
         value=default_values,
         multi=True,
+        placeholder='Search tickers',
         style={'margin-bottom': '20px'}
     )
     return dropdown
+
+def register_ticker_search(app, id):
+    @app.callback(
+        Output(id, 'options'),
+        Input(id, 'search_value'),
+        State(id, 'value'),
+        prevent_initial_call=True
+    )
+    def search_tickers(search_value, value):
+        if search_value is None:
+            raise PreventUpdate
+        return get_ticker_search().search_options(search_value, value)
+
+
+def cached_outputs(name, key, build):
+    """
+    Outputs of a callback from the figure cache, built by build() on a miss.
+
+    Parameters
+    ----------
+    name : str
+        Name of the callback.
+    key : tuple
+        The callback inputs and the versions of the stored data the outputs are
+        built from, see MongoConnect.get_versions.
+    build : callable
+        Returns the callback's outputs as a tuple.
+
+    Returns
+    -------
+    tuple
+        The outputs, figures (also inside lists) as plain dicts. These skip plotly's validation when
+        read back and Dash sends them as they are.
+    """
+    figure_cache = get_figure_cache()
+    return figure_cache.get_or_compute(figure_cache.make_key(name, *key), lambda: figures_to_dicts(build()))
+
+
+def figures_to_dicts(outputs):
+    if isinstance(outputs, go.Figure):
+        return outputs.to_plotly_json()
+    if isinstance(outputs, (list, tuple)):
+        return type(outputs)(figures_to_dicts(output) for output in outputs)
+    return outputs
+
 # Function to create date picker
 def create_date_picker(id):
     return dcc.DatePickerRange(
@@ -79,10 +132,10 @@ def date_handler(date):
 def str_to_date(s):
     return datetime.strptime(s, "%Y-%m-%d")
 
-def get_all_clustering_results(misc_connect, n=0):
+def get_all_clustering_results(catalog, n=0):
     if n is not None and n != 0:
         options = []
-        dict_ = misc_connect.get_all_clustering_results()
+        dict_ = catalog.clustering_runs()
         for document in dict_:
             method = document['method']
             start_date = document['start_date']
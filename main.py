@@ -3,12 +3,25 @@ from data_loader.singleton import DatabaseConnection
 
 # MISC
 from argparse import ArgumentParser
+from utils.startup import print_import_profile, run_migrations
 
 parser = ArgumentParser()
 parser.add_argument("--mongo_url", type=str, default="mongodb://localhost:27017/")
 parser.add_argument("--db_name", type=str, default="equity_data")
+parser.add_argument("--server", type=str, default="dev", choices=["dev", "gunicorn", "waitress"],
+                    help="dev runs the Flask debug server, gunicorn or waitress serve with several workers.")
+parser.add_argument("--host", type=str, default="0.0.0.0")
+parser.add_argument("--port", type=int, default=8050)
+parser.add_argument("--workers", type=int, default=4)
+parser.add_argument("--threads", type=int, default=4)
+parser.add_argument("--profile_imports", action="store_true",
+                    help="Print the slowest imports of the dashboard and exit.")
 args = parser.parse_args()
 
+if args.profile_imports:
+    print_import_profile("dashboard")
+    raise SystemExit
+
 
 
 MONGO_URL = args.mongo_url
@@ -17,7 +30,11 @@ connection = DatabaseConnection(mongo_url=MONGO_URL, db_name=args.db_name)
 misc_connect = connection.misc_connect
 data_setter = connection.data_setter
 data_fetcher = connection.data_fetcher
+run_migrations(misc_connect)
 
-from dashboard import run_dashboard
+from dashboard import run_dashboard, run_production
 
-run_dashboard()
\ No newline at end of file
+if args.server == "dev":
+    run_dashboard()
+else:
+    run_production(args.server, host=args.host, port=args.port, workers=args.workers, threads=args.threads)
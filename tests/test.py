@@ -1,133 +1,646 @@
 # TEST TO RUN THE STRATEGY
+#
+# python -m tests.test runs a strategy end to end against MongoDB and plots it.
+# python -m pytest tests/test.py runs the unit tests below, which need neither.
 
-import pandas as pd
-from finance.online_strategy import OnlineRegressionStrategy
+import os
 import json
+import time
+import tempfile
+
 import numpy as np
-import matplotlib.pyplot as plt
-from data_loader.misc_connect import MongoConnect
-from argparse import ArgumentParser
-import os
-parser = ArgumentParser()
-parser.add_argument("--ticker_1", type=str, default="MD")
-parser.add_argument("--ticker_2", type=str, default="EA")
-parser.add_argument("--start_training_date", type=str, default="2020-06-01")
-parser.add_argument("--end_training_date", type=str, default="2022-06-01")
-parser.add_argument("--start_trading_date", type=str, default="2022-06-02")
-parser.add_argument("--end_trading_date", type=str, default="2023-06-02")
-parser.add_argument("--method", type=str, default="KalmanRegression")
-args = parser.parse_args()
-
-FIG_DIR = "{FIG_DIR}"
-
-if not os.path.exists(FIG_DIR):
-    os.makedirs(FIG_DIR)
-    
-m = MongoConnect()
-capital  = 1_000_000
-ticker_1 = args.ticker_1
-ticker_2 = args.ticker_2
-
-start_training_date = args.start_training_date
-end_training_date = args.end_training_date
-
-start_trading_date = args.start_trading_date
-end_trading_date = args.end_trading_date
-
-hyperparameters = {"buy_sigma": 1, "sell_sigma_low": 0.2,
-                     "sell_sigma_high": 3, "maxlen": 1000}
-method = args.method
-
-if method not in ["KalmanRegression", "OLSRegression"]:
-    raise ValueError("method must be either KalmanRegression or OLSRegression.")
-
-if method == 'KalmanRegression':
-    method_name = "Kalman"
-if method == 'OLSRegression':
-    method_name = "OLS"
-
-strategy = OnlineRegressionStrategy(method, capital, ticker_1, ticker_2, 
-                          start_training_date, end_training_date, 
-                          start_trading_date, end_trading_date, 
-                          hyperparameters, None)
-strategy.train_model()
-strategy.trade_model()
-
-print(f"PnL: {strategy.portfolio.pnl}")
-print(f"Number of trades: {len(strategy.portfolio.closed_trades)}")
-
-with open("res_1.json", "w") as f:
-    json.dump(strategy.portfolio.closed_trades, f)
-
-strategy.post_trades(m)
-ts1 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_1]
-ts1.index = pd.to_datetime(ts1.index)
-ts2 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_2]
-ts2.index = pd.to_datetime(ts2.index)
-fig, ax = plt.subplots(figsize=(30, 10))
-ax.plot(ts1.index, ts1.values)
-ax.plot(ts2.index, ts2.values)
-ax.legend([ticker_1, ticker_2])
-ax.set_title(f"{method_name} Pairs Trading Strategy")
-# Trade entry details
-for key in list(strategy.portfolio.closed_trades.keys()):
-    trade = strategy.portfolio.closed_trades[key]
-    entry_date = pd.to_datetime(trade["entry_date"])
-    long_ticker = trade["long_ticker"]
-    short_ticker = trade["short_ticker"]
-    pnl = trade["pnl"]
-
-    # Add entry marker and annotation
-    ax.axvline(x=entry_date, color='green', linestyle='--')
-    entry_annotation = f"Enter: Long {long_ticker}, Short {short_ticker}"
-    
-    ax.annotate(np.round(pnl, 2), (entry_date, ts1.loc[entry_date]), xytext=(10,-80), textcoords='offset points', arrowprops=dict(facecolor='green'))
-
-    # Trade exit details
-    exit_date = pd.to_datetime(trade["trade_exit_date"])
-
-    # Add exit marker and annotation
-    ax.axvline(x=exit_date, color='red', linestyle='--')
-    exit_annotation = f"Exit: Long {long_ticker}, Short {short_ticker}"
-    ax.annotate(exit_annotation, (exit_date, ts1.loc[exit_date]), xytext=(10,10), textcoords='offset points', arrowprops=dict(facecolor='red'))
-
-# Remove x ticks:
-ax.set_xticks([])
-
-fig.savefig(f"{FIG_DIR}/res_1_{method_name.lower()}.png")
-
-
-df = pd.read_json("res_1.json").transpose()
-strategy.portfolio.closed_trades
-fig, ax = plt.subplots()
-ax.plot(np.cumsum(df["pnl"].values))
-ax.set_title("PnL over time")
-ax.set_xlabel("Time")
-ax.set_ylabel("PnL")
-fig.savefig(f"{FIG_DIR}/res_2_{method_name.lower()}.png")
-
-
-res = np.array(strategy.store_res)
-fig, ax = plt.subplots()
-ax.plot(res[:, 0], label="Normal Buy")
-ax.plot(res[:, 1], label="Swapped Buy")
-ax.plot(res[:, 2], label="Normal Sell")
-ax.plot(res[:, 3], label="Swapped Sell")
-ax.plot(res[:, 4], label="Spread")
-ax.legend()
-ax.set_title(f"{method_name} Regression Trading Strategy")
-ax.set_xlabel("Time")
-# Set legend position
-ax.legend(loc='upper right', bbox_to_anchor=(1.05, 1))
-fig.savefig(f"{FIG_DIR}/res_3_{method_name.lower()}.png")
-
-fig, ax = plt.subplots()
-ax.plot(res[:, -2], label="Alpha")
-ax.plot(res[:, -1], label="Beta")
-ax.legend()
-ax.set_title(f"{method_name} Regression Trading Strategy")
-ax.set_xlabel("Time")
-# Set legend position
-ax.legend(loc='upper right', bbox_to_anchor=(1.05, 1))
-fig.savefig(f"{FIG_DIR}/res_4_{method_name.lower()}.png")
+import pandas as pd
+
+from scipy.interpolate import CubicHermiteSpline
+
+from utils.jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED
+from utils.plotting import lttb, minmax_decimate
+from analytics.identify_tickers import PairScoreTable, ScoreCandidates
+from analytics.clean_prices import PriceCleaner, gap_runs, fill_spline
+from analytics.panel_cache import PanelCache
+from analytics.som import BatchSOM
+from data_loader.ticker_search import TickerSearchIndex
+from data_loader.catalog import Catalog
+from finance.post_trade_analysis import PostTradeMetrics, BatchPostTradeMetrics
+
+
+def main():
+    from finance.online_strategy import OnlineRegressionStrategy
+    import matplotlib.pyplot as plt
+    from data_loader.misc_connect import MongoConnect
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("--ticker_1", type=str, default="MD")
+    parser.add_argument("--ticker_2", type=str, default="EA")
+    parser.add_argument("--start_training_date", type=str, default="2020-06-01")
+    parser.add_argument("--end_training_date", type=str, default="2022-06-01")
+    parser.add_argument("--start_trading_date", type=str, default="2022-06-02")
+    parser.add_argument("--end_trading_date", type=str, default="2023-06-02")
+    parser.add_argument("--method", type=str, default="KalmanRegression")
+    args = parser.parse_args()
+
+    FIG_DIR = "{FIG_DIR}"
+
+    if not os.path.exists(FIG_DIR):
+        os.makedirs(FIG_DIR)
+
+    m = MongoConnect()
+    capital  = 1_000_000
+    ticker_1 = args.ticker_1
+    ticker_2 = args.ticker_2
+
+    start_training_date = args.start_training_date
+    end_training_date = args.end_training_date
+
+    start_trading_date = args.start_trading_date
+    end_trading_date = args.end_trading_date
+
+    hyperparameters = {"buy_sigma": 1, "sell_sigma_low": 0.2,
+                         "sell_sigma_high": 3, "maxlen": 1000}
+    method = args.method
+
+    if method not in ["KalmanRegression", "OLSRegression"]:
+        raise ValueError("method must be either KalmanRegression or OLSRegression.")
+
+    if method == 'KalmanRegression':
+        method_name = "Kalman"
+    if method == 'OLSRegression':
+        method_name = "OLS"
+
+    strategy = OnlineRegressionStrategy(method, capital, ticker_1, ticker_2, 
+                              start_training_date, end_training_date, 
+                              start_trading_date, end_trading_date, 
+                              hyperparameters, None)
+    strategy.train_model()
+    strategy.trade_model()
+
+    print(f"PnL: {strategy.portfolio.pnl}")
+    print(f"Number of trades: {len(strategy.portfolio.closed_trades)}")
+
+    with open("res_1.json", "w") as f:
+        json.dump(strategy.portfolio.closed_trades, f)
+
+    strategy.post_trades(m)
+    ts1 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_1]
+    ts1.index = pd.to_datetime(ts1.index)
+    ts2 = strategy.ts[strategy.ts["Mode"] == "Trade"][ticker_2]
+    ts2.index = pd.to_datetime(ts2.index)
+    fig, ax = plt.subplots(figsize=(30, 10))
+    ax.plot(ts1.index, ts1.values)
+    ax.plot(ts2.index, ts2.values)
+    ax.legend([ticker_1, ticker_2])
+    ax.set_title(f"{method_name} Pairs Trading Strategy")
+    # Trade entry details
+    for key in list(strategy.portfolio.closed_trades.keys()):
+        trade = strategy.portfolio.closed_trades[key]
+        entry_date = pd.to_datetime(trade["entry_date"])
+        long_ticker = trade["long_ticker"]
+        short_ticker = trade["short_ticker"]
+        pnl = trade["pnl"]
+
+        # Add entry marker and annotation
+        ax.axvline(x=entry_date, color='green', linestyle='--')
+        entry_annotation = f"Enter: Long {long_ticker}, Short {short_ticker}"
+
+        ax.annotate(np.round(pnl, 2), (entry_date, ts1.loc[entry_date]), xytext=(10,-80), textcoords='offset points', arrowprops=dict(facecolor='green'))
+
+        # Trade exit details
+        exit_date = pd.to_datetime(trade["trade_exit_date"])
+
+        # Add exit marker and annotation
+        ax.axvline(x=exit_date, color='red', linestyle='--')
+        exit_annotation = f"Exit: Long {long_ticker}, Short {short_ticker}"
+        ax.annotate(exit_annotation, (exit_date, ts1.loc[exit_date]), xytext=(10,10), textcoords='offset points', arrowprops=dict(facecolor='red'))
+
+    # Remove x ticks:
+    ax.set_xticks([])
+
+    fig.savefig(f"{FIG_DIR}/res_1_{method_name.lower()}.png")
+
+
+    df = pd.read_json("res_1.json").transpose()
+    strategy.portfolio.closed_trades
+    fig, ax = plt.subplots()
+    ax.plot(np.cumsum(df["pnl"].values))
+    ax.set_title("PnL over time")
+    ax.set_xlabel("Time")
+    ax.set_ylabel("PnL")
+    fig.savefig(f"{FIG_DIR}/res_2_{method_name.lower()}.png")
+
+
+    res = np.array(strategy.store_res)
+    fig, ax = plt.subplots()
+    ax.plot(res[:, 0], label="Normal Buy")
+    ax.plot(res[:, 1], label="Swapped Buy")
+    ax.plot(res[:, 2], label="Normal Sell")
+    ax.plot(res[:, 3], label="Swapped Sell")
+    ax.plot(res[:, 4], label="Spread")
+    ax.legend()
+    ax.set_title(f"{method_name} Regression Trading Strategy")
+    ax.set_xlabel("Time")
+    # Set legend position
+    ax.legend(loc='upper right', bbox_to_anchor=(1.05, 1))
+    fig.savefig(f"{FIG_DIR}/res_3_{method_name.lower()}.png")
+
+    fig, ax = plt.subplots()
+    ax.plot(res[:, -2], label="Alpha")
+    ax.plot(res[:, -1], label="Beta")
+    ax.legend()
+    ax.set_title(f"{method_name} Regression Trading Strategy")
+    ax.set_xlabel("Time")
+    # Set legend position
+    ax.legend(loc='upper right', bbox_to_anchor=(1.05, 1))
+    fig.savefig(f"{FIG_DIR}/res_4_{method_name.lower()}.png")
+
+
+def double(progress, x):
+    return 2 * x
+
+
+def count_to(progress, n, delay=0.0):
+    for i in range(n):
+        time.sleep(delay)
+        progress(i + 1, n, "Counting")
+    return n
+
+
+def wait_for(queue, job_id, timeout=10.0):
+    start = time.time()
+    while queue.status(job_id)["status"] in [QUEUED, RUNNING]:
+        if time.time() - start > timeout:
+            raise Exception(f"Job {job_id} did not finish.")
+        time.sleep(0.01)
+    return queue.status(job_id)
+
+
+def make_queue(**kwargs):
+    return JobQueue(os.path.join(tempfile.mkdtemp(), "jobs.sqlite"), **kwargs)
+
+
+def test_job_queue_runs_and_stores_result():
+    queue = make_queue()
+    job_id = queue.submit("double", double, {"x": 21})
+    status = wait_for(queue, job_id)
+    assert status["status"] == DONE and status["fraction"] == 1.0
+    assert queue.result(job_id) == 42
+    # Another process reads the pickled result back from the table
+    assert JobQueue(queue.db_path).result(job_id) == 42
+
+
+def test_job_queue_reports_failures():
+    def fail(progress):
+        raise ValueError("bad input")
+    queue = make_queue()
+    status = wait_for(queue, queue.submit("fail", fail, {}))
+    assert status["status"] == FAILED and status["error"] == "bad input"
+
+
+def test_job_queue_dedupes_on_params_and_versions():
+    queue = make_queue()
+    running = queue.submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 1})
+    assert queue.submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 1}) == running
+    wait_for(queue, running)
+    # A finished job is reused until the data it was computed from changes
+    assert queue.submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 1}) == running
+    assert JobQueue(queue.db_path).submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 1}) == running
+    assert queue.submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 2}) != running
+    assert queue.submit("count", count_to, {"n": 21, "delay": 0.01}, versions={"prices": 1}) != running
+    assert queue.submit("count", count_to, {"n": 20, "delay": 0.01}, versions={"prices": 1}, dedupe=False) != running
+
+
+def test_job_queue_reports_progress():
+    queue = make_queue()
+    job_id = queue.submit("count", count_to, {"n": 50, "delay": 0.02})
+    seen = []
+    while queue.status(job_id)["status"] != DONE:
+        status = queue.status(job_id)
+        if status["status"] == RUNNING and status["total"]:
+            seen.append(status)
+        time.sleep(0.05)
+    assert len(seen) > 0
+    assert all(status["total"] == 50 and 0 <= status["fraction"] <= 1 for status in seen)
+    assert [status["done"] for status in seen] == sorted(status["done"] for status in seen)
+    assert any(status["rate"] > 0 and status["eta"] is not None for status in seen)
+    assert seen[-1]["message"] == "Counting"
+    assert queue.status(job_id)["done"] == 50
+
+
+def test_job_queue_prunes_old_jobs():
+    queue = make_queue(retention=0.2)
+    old = queue.submit("double", double, {"x": 1})
+    wait_for(queue, old)
+    time.sleep(0.3)
+    recent = queue.submit("double", double, {"x": 2})
+    wait_for(queue, recent)
+    queue.prune()
+    assert queue.status(old) is None
+    assert queue.status(recent)["status"] == DONE
+
+
+def test_job_queue_fails_jobs_of_dead_workers():
+    queue = make_queue(stale_after=0.2)
+    job_id = queue.submit("count", count_to, {"n": 1})
+    wait_for(queue, job_id)
+    # A job left running by a process that stopped beating
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET status = ?, finished = NULL, pid = ?, heartbeat = ? WHERE id = ?",
+                     (RUNNING, os.getpid() + 1, time.time(), job_id))
+    assert queue.status(job_id)["status"] == RUNNING
+    time.sleep(0.3)
+    status = queue.status(job_id)
+    assert status["status"] == FAILED and status["error"] is not None
+    # A job of this process whose thread is gone
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET status = ?, finished = NULL, pid = ?, heartbeat = ? WHERE id = ?",
+                     (RUNNING, os.getpid(), time.time(), job_id))
+    assert queue.status(job_id)["status"] == FAILED
+    # Dead jobs aren't reused
+    assert queue.submit("count", count_to, {"n": 1}) != job_id
+
+
+def test_job_queue_heartbeat_keeps_jobs_alive():
+    queue = make_queue(stale_after=0.3, heartbeat_interval=0.05)
+    job_id = queue.submit("count", count_to, {"n": 10, "delay": 0.08})
+    # Seen as another process's job, only the heartbeat shows it is alive
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET pid = ? WHERE id = ?", (os.getpid() + 1, job_id))
+    for _ in range(8):
+        time.sleep(0.1)
+        assert queue.status(job_id)["status"] in [RUNNING, DONE]
+    assert wait_for(queue, job_id)["status"] == DONE
+
+
+def test_pair_scores_with_zero_weights_count_columns_equally():
+    table = PairScoreTable.from_dict({"A:B": {"coint": 0.3, "stationary": 0.0, "mean_reversion": 0.6},
+                                      "A:C": {"coint": 0.1, "stationary": 0.2, "mean_reversion": 0.0}})
+    scores = table.weighted(0, 0, 0)
+    assert np.allclose(scores, [0.3, 0.1])
+    assert np.allclose(scores, table.weighted(1, 1, 1))
+    assert list(PairScoreTable.rank(scores, 0, 2)) == [1, 0]
+
+
+
+def baseline_historic_metrics(post_trade, rr, target_return):
+    # The per-prefix loops the expanding curves replaced
+    returns = post_trade.return_series
+    prefixes = [returns[:indx] for indx in range(1, len(returns) + 1)]
+    return {
+        "sharpe": [0, 0] + [post_trade.calculate_sharpe_ratio(rr, returns[:indx]) for indx in range(2, len(returns))],
+        "max_drawdown": [post_trade.calculate_max_drawdown(prefix) for prefix in prefixes],
+        "calmar": [post_trade.calculate_calmar_ratio(prefix) for prefix in prefixes],
+        "sortino": [post_trade.calculate_sortino_ratio(rr, target_return, prefix) for prefix in prefixes],
+    }
+
+
+def test_expanding_metrics_match_baseline_loops():
+    rng = np.random.default_rng(0)
+    daily_pnls = {"long": 1000 + np.cumsum(rng.normal(0.5, 10, 300)),
+                  "short": 1000 + np.cumsum(rng.normal(-0.5, 10, 40)),
+                  "flat": np.full(30, 1000.0),
+                  "two": np.array([1000.0, 1010.0, 990.0]),
+                  "one": np.array([1000.0, 1010.0])}
+    batch = BatchPostTradeMetrics({key: daily_pnl.tolist() for key, daily_pnl in daily_pnls.items()})
+    curves = batch.historic_metrics(0.01, 0.01)
+    finals = batch.final_metrics(0.01, 0.01, curves)
+    for row, (key, daily_pnl) in enumerate(daily_pnls.items()):
+        post_trade = PostTradeMetrics("A", "B", "2020-01-01", "2021-01-01")
+        post_trade.initialise_portfolio(1000, daily_pnl.tolist(), daily_pnl[-1] - 1000, 0.0)
+        baseline = baseline_historic_metrics(post_trade, 0.01, 0.01)
+        for name, expected in baseline.items():
+            assert np.allclose(batch.get_curve(curves, name, key), expected, atol=1e-8), (key, name)
+        assert np.allclose(post_trade.historic_sharpe_ratio(0.01), baseline["sharpe"], atol=1e-8)
+        assert np.allclose(post_trade.historic_sortino_ratio(0.01, 0.01), baseline["sortino"], atol=1e-8)
+        assert np.isclose(finals["sharpe"][row], post_trade.calculate_sharpe_ratio(0.01), atol=1e-8)
+        assert np.isclose(finals["calmar"][row], post_trade.calculate_calmar_ratio(), atol=1e-8)
+
+def baseline_gap_runs(column):
+    # Start flag, position in gap and gap length of every cell, one loop per column
+    starts, positions, lengths = [], [], []
+    run = 0
+    for is_missing in column:
+        run = run + 1 if is_missing else 0
+        starts.append(bool(is_missing) and run == 1)
+        positions.append(run - 1 if is_missing else -1)
+    for i in range(len(column)):
+        if not column[i]:
+            lengths.append(-1)
+            continue
+        j = i
+        while j + 1 < len(column) and column[j + 1]:
+            j += 1
+        lengths.append(positions[j] + 1)
+    return starts, positions, lengths
+
+
+def test_gap_runs_match_loop():
+    rng = np.random.default_rng(1)
+    missing = rng.random((60, 5)) < 0.3
+    missing[:4, 0] = True
+    missing[-3:, 1] = True
+    starts, positions, lengths = gap_runs(missing)
+    for col in range(missing.shape[1]):
+        expected_starts, expected_positions, expected_lengths = baseline_gap_runs(missing[:, col])
+        assert list(starts[:, col]) == expected_starts
+        cells = missing[:, col]
+        assert list(positions[cells, col]) == [p for p, m in zip(expected_positions, cells) if m]
+        assert list(lengths[cells, col]) == [n for n, m in zip(expected_lengths, cells) if m]
+
+
+def baseline_clean(df, threshold=0.2, drop_window=5):
+    # The original pandas cleaning, with linear instead of polynomial interpolation
+    df = df.dropna(thresh=len(df) * (1 - threshold), axis=1)
+    consecutive_nans = df.isna().rolling(window=drop_window+1, min_periods=drop_window+1).sum().max(axis=1)
+    df = df.drop(consecutive_nans[consecutive_nans >= drop_window+1].index)
+    df = df.interpolate(method='linear').ffill().bfill()
+    return df.drop_duplicates()
+
+
+def test_linear_cleaning_matches_pandas():
+    rng = np.random.default_rng(2)
+    index = pd.date_range("2020-01-01", periods=120, freq="D")
+    df = pd.DataFrame(100 + np.cumsum(rng.normal(size=(120, 6)), axis=0), index=index, columns=list("ABCDEF"))
+    df = df.mask(rng.random(df.shape) < 0.1)
+    df.iloc[:3, 1] = np.nan
+    df.iloc[-4:, 2] = np.nan
+    df.iloc[40:50, 3] = np.nan
+    df.iloc[::2, 4] = np.nan
+    df.iloc[80] = df.iloc[79]
+    cleaned, diagnostics = PriceCleaner(fill_method="linear").clean(df)
+    expected = baseline_clean(df)
+    assert list(cleaned.columns) == list(expected.columns)
+    assert cleaned.index.equals(expected.index)
+    assert np.allclose(cleaned.values, expected.values)
+    assert diagnostics.loc["E", "dropped"] and not diagnostics.loc["A", "dropped"]
+    assert diagnostics.loc["D", "longest_gap"] >= 10
+
+
+def test_spline_fill_follows_neighbours():
+    # Linear prices are filled exactly
+    line = np.arange(20, dtype=float)[:, None] * np.array([[1.0, -2.0]]) + 5
+    values = line.copy()
+    values[3:6, 0] = np.nan
+    values[10:14, 1] = np.nan
+    assert np.allclose(fill_spline(values), line)
+    # A single gap is the cubic Hermite spline with the slopes across its ends
+    y = np.array([1.0, 2.0, 4.0, np.nan, np.nan, 3.0, 1.0, 0.5])
+    filled = fill_spline(y[:, None])[:, 0]
+    slopes = [(3.0 - 2.0) / (5 - 1), (1.0 - 4.0) / (6 - 2)]
+    spline = CubicHermiteSpline([2, 5], [4.0, 3.0], slopes)
+    assert np.allclose(filled[3:5], spline([3, 4]))
+    assert np.array_equal(filled[~np.isnan(y)], y[~np.isnan(y)])
+    # Edges carry the first and last prices
+    edges = fill_spline(np.array([np.nan, 2.0, 3.0, np.nan])[:, None])[:, 0]
+    assert list(edges) == [2.0, 2.0, 3.0, 3.0]
+
+
+def make_clusters(n_per_cluster=20, length=16, seed=3):
+    rng = np.random.default_rng(seed)
+    # Corners of a square, so the clusters span the plane the map is spread over
+    centres = np.zeros((4, length))
+    centres[:, :2] = [[0, 0], [0, 10], [10, 0], [10, 10]]
+    data = np.vstack([centre + rng.normal(scale=0.1, size=(n_per_cluster, length)) for centre in centres])
+    return data, np.repeat(np.arange(4), n_per_cluster)
+
+
+def test_batch_som_separates_clusters():
+    data, labels = make_clusters()
+    som = BatchSOM(2, 2, data.shape[1], max_epochs=40)
+    som.pca_weights_init(data)
+    epochs = som.train(data)
+    winners = [tuple(w) for w in som.winners(data)]
+    # Every cluster sits on one node of its own
+    nodes = [set(w for w, label in zip(winners, labels) if label == c) for c in range(4)]
+    assert all(len(node) == 1 for node in nodes)
+    assert len(set.union(*nodes)) == 4
+    assert som.quantization_error(data) < 1.0
+    assert sum(len(samples) for samples in som.win_map(data).values()) == len(data)
+
+    # Best-matching units agree with a brute-force distance search
+    bmu, _ = som._bmu(data)
+    brute = np.linalg.norm(data[:, None, :] - som.weights[None, :, :], axis=2).argmin(axis=1)
+    assert np.array_equal(bmu, brute)
+
+    # Same seed, same map
+    again = BatchSOM(2, 2, data.shape[1], max_epochs=40)
+    again.pca_weights_init(data)
+    again.train(data)
+    assert np.allclose(again.get_weights(), som.get_weights())
+
+    # Warm-started from the trained map, as a rerun of the clustering does, it settles at once
+    warm = BatchSOM(2, 2, data.shape[1], sigma=som.sigma_end, sigma_end=som.sigma_end, max_epochs=10)
+    warm.set_weights(som.get_weights())
+    assert warm.train(data) < 10 < epochs
+    assert [tuple(w) for w in warm.winners(data)] == winners
+
+
+def test_pair_score_table_ranks_like_a_full_sort():
+    rng = np.random.default_rng(4)
+    keys = rng.integers(0, 10, 200).astype(float)
+    keys[rng.random(200) < 0.1] = np.nan
+    for descending in [False, True]:
+        expected = np.argsort(-keys if descending else keys, kind="stable")
+        for start, stop in [(0, 10), (10, 20), (185, 200), (190, 250), (50, 50)]:
+            assert list(PairScoreTable.rank(keys, start, stop, descending)) == list(expected[start:stop])
+
+    score_dict = {f"T{i}:T{j}": {"coint": c, "stationary": s, "mean_reversion": m}
+                  for (i, j), (c, s, m) in zip([(i, j) for i in range(8) for j in range(i + 1, 8)], rng.random((28, 3)))}
+    table = PairScoreTable.from_dict(score_dict)
+    assert [table.key(i) for i in range(len(table))] == list(score_dict)
+    # The original scoring loop, weights normalised the same way
+    weights = {"coint": 0.5, "stationary": 0.2, "mean_reversion": 0.3}
+    baseline = {comb: sum(weights[name] * value[name] for name in weights) for comb, value in score_dict.items()}
+    assert ScoreCandidates(0.2, 0.3, 0.5, score_dict).get_top_candidates() == sorted(baseline, key=lambda x: baseline[x])
+
+
+def baseline_lttb(x, y, n_out):
+    # One series, one bucket at a time
+    edges = np.linspace(1, len(y) - 1, n_out - 1).astype(int)
+    kept = [0]
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b < n_out - 3:
+            next_x, next_y = np.mean(x[hi:edges[b + 2]]), np.mean(y[hi:edges[b + 2]])
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[kept[-1]], y[kept[-1]]
+        areas = [abs((ax - next_x) * (y[i] - ay) - (ax - x[i]) * (next_y - ay)) for i in range(lo, hi)]
+        kept.append(lo + int(np.argmax(areas)))
+    kept.append(len(y) - 1)
+    return x[kept], y[kept]
+
+
+def test_lttb_matches_loop():
+    rng = np.random.default_rng(5)
+    y = np.cumsum(rng.normal(size=(3, 1000)), axis=1)
+    x = np.sort(rng.random(1000)) * 100
+    for n_out in [3, 10, 137]:
+        x_out, y_out = lttb(y, n_out, x)
+        assert x_out.shape == y_out.shape == (3, n_out)
+        for row in range(3):
+            expected_x, expected_y = baseline_lttb(x, y[row], n_out)
+            assert np.array_equal(x_out[row], expected_x) and np.array_equal(y_out[row], expected_y)
+    # Short series are returned as they are
+    x_out, y_out = lttb(y[:, :50], 100)
+    assert np.array_equal(y_out, y[:, :50]) and np.array_equal(x_out[0], np.arange(50))
+    # minmax keeps the extremes of every series
+    _, y_out = minmax_decimate(y, 100)
+    assert np.array_equal(y_out.max(axis=1), y.max(axis=1)) and np.array_equal(y_out.min(axis=1), y.min(axis=1))
+
+
+class FakeFetcher:
+    def __init__(self, tickers, long_names=None):
+        self.tickers = tickers
+        self.long_names = long_names or {}
+        self.calls = 0
+
+    def get_ticker_names(self):
+        self.calls += 1
+        return sorted(self.tickers)
+
+    def get_ticker_long_names(self):
+        return self.long_names
+
+
+def test_ticker_search_matches_scan():
+    long_names = {"AAPL": "Apple Inc.", "AMZN": "Amazon.com, Inc.", "GOOGL": "Alphabet Inc.", "GOOG": "Alphabet Inc.",
+                  "MSFT": "Microsoft Corporation", "AA": "Alcoa Corporation", "APP": "AppLovin Corporation",
+                  "BAC": "Bank of America Corporation", "PAPL": "Pineapple Energy Inc."}
+    index = TickerSearchIndex(FakeFetcher(list(long_names), long_names), refresh_interval=None).build()
+    tickers = sorted(long_names)
+
+    def scan(query):
+        # Every ticker once, at its best rank
+        ranks = {}
+        for ticker in tickers:
+            name, text = long_names[ticker], f"{ticker} {long_names[ticker]}".lower()
+            word = TickerSearchIndex.tokenize(query)[:1]
+            if ticker == query.upper():
+                ranks[ticker] = 0
+            elif ticker.startswith(query.upper()):
+                ranks[ticker] = 1
+            elif word and any(w.startswith(word[0]) for w in TickerSearchIndex.tokenize(name)):
+                ranks[ticker] = 2
+            elif len(query) >= 3 and query.lower() in text:
+                ranks[ticker] = 3
+        return sorted(ranks, key=lambda ticker: (ranks[ticker], ticker))
+
+    for query in ["a", "AA", "app", "apple", "alpha", "corp", "goog", "inc", "ple", "zzz", "oration"]:
+        assert index.search(query) == scan(query), query
+    assert index.search("a", limit=3) == scan("a")[:3]
+    assert index.search("") == []
+    options = index.search_options("goo", selected="MSFT")
+    assert [option["value"] for option in options] == ["MSFT", "GOOG", "GOOGL"]
+    assert options[1]["search"] == "GOOG:Alphabet Inc."
+
+
+def price_frame(start_date, end_date, columns=("A", "B", "C")):
+    index = pd.date_range(start_date, end_date, freq="D")
+    days = np.arange(len(index))[:, None] + (index[0] - pd.Timestamp("2020-01-01")).days
+    return pd.DataFrame(100 + np.sin(days / 7.0 + np.arange(len(columns))) * 10, index=index, columns=list(columns))
+
+
+def test_panel_cache_versions_and_evicts():
+    cache = PanelCache(tempfile.mkdtemp(), max_in_memory=2)
+    cleaner = PriceCleaner()
+    loads = []
+
+    def load_prices(start_date, end_date):
+        loads.append((start_date, end_date))
+        return price_frame(start_date, end_date)
+
+    tickers = ["A", "B", "C"]
+    panel = cache.get_or_load(tickers, "2020-01-01", "2020-03-31", cleaner, load_prices, version=1)
+    assert cache.get_or_load(tickers, "2020-01-01", "2020-03-31", cleaner, load_prices, version=1) is panel
+    assert len(loads) == 1
+    # Another worker reads the panel from disk
+    other = PanelCache(cache.cache_dir)
+    assert np.array_equal(other.get_or_load(tickers, "2020-01-01", "2020-03-31", cleaner, load_prices, version=1).values, panel.values)
+    assert len(loads) == 1
+
+    # A slid window loads only the new dates, and is cleaned like a full load
+    slid = cache.get_or_load(tickers, "2020-01-11", "2020-04-10", cleaner, load_prices, version=1)
+    assert loads[-1] == ("2020-04-01", "2020-04-10")
+    assert np.allclose(slid.values, cleaner.clean(price_frame("2020-01-11", "2020-04-10"))[0].values)
+
+    # New prices bump the version, so nothing older is reused
+    cache.get_or_load(tickers, "2020-01-01", "2020-03-31", cleaner, load_prices, version=2)
+    assert loads[-1] == ("2020-01-01", "2020-03-31")
+    assert PanelCache.make_key(tickers, "2020-01-01", "2020-03-31", cleaner.get_params(), 1) != \
+        PanelCache.make_key(tickers, "2020-01-01", "2020-03-31", cleaner.get_params(), 2)
+    assert PanelCache.make_key(["C", "A", "B"], "2020-01-01", "2020-03-31", cleaner.get_params(), 1) == \
+        PanelCache.make_key(tickers, "2020-01-01", "2020-03-31", cleaner.get_params(), 1)
+    assert len(cache._panels) == 2
+
+    # Over the disk budget the least recently used entries go first
+    entries = sorted(os.listdir(cache.cache_dir))
+    sizes = {}
+    for age, name in enumerate(entries):
+        path = os.path.join(cache.cache_dir, name)
+        os.utime(path, (age, age))
+        sizes[name] = sum(item.stat().st_size for item in os.scandir(path) if item.is_file())
+    cache.max_disk_bytes = sum(sizes.values()) - sizes[entries[0]]
+    cache.evict()
+    assert sorted(os.listdir(cache.cache_dir)) == entries[1:]
+    cache.max_disk_bytes = 0
+    cache.evict(keep=entries[1])
+    assert os.listdir(cache.cache_dir) == [entries[1]]
+
+
+class FakeMiscConnect:
+    def __init__(self):
+        self.versions = {"prices": 0, "clusters": 0, "pairs": 0}
+        self.clustering_runs = []
+        self.pair_runs = []
+        self.listeners = []
+        self.loads = 0
+
+    def add_write_listener(self, listener):
+        self.listeners.append(listener)
+
+    def get_versions(self, *names):
+        return tuple(self.versions[name] for name in names)
+
+    def bump_version(self, name, change=None):
+        self.versions[name] += 1
+        for listener in self.listeners:
+            listener(name, self.versions[name], change)
+
+    def get_all_clustering_results(self):
+        self.loads += 1
+        return iter(list(self.clustering_runs))
+
+    def get_all_pairs_results(self):
+        self.loads += 1
+        return iter(list(self.pair_runs))
+
+
+def test_catalog_follows_data_versions():
+    fetcher, misc_connect = FakeFetcher(["B", "A"]), FakeMiscConnect()
+    catalog = Catalog(fetcher, misc_connect, check_interval=0)
+    assert catalog.tickers() == ["A", "B"] and catalog.tickers() == ["A", "B"]
+    assert fetcher.calls == 1
+
+    # A write in this process is added in place, without reading the runs again
+    assert catalog.clustering_runs() == []
+    run = {"method": "SOM", "start_date": "2020-01-01", "end_date": "2021-01-01"}
+    misc_connect.clustering_runs.append(run)
+    misc_connect.bump_version("clusters", run)
+    assert catalog.clustering_runs() == [run] and misc_connect.loads == 1
+
+    # A write from another process only shows in the version, the list is read again
+    other_run = {"method": "Sector", "start_date": "2020-01-01", "end_date": "2021-01-01"}
+    misc_connect.clustering_runs.append(other_run)
+    misc_connect.versions["clusters"] += 1
+    assert catalog.clustering_runs() == [run, other_run] and misc_connect.loads == 2
+
+    # New prices reload the tickers, the other lists are kept
+    fetcher.tickers.append("C")
+    misc_connect.bump_version("prices")
+    assert catalog.tickers() == ["A", "B", "C"] and fetcher.calls == 2
+    assert catalog.clustering_runs() == [run, other_run] and misc_connect.loads == 2
+    catalog.invalidate()
+    assert catalog.pair_runs() == [] and catalog.clustering_runs() == [run, other_run] and misc_connect.loads == 4
+
 
+if __name__ == "__main__":
+    main()
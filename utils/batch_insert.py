@@ -1,8 +1,8 @@
-from data_loader.singleton import get_data_setter
+from data_loader.singleton import get_data_setter, LazyConnector
 import json
 from utils.index_stocks import gen_ticker_dict
 
-data_setter = get_data_setter()
+data_setter = LazyConnector(get_data_setter)
 
 def _batch_insert(start_date, end_date, ticker_path):
     gen_ticker_dict(ticker_path)
@@ -0,0 +1,205 @@
+import os
+import time
+import pickle
+from hashlib import sha1
+from functools import wraps
+from threading import Lock
+from collections import OrderedDict
+
+DEFAULT_COMPUTATION_CACHE_DIR = os.environ.get("EQUITY_PAIR_COMPUTATION_CACHE_DIR", os.path.join(".", ".cache", "computations"))
+DEFAULT_FIGURE_CACHE_DIR = os.environ.get("EQUITY_PAIR_FIGURE_CACHE_DIR", os.path.join(".", ".cache", "figures"))
+
+
+class ComputationCache:
+    def __init__(self, cache_dir=DEFAULT_COMPUTATION_CACHE_DIR, ttl=600, max_entries=128, max_disk_bytes=1024 ** 3, prune_interval=60):
+        """
+        Memoises derived artefacts shared between callbacks, e.g. the pivoted pair
+        frame, the fitted OLS/Kalman hedge ratios and the cointegration result that
+        several callbacks on the same button all need.
+
+        Entries are keyed by a name and the inputs that produce them. They are held
+        in an in-process LRU and pickled to cache_dir, so other worker processes
+        pick them up instead of recomputing. Entries older than ttl seconds are
+        recomputed. Concurrent requests for the same key wait for the first one
+        to finish rather than computing in parallel. Expired files are deleted,
+        and the oldest ones once cache_dir grows past max_disk_bytes.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory for the pickled entries, EQUITY_PAIR_COMPUTATION_CACHE_DIR if set.
+            None keeps entries in memory only.
+        ttl : float
+            Seconds an entry stays valid.
+        max_entries : int
+            Entries kept in this process.
+        max_disk_bytes : int
+            Size of cache_dir above which the oldest entries are deleted.
+        prune_interval : float
+            Seconds between prune() calls made by put() in this process.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(name, *parts):
+        return sha1(repr((name,) + parts).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (True, value) for a live entry, (False, None) otherwise.
+        """
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                created, value = self._entries[key]
+                if now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    return True, value
+                del self._entries[key]
+        if self.cache_dir is None:
+            return False, None
+        path = os.path.join(self.cache_dir, f"{key}.pkl")
+        try:
+            if now - os.path.getmtime(path) >= self.ttl:
+                return False, None
+            with open(path, "rb") as f:
+                created, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        self._remember(key, created, value)
+        return True, value
+
+    def put(self, key, value):
+        """
+        Stores value in memory and on disk. The file is written under a temporary name
+        and renamed into place, so other workers never read a partial entry.
+        """
+        created = time.time()
+        self._remember(key, created, value)
+        if self.cache_dir is None:
+            return
+        path = os.path.join(self.cache_dir, f"{key}.pkl")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump((created, value), f)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # Unpicklable or the disk isn't writable; memory still has it
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if created - self._last_prune >= self.prune_interval:
+            self._last_prune = created
+            self.prune()
+
+    def prune(self):
+        """
+        Deletes expired entry files, then the oldest ones until cache_dir is under
+        max_disk_bytes.
+        """
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".pkl"):
+                continue
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime >= self.ttl:
+                    os.remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                # Replaced or deleted by another worker meanwhile
+                continue
+        total = sum(size for _, size, _ in entries)
+        if self.max_disk_bytes is None or total <= self.max_disk_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, calling compute() once on a miss.
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, Lock())
+        with key_lock:
+            # Another thread may have computed it while this one waited
+            found, value = self.get(key)
+            if not found:
+                value = compute()
+                self.put(key, value)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def memoize(self, name):
+        """
+        Decorator caching a function's results by name and arguments. The arguments
+        must have a stable repr, e.g. strings, numbers and tuples.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self.make_key(name, args, sorted(kwargs.items()))
+                return self.get_or_compute(key, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith(".pkl"):
+                    os.remove(os.path.join(self.cache_dir, file_name))
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            self._entries[key] = (created, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_computation_cache = None
+
+def get_computation_cache():
+    global _computation_cache
+    if _computation_cache is None:
+        _computation_cache = ComputationCache()
+    return _computation_cache
+
+
+_figure_cache = None
+
+def get_figure_cache():
+    """
+    Callback outputs keyed by the callback inputs and the version of the data they
+    were built from. They stay valid until that data is written again, so the
+    TTL is long.
+    """
+    global _figure_cache
+    if _figure_cache is None:
+        _figure_cache = ComputationCache(DEFAULT_FIGURE_CACHE_DIR, ttl=24 * 3600, max_entries=64, max_disk_bytes=512 * 1024 ** 2)
+    return _figure_cache
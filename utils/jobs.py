@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+from uuid import uuid4
+from contextlib import contextmanager
+from hashlib import sha1
+from threading import Lock, Thread
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_DB = os.environ.get("EQUITY_PAIR_JOB_DB", os.path.join(".", ".cache", "jobs.sqlite"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobProgress:
+    """
+    Passed to a running job as its first argument. Call it as progress(done, total)
+    from inside the job's loop. Writes to the job table are throttled, so it
+    can be called once per pair or epoch.
+    """
+    def __init__(self, queue, job_id, min_interval=0.5):
+        self.queue = queue
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def __call__(self, done, total, message=None):
+        now = time.time()
+        if now - self._last < self.min_interval and done < total:
+            return
+        self._last = now
+        self.queue._update(self.job_id, done=done, total=total, message=message, updated=now)
+
+
+class JobQueue:
+    def __init__(self, db_path=DEFAULT_JOB_DB, max_workers=2, stale_after=60, max_results=32, retention=24 * 3600,
+                 heartbeat_interval=10):
+        """
+        Runs long computations off the Dash request thread. Callbacks submit a job
+        and get back its id, then poll status() from a dcc.Interval.
+
+        Jobs run on a local thread pool. Their status, progress and results live in
+        a SQLite table, so every worker process can report on any job. A job
+        submitted again with the same kind, parameters and data versions returns
+        the id of the first one if it is still queued or running, or finished with
+        its result still stored, instead of running it twice. Writing the data it
+        was computed from, e.g. re-ingesting prices, moves its versions on, so a
+        stale result is never reused.
+
+        Each job records the pid of the process running it, which writes a
+        heartbeat for its queued and running jobs every heartbeat_interval
+        seconds. status() marks a job whose thread or process has died as failed,
+        so the GUI stops polling it.
+
+        Parameters
+        ----------
+        db_path : str
+            SQLite file for the job table, EQUITY_PAIR_JOB_DB if set.
+        max_workers : int
+            Jobs run at the same time in this process.
+        stale_after : float
+            Seconds without a heartbeat after which a queued or running job from
+            another process is considered dead.
+        max_results : int
+            Finished results kept in memory, older ones are read back from the table.
+        retention : float
+            Seconds a finished or failed job is kept in the table, see prune().
+        heartbeat_interval : float
+            Seconds between heartbeats of this process's jobs.
+        """
+        self.db_path = db_path
+        self.stale_after = stale_after
+        self.max_results = max_results
+        self.retention = retention
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_pid = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._results = OrderedDict()
+        self._futures = {}
+        self._lock = Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    params_hash TEXT,
+                    params TEXT,
+                    status TEXT,
+                    done INTEGER DEFAULT 0,
+                    total INTEGER DEFAULT 0,
+                    message TEXT,
+                    error TEXT,
+                    result BLOB,
+                    created REAL,
+                    started REAL,
+                    updated REAL,
+                    finished REAL,
+                    pid INTEGER,
+                    heartbeat REAL
+                )""")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in [("pid", "INTEGER"), ("heartbeat", "REAL")]:
+                if column not in columns:
+                    # Tables created before jobs had heartbeats
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_kind_params ON jobs (kind, params_hash, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    @staticmethod
+    def make_hash(kind, params, versions=None):
+        key = {"params": params, "versions": versions or {}}
+        return sha1(f"{kind}|{json.dumps(key, sort_keys=True, default=str)}".encode()).hexdigest()
+
+    def submit(self, kind, func, params, extra=None, dedupe=True, versions=None):
+        """
+        Runs func(progress, **params, **extra) in the background.
+
+        Parameters
+        ----------
+        kind : str
+            Name of the job type, e.g. "identify_pairs".
+        func : callable
+            The computation. Its return value is the job result.
+        params : dict
+            JSON-serialisable arguments that identify the job.
+        extra : dict, optional
+            Further arguments that don't change the result, e.g. a warm start.
+        dedupe : bool
+            Reuse an identical queued, running or finished job.
+        versions : dict, optional
+            Versions of the stored data the result is computed from, e.g.
+            {"prices": 3}, see MongoConnect.get_versions. Part of the job's
+            identity only, they aren't passed to func.
+
+        Returns
+        -------
+        str
+            Job id.
+        """
+        params_hash = self.make_hash(kind, params, versions)
+        with self._lock:
+            if dedupe:
+                job_id = self._find_reusable(kind, params_hash)
+                if job_id is not None:
+                    return job_id
+            job_id = uuid4().hex
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (now - self.retention,))
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, params_hash, params, status, created, updated, pid, heartbeat) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, params_hash, json.dumps(params, default=str), QUEUED, now, now, os.getpid(), now))
+            self._futures[job_id] = self._executor.submit(self._run, job_id, func, params, extra or {})
+            self._start_heartbeat()
+        return job_id
+
+    def status(self, job_id):
+        """
+        A queued or running job whose thread or process has died is marked as
+        failed.
+
+        Returns
+        -------
+        dict or None
+            status, done, total, fraction, elapsed, rate (items per second), eta
+            (seconds), message and error of the job.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, done, total, message, error, started, updated, finished, pid, heartbeat FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, done, total, message, error, started, updated, finished, pid, heartbeat = row
+        if status in [QUEUED, RUNNING] and self._is_dead(job_id, pid, heartbeat if heartbeat is not None else updated):
+            status, error, finished = FAILED, "The job's worker stopped before it finished.", time.time()
+            with self._connect() as conn:
+                marked = conn.execute("UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status IN (?, ?)",
+                                      (status, error, finished, job_id, QUEUED, RUNNING)).rowcount
+            if marked == 0:
+                # It finished since it was read
+                return self.status(job_id)
+        end = finished if finished is not None else time.time()
+        elapsed = end - started if started is not None else 0.0
+        rate = done / elapsed if elapsed > 0 and done else 0.0
+        eta = (total - done) / rate if rate > 0 and total > done else (0.0 if status == DONE else None)
+        return {
+            "status": status,
+            "done": done,
+            "total": total,
+            "fraction": 1.0 if status == DONE else (done / total if total else 0.0),
+            "elapsed": elapsed,
+            "rate": rate,
+            "eta": eta,
+            "message": message,
+            "error": error,
+        }
+
+    def result(self, job_id):
+        """
+        Result of a finished job, from memory or unpickled from the job table.
+        None if there is none or it can't be restored, e.g. the data it refers to
+        was evicted from a cache.
+        """
+        if job_id in self._results:
+            return self._results[job_id]
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        try:
+            result = pickle.loads(row[0])
+        except Exception as e:
+            print(f"Could not restore the result of job {job_id}: {e}")
+            # Don't hand the job out again for the same submission
+            with self._connect() as conn:
+                conn.execute("UPDATE jobs SET result = NULL WHERE id = ?", (job_id,))
+            return None
+        self._remember(job_id, result)
+        return result
+
+    def prune(self):
+        """
+        Deletes the jobs that finished or failed more than retention seconds ago,
+        with their results.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - self.retention,))
+
+    def _run(self, job_id, func, params, extra):
+        now = time.time()
+        self._update(job_id, status=RUNNING, started=now, updated=now)
+        try:
+            result = func(JobProgress(self, job_id), **params, **extra)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status=FAILED, error=str(e), finished=time.time())
+            self._futures.pop(job_id, None)
+            return
+        self._remember(job_id, result)
+        try:
+            blob = pickle.dumps(result)
+        except Exception:
+            # Only this process can serve the result
+            blob = None
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, done = MAX(done, total), result = ?, updated = ?, finished = ? WHERE id = ?",
+                         (DONE, blob, now, now, job_id))
+        self._futures.pop(job_id, None)
+
+    def _remember(self, job_id, result):
+        with self._lock:
+            self._results[job_id] = result
+            self._results.move_to_end(job_id)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def _find_reusable(self, kind, params_hash):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, pid, COALESCE(heartbeat, updated), result IS NOT NULL FROM jobs "
+                "WHERE kind = ? AND params_hash = ? AND status IN (?, ?, ?) ORDER BY created DESC",
+                (kind, params_hash, QUEUED, RUNNING, DONE)).fetchall()
+        for job_id, status, pid, heartbeat, stored in rows:
+            if status == DONE:
+                # A result that couldn't be pickled is only held by the process that ran it
+                if stored or job_id in self._results:
+                    return job_id
+            elif not self._is_dead(job_id, pid, heartbeat):
+                return job_id
+        return None
+
+    def _is_dead(self, job_id, pid, heartbeat):
+        """
+        Whether a queued or running job will never finish: its future in this
+        process ended without recording a result, or its process stopped beating.
+        """
+        if pid == os.getpid():
+            future = self._futures.get(job_id)
+            # The future is dropped only after the job's final status is written
+            return future is None or future.done()
+        return heartbeat is None or time.time() - heartbeat > self.stale_after
+
+    def _start_heartbeat(self):
+        # Threads don't survive a fork, so every process starts its own
+        if self._heartbeat_pid == os.getpid():
+            return
+        self._heartbeat_pid = os.getpid()
+        Thread(target=self._beat, name="job-heartbeat", daemon=True).start()
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            job_ids = [job_id for job_id, future in list(self._futures.items()) if not future.done()]
+            if len(job_ids) == 0:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"UPDATE jobs SET heartbeat = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                                 (time.time(), *job_ids))
+            except sqlite3.Error as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def _update(self, job_id, **fields):
+        fields = {key: value for key, value in fields.items() if value is not None}
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3's own context manager commits but never closes
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+
+_job_queue = None
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,130 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# Points per series beyond which series are decimated, about the width of a plot in pixels
+MAX_POINTS = 1000
+# Points across all background series, each series gets an equal share down to MIN_POINTS
+MAX_TOTAL_POINTS = 100000
+MIN_POINTS = 100
+# Background series beyond which they are merged into one trace
+MERGE_THRESHOLD = 20
+# Total points beyond which traces are drawn with WebGL
+GL_THRESHOLD = 20000
+
+
+def scatter_class(n_points):
+    """
+    go.Scattergl for large figures, go.Scatter otherwise.
+    """
+    return go.Scattergl if n_points > GL_THRESHOLD else go.Scatter
+
+
+def lttb(y, n_out, x=None):
+    """
+    Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013) of every row of
+    y (M x T) at once. The first and last points are kept and from each of the
+    n_out - 2 buckets in between the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket. Peaks and troughs
+    survive, unlike plain striding.
+
+    Returns
+    -------
+    np.ndarray
+        (M x n_out) x values of the kept points.
+    np.ndarray
+        (M x n_out) y values of the kept points.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n_series, n_points = y.shape
+    x = np.arange(n_points, dtype=float) if x is None else np.asarray(x, dtype=float)
+    if n_points <= n_out or n_out < 3:
+        return np.broadcast_to(x, y.shape).copy(), y.copy()
+
+    rows = np.arange(n_series)
+    edges = np.linspace(1, n_points - 1, n_out - 1).astype(int)
+    kept = np.empty((n_series, n_out), dtype=int)
+    kept[:, 0] = 0
+    kept[:, -1] = n_points - 1
+    prev = np.zeros(n_series, dtype=int)
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b < n_out - 3:
+            next_x, next_y = x[hi:edges[b + 2]].mean(), y[:, hi:edges[b + 2]].mean(axis=1)
+        else:
+            next_x, next_y = x[-1], y[:, -1]
+        ax, ay = x[prev], y[rows, prev]
+        area = np.abs((ax - next_x)[:, None] * (y[:, lo:hi] - ay[:, None]) - (ax[:, None] - x[None, lo:hi]) * (next_y - ay)[:, None])
+        prev = lo + np.nan_to_num(area, nan=-1).argmax(axis=1)
+        kept[:, b + 1] = prev
+    return x[kept], np.take_along_axis(y, kept, axis=1)
+
+
+def minmax_decimate(y, n_out, x=None):
+    """
+    Keeps the minimum and maximum of every row of y (M x T) in n_out / 2 equal
+    buckets, in time order. Cheaper than LTTB and keeps the full visual envelope.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n_series, n_points = y.shape
+    x = np.arange(n_points, dtype=float) if x is None else np.asarray(x, dtype=float)
+    n_buckets = n_out // 2
+    if n_points <= n_out or n_buckets < 1:
+        return np.broadcast_to(x, y.shape).copy(), y.copy()
+
+    edges = np.linspace(0, n_points, n_buckets + 1).astype(int)
+    width = np.diff(edges).max()
+    # Pad the buckets to equal width, repeating each bucket's last point
+    idx = np.minimum(edges[:-1, None] + np.arange(width)[None, :], edges[1:, None] - 1)
+    buckets = y[:, idx]
+    bucket_ids = np.arange(n_buckets)[None, :]
+    lo = idx[bucket_ids, np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=2)]
+    hi = idx[bucket_ids, np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=2)]
+    kept = np.sort(np.stack([lo, hi], axis=2).reshape(n_series, -1), axis=1)
+    return x[kept], np.take_along_axis(y, kept, axis=1)
+
+
+def decimate(y, n_out=MAX_POINTS, x=None, method="lttb"):
+    if method == "lttb":
+        return lttb(y, n_out, x)
+    elif method == "minmax":
+        return minmax_decimate(y, n_out, x)
+    else:
+        raise Exception("Decimation method must be lttb or minmax.")
+
+
+def merge_series(x, y):
+    """
+    Concatenates the rows of x and y (M x n) into a single line broken by NaNs,
+    so M series cost one trace.
+    """
+    gap = np.full((y.shape[0], 1), np.nan)
+    return np.hstack([x, gap]).ravel()[:-1], np.hstack([y, gap]).ravel()[:-1]
+
+
+def add_background_series(fig, y, names=None, x=None, color='gray', width=0.5, max_points=MAX_POINTS, method="lttb"):
+    """
+    Adds the rows of y (M x T) to fig as thin background lines. Series are decimated
+    to max_points, or fewer once M series would exceed MAX_TOTAL_POINTS, more than
+    MERGE_THRESHOLD series are merged into one NaN-separated trace and large
+    figures are drawn with WebGL. Values are rounded to 4 decimals, which is
+    below what a plot can show, to keep the figure JSON small.
+
+    Returns
+    -------
+    go.Figure
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    if y.size == 0:
+        return fig
+    max_points = min(max_points, max(MAX_TOTAL_POINTS // len(y), MIN_POINTS))
+    xs, ys = decimate(y, max_points, x, method)
+    ys = np.round(ys, 4)
+    trace = scatter_class(ys.size)
+    line = dict(color=color, width=width)
+    if names is None or len(ys) > MERGE_THRESHOLD:
+        mx, my = merge_series(xs, ys)
+        fig.add_trace(trace(x=mx, y=my, mode='lines', line=line, name=f"{len(ys)} series", hoverinfo='skip', showlegend=False))
+    else:
+        for name, sx, sy in zip(names, xs, ys):
+            fig.add_trace(trace(x=sx, y=sy, mode='lines', line=line, name=name, showlegend=False))
+    return fig
@@ -0,0 +1,124 @@
+import os
+import time
+import pickle
+import sqlite3
+from threading import Lock
+from contextlib import contextmanager
+from collections import OrderedDict
+
+DEFAULT_SESSION_DB = os.environ.get("EQUITY_PAIR_SESSION_DB", os.path.join(".", ".cache", "sessions.sqlite"))
+
+
+class SessionStore:
+    def __init__(self, db_path=DEFAULT_SESSION_DB, ttl=7 * 24 * 3600, max_in_memory=256):
+        """
+        Per-browser-session state shared by every worker process, replacing module
+        globals such as the last clustering result. Each page load gets a session
+        id (the 'session-id' store in the app layout) and callbacks read and write
+        values under it.
+
+        Values are pickled to a SQLite table with a version number. Unpickled
+        values are kept in a small per-process LRU and reused while their
+        version is unchanged, so a read costs one indexed lookup. Large results
+        should be stored by reference, e.g. a job id, not by value.
+
+        Parameters
+        ----------
+        db_path : str
+            SQLite file, EQUITY_PAIR_SESSION_DB if set.
+        ttl : float
+            Seconds after its last write a session's values are purged.
+        max_in_memory : int
+            Unpickled values kept in this process.
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_in_memory = max_in_memory
+        self._values = OrderedDict()
+        self._lock = Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT,
+                    key TEXT,
+                    value BLOB,
+                    version INTEGER,
+                    updated REAL,
+                    PRIMARY KEY (session_id, key)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def get(self, session_id, key, default=None):
+        if session_id is None:
+            return default
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM sessions WHERE session_id = ? AND key = ?", (session_id, key)).fetchone()
+            if row is None:
+                return default
+            version = row[0]
+            with self._lock:
+                cached = self._values.get((session_id, key))
+                if cached is not None and cached[0] == version:
+                    self._values.move_to_end((session_id, key))
+                    return cached[1]
+            row = conn.execute("SELECT value, version FROM sessions WHERE session_id = ? AND key = ?", (session_id, key)).fetchone()
+        if row is None:
+            return default
+        value = pickle.loads(row[0])
+        self._remember(session_id, key, row[1], value)
+        return value
+
+    def set(self, session_id, key, value):
+        if session_id is None:
+            return
+        blob = pickle.dumps(value)
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO sessions (session_id, key, value, version, updated) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (session_id, key) DO UPDATE SET value = excluded.value, version = version + 1, updated = excluded.updated
+                """, (session_id, key, blob, time.time()))
+            version = conn.execute("SELECT version FROM sessions WHERE session_id = ? AND key = ?", (session_id, key)).fetchone()[0]
+        self._remember(session_id, key, version, value)
+
+    def delete(self, session_id, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ? AND key = ?", (session_id, key))
+        with self._lock:
+            self._values.pop((session_id, key), None)
+
+    def purge(self):
+        """
+        Drops the values of sessions not written to for ttl seconds.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+
+    def _remember(self, session_id, key, version, value):
+        with self._lock:
+            self._values[(session_id, key)] = (version, value)
+            self._values.move_to_end((session_id, key))
+            while len(self._values) > self.max_in_memory:
+                self._values.popitem(last=False)
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3's own context manager commits but never closes
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+_session_store = None
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
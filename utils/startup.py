@@ -0,0 +1,81 @@
+import sys
+import time
+import subprocess
+from importlib import import_module
+from threading import Thread
+
+# Imported on first use by analytics/ and finance/, warmed up in the background
+HEAVY_MODULES = [
+    "statsmodels.regression.linear_model",
+    "statsmodels.tsa.stattools",
+    "filterpy.kalman",
+    "scipy.cluster.hierarchy",
+    "scipy.sparse.csgraph",
+    "tslearn.barycenters",
+]
+
+
+def profile_imports(module="dashboard", top=25):
+    """
+    Imports module in a fresh interpreter with python -X importtime and ranks what
+    it pulled in by cumulative import time.
+
+    Returns
+    -------
+    list
+        (cumulative ms, self ms, module name) of the top slowest imports, the
+        first entry being module itself.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise Exception(f"Importing {module} failed: {process.stderr.strip().splitlines()[-1]}")
+    rows = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def print_import_profile(module="dashboard", top=25):
+    rows = profile_imports(module, top)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, self_time, name in rows:
+        print(f"{cumulative:14.1f} {self_time:9.1f}  {name}")
+
+
+def run_migrations(misc_connect):
+    """
+    One-off upgrades of data stored by earlier versions, run before the server
+    starts. Each step only touches the documents that still need it.
+    """
+    from finance.post_trade_analysis import summarise_stored_strategy, DEFAULT_RISK_FREE_RATE, DEFAULT_TARGET_RETURN
+    misc_connect.create_unique_uuid_indexes()
+    count = misc_connect.backfill_strategy_summaries(summarise_stored_strategy, DEFAULT_RISK_FREE_RATE, DEFAULT_TARGET_RETURN)
+    if count > 0:
+        print(f"Summarised {count} stored strategies.")
+    count = misc_connect.migrate_pair_results()
+    if count > 0:
+        print(f"Moved the scores of {count} pair runs to their own collection.")
+
+
+def warm_up(modules=HEAVY_MODULES):
+    """
+    Imports modules in a daemon thread, so the server accepts requests straight
+    away and the first clustering or hedge ratio fit doesn't pay for them.
+    """
+    def run():
+        start = time.time()
+        for module in modules:
+            try:
+                import_module(module)
+            except ImportError as e:
+                print(f"Warm-up could not import {module}: {e}")
+        print(f"Warm-up imports done in {time.time() - start:.1f}s")
+    thread = Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread